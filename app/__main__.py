@@ -0,0 +1,39 @@
+"""
+Runs the proxy with uvicorn: `python -m app`.
+
+With WORKERS != 1, uvicorn's supervisor starts that many worker processes
+sharing the listening socket and restarts any that die. Workers share
+rate limits, upstream key quotas, the disk cache and in-flight upstream
+calls through SHARED_STATE_DIR, and their Prometheus metrics are merged.
+"""
+
+import os
+import shutil
+
+import uvicorn
+
+from app.core.config import settings
+
+
+def main() -> None:
+    workers = settings.worker_count
+    if workers > 1:
+        # Must be set before any worker imports prometheus_client
+        metrics_dir = settings.shared_state_dir / "metrics"
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        metrics_dir.mkdir(parents=True)
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(metrics_dir)
+        # Every worker must resolve the same shared directory
+        os.environ["SHARED_STATE_DIR"] = str(settings.shared_state_dir)
+
+    uvicorn.run(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        log_level=settings.LOG_LEVEL.lower(),
+    )
+
+
+if __name__ == "__main__":
+    main()
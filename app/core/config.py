@@ -1,3 +1,9 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Literal
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -6,13 +12,175 @@ class Settings(BaseSettings):
     Application settings.
     """
 
-    API_KEYS: str
-    GEMINI_API_KEY: str
+    API_KEYS: str = ""
+    # Client keys whose upstream calls are scheduled behind interactive keys
+    BATCH_API_KEYS: str = ""
+    # Optional JSON file of client keys with per-key metadata; re-read when it
+    # changes, checked at most every API_KEYS_RELOAD_INTERVAL_SECONDS
+    API_KEYS_FILE: str | None = None
+    API_KEYS_RELOAD_INTERVAL_SECONDS: float = 5.0
+    # Default per-key limits, for keys that do not set their own (0 = unlimited)
+    RATE_LIMIT_RPM: int = 0
+    RATE_LIMIT_CHARACTERS_PER_MINUTE: int = 0
+    RATE_LIMIT_CHARACTERS_PER_DAY: int = 0
+    # Where rate limit counters live: per process, or in Redis (requires the
+    # "redis" extra) so that all replicas enforce one budget
+    RATE_LIMIT_BACKEND: Literal["memory", "redis"] = "memory"
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    GEMINI_API_KEY: str = ""
+    # Additional upstream keys, comma-separated; requests are balanced across
+    # all configured keys
+    GEMINI_API_KEYS: str = ""
+    # Override the Gemini API endpoint, e.g. to point at a local stand-in
+    GEMINI_BASE_URL: str | None = None
     LOG_LEVEL: str = "INFO"
 
+    # Server started by `python -m app`: WORKERS uvicorn processes (0 = one
+    # per available CPU)
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WORKERS: int = 1
+    # State shared by the worker processes: rate limit counters, upstream key
+    # quotas and cooldowns, the disk cache tier and de-duplication of upstream
+    # calls. Defaults to a temporary directory when more than one worker runs;
+    # a tmpfs such as /dev/shm keeps it in shared memory.
+    SHARED_STATE_DIR: str | None = None
+
+    # OpenTelemetry tracing (requires the "tracing" extra). The OTLP exporter
+    # reads its endpoint from the standard OTEL_EXPORTER_OTLP_* variables.
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: Literal["otlp", "console"] = "otlp"
+    TRACING_SERVICE_NAME: str = "gemini-to-openai-tts"
+
+    # Per-key upstream quota (0 = unlimited) and cooldowns after throttling
+    GEMINI_KEY_RPM: int = 0
+    GEMINI_KEY_COOLDOWN_SECONDS: float = 60.0
+    GEMINI_KEY_AUTH_COOLDOWN_SECONDS: float = 600.0
+    GEMINI_KEY_MAX_WAIT_SECONDS: float = 10.0
+
+    # Upstream resilience: overall deadline, retries with exponential backoff
+    # and jitter, optional hedged requests, and a circuit breaker
+    GEMINI_REQUEST_DEADLINE_SECONDS: float = 120.0
+    GEMINI_RETRY_MAX_ATTEMPTS: int = 3
+    GEMINI_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    GEMINI_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    GEMINI_RETRY_BUDGET_RATIO: float = 0.2
+    GEMINI_HEDGE_ENABLED: bool = False
+    GEMINI_HEDGE_DELAY_SECONDS: float = 0.0
+    GEMINI_HEDGE_MIN_SAMPLES: int = 20
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_BREAKER_RESET_SECONDS: float = 30.0
+
+    # Guardrails for /v1/audio/speech requests: an end-to-end deadline
+    # covering queueing, synthesis and transcoding (0 = none), and the
+    # maximum number of input characters per request or batch item
+    # (0 = unlimited). Work is cancelled when the deadline passes or the
+    # client disconnects.
+    REQUEST_DEADLINE_SECONDS: float = 300.0
+    MAX_INPUT_CHARACTERS: int = 16000
+
+    # Connection pool for the shared upstream HTTP client
+    GEMINI_HTTP_MAX_CONNECTIONS: int = 100
+    GEMINI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    GEMINI_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    GEMINI_HTTP2: bool = True
+
+    # Admission control for upstream calls (0 = unlimited concurrency)
+    UPSTREAM_MAX_CONCURRENCY: int = 16
+    UPSTREAM_MAX_QUEUE: int = 100
+    UPSTREAM_QUEUE_TIMEOUT_SECONDS: float = 30.0
+
+    # Dedicated transcoding pool, sized independently of upstream concurrency
+    TRANSCODE_MAX_WORKERS: int = 4
+    TRANSCODE_MAX_QUEUE: int = 64
+
+    # Encoder for compressed formats: "pydub" spawns ffmpeg per request,
+    # "ffmpeg_pool" keeps pre-spawned ffmpeg processes ready for each format
+    AUDIO_ENCODER_BACKEND: Literal["pydub", "ffmpeg_pool"] = "pydub"
+    ENCODER_POOL_WARM_PER_FORMAT: int = 2
+    ENCODER_POOL_MAX_CONCURRENCY: int = 4
+    ENCODER_POOL_ACQUIRE_TIMEOUT_SECONDS: float = 5.0
+    # Encoding profile used when neither the request nor its API key sets one
+    AUDIO_QUALITY: Literal["low", "standard", "high"] = "standard"
+
+    # Content-addressed audio cache
+    AUDIO_CACHE_ENABLED: bool = True
+    AUDIO_CACHE_MEMORY_MAX_BYTES: int = 64 * 1024 * 1024
+    AUDIO_CACHE_DISK_DIR: str | None = None
+    AUDIO_CACHE_DISK_MAX_BYTES: int = 1024 * 1024 * 1024
+    AUDIO_CACHE_MAX_AGE: int = 86400
+
+    # Long-input chunking: inputs longer than CHUNK_MAX_CHARS are split into
+    # segments synthesized concurrently and stitched back together
+    CHUNK_MAX_CHARS: int = 1000
+    CHUNK_MAX_PARALLEL: int = 4
+    CHUNK_CROSSFADE_MS: int = 0
+    CHUNK_TRIM_SILENCE: bool = False
+
+    # Batch jobs: results are written under BATCH_STORAGE_DIR (defaults to a
+    # directory in the system temp dir)
+    BATCH_STORAGE_DIR: str | None = None
+    BATCH_MAX_CONCURRENCY: int = 4
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_MAX_PENDING_ITEMS: int = 10000
+    BATCH_RETENTION_SECONDS: int = 86400
+
+    # Phrases synthesized in the background at startup and pinned in the audio
+    # cache (JSON file); the manifest is re-read and missing phrases are
+    # synthesized every WARMUP_REFRESH_SECONDS (0 = only at startup). /ready
+    # waits for a pass with at most WARMUP_MAX_FAILURES failed phrases; passes
+    # with failures are retried after WARMUP_RETRY_SECONDS
+    WARMUP_MANIFEST: str | None = None
+    WARMUP_REFRESH_SECONDS: float = 0.0
+    WARMUP_CONCURRENCY: int = 2
+    WARMUP_MAX_FAILURES: int = 0
+    WARMUP_RETRY_SECONDS: float = 60.0
+
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
     )
 
+    @property
+    def gemini_api_keys(self) -> list[str]:
+        """All configured upstream keys, de-duplicated, in configuration order."""
+        keys = f"{self.GEMINI_API_KEY},{self.GEMINI_API_KEYS}".split(",")
+        return list(dict.fromkeys(key.strip() for key in keys if key.strip()))
+
+    @property
+    def batch_api_keys(self) -> set[str]:
+        """Client keys scheduled with batch priority."""
+        return {key.strip() for key in self.BATCH_API_KEYS.split(",") if key.strip()}
+
+    @property
+    def worker_count(self) -> int:
+        """Number of worker processes `python -m app` runs."""
+        if self.WORKERS > 0:
+            return self.WORKERS
+        if hasattr(os, "sched_getaffinity"):
+            # CPUs this process may run on, which honours cpusets and taskset
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
+    @property
+    def shared_state_dir(self) -> Path | None:
+        """Where worker processes share state, or None with a single worker."""
+        if self.SHARED_STATE_DIR:
+            return Path(self.SHARED_STATE_DIR)
+        if self.worker_count > 1:
+            return Path(tempfile.gettempdir()) / f"gemini-tts-{self.PORT}"
+        return None
+
+    @model_validator(mode="after")
+    def _require_gemini_api_key(self) -> "Settings":
+        if not self.gemini_api_keys:
+            raise ValueError("GEMINI_API_KEY or GEMINI_API_KEYS must be set")
+        return self
+
+    @model_validator(mode="after")
+    def _require_client_api_keys(self) -> "Settings":
+        if not self.API_KEYS.strip() and not self.API_KEYS_FILE:
+            raise ValueError("API_KEYS or API_KEYS_FILE must be set")
+        return self
+
 
 settings = Settings()
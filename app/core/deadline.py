@@ -0,0 +1,159 @@
+import asyncio
+import contextlib
+import threading
+import time
+from collections.abc import Awaitable
+from contextvars import ContextVar
+from typing import TypeVar
+
+from fastapi import Request
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import ABANDONED_REQUESTS
+from app.utils.error_handlers import (
+    DeadlineExceededException,
+    RequestCancelledException,
+)
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# How often a request that is still being processed checks whether its
+# client is still connected
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# 当前请求的截止时间（time.monotonic() 时刻），None 表示不限制；由
+# run_request 设置，上游调用和转码据此限制各自的等待时间
+request_deadline: ContextVar[float | None] = ContextVar(
+    "request_deadline", default=None
+)
+
+# 当前转码任务的调用方是否已放弃等待，由 TranscodeExecutor 设置
+job_cancelled: ContextVar[threading.Event | None] = ContextVar(
+    "job_cancelled", default=None
+)
+
+
+def remaining() -> float | None:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def clamp(seconds: float) -> float:
+    """Returns `seconds`, shortened to what is left of the request's deadline."""
+    left = remaining()
+    if left is None:
+        return seconds
+    return max(0.0, min(seconds, left))
+
+
+def timeout_at(deadline: float | None) -> asyncio.Timeout:
+    """Returns an asyncio timeout expiring at a `time.monotonic()` deadline."""
+    if deadline is None:
+        return asyncio.timeout(None)
+    return asyncio.timeout(deadline - time.monotonic())
+
+
+def is_cancelled() -> bool:
+    """Whether the caller of the current transcode job has stopped waiting."""
+    cancelled = job_cancelled.get()
+    return cancelled is not None and cancelled.is_set()
+
+
+def deadline_exceeded(stage: str) -> DeadlineExceededException:
+    """Builds the 504 error for a request that ran out of time in `stage`."""
+    ABANDONED_REQUESTS.labels("deadline", stage).inc()
+    logger.warning(
+        "Request deadline exceeded",
+        extra={
+            "stage": stage,
+            "deadline_seconds": settings.REQUEST_DEADLINE_SECONDS,
+        },
+    )
+    return DeadlineExceededException(
+        status_code=504,
+        detail={
+            "type": "api_error",
+            "code": "deadline_exceeded",
+            "message": "The request did not complete within its "
+            f"{settings.REQUEST_DEADLINE_SECONDS:g}s deadline.",
+        },
+    )
+
+
+def abandoned() -> RequestCancelledException:
+    """
+    Builds the error raised by a transcode job whose caller stopped waiting.
+
+    The caller has already reported why (deadline or disconnect), so this
+    is neither logged nor counted.
+    """
+    # 499 (client closed request) is never seen by the client; it only
+    # shows up in logs
+    return RequestCancelledException(
+        status_code=499,
+        detail={
+            "type": "invalid_request_error",
+            "message": "The client closed the connection.",
+        },
+    )
+
+
+def request_cancelled(stage: str) -> RequestCancelledException:
+    """Builds the error for a request given up in `stage` because its client left."""
+    ABANDONED_REQUESTS.labels("disconnect", stage).inc()
+    logger.info("Client disconnected, cancelling request", extra={"stage": stage})
+    return abandoned()
+
+
+async def run_request(request: Request, work: Awaitable[T]) -> T:
+    """
+    Runs the work of an HTTP request until it completes, its deadline
+    (REQUEST_DEADLINE_SECONDS) passes or the client disconnects.
+
+    The deadline is published in `request_deadline` for everything `work`
+    calls, so upstream calls and transcodes can bound their own waits by
+    it. When the request is given up, `work` is cancelled and awaited,
+    which releases its upstream slot, API key and transcode worker before
+    the error is raised.
+
+    Raises:
+        DeadlineExceededException: If the deadline passes first (504).
+        RequestCancelledException: If the client disconnects first.
+    """
+    seconds = settings.REQUEST_DEADLINE_SECONDS
+    deadline = time.monotonic() + seconds if seconds > 0 else None
+    token = request_deadline.set(deadline)
+    try:
+        # The task runs in a copy of the current context, deadline included
+        task = asyncio.ensure_future(work)
+    finally:
+        request_deadline.reset(token)
+
+    try:
+        while True:
+            timeout = DISCONNECT_POLL_INTERVAL
+            if deadline is not None:
+                timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+            if deadline is not None and time.monotonic() >= deadline:
+                error = deadline_exceeded("request")
+                break
+            if await request.is_disconnected():
+                error = request_cancelled("request")
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+    raise error
@@ -0,0 +1,201 @@
+import os
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+# Stage latencies are mostly sub-second; upstream synthesis can take tens of
+# seconds for long inputs.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+REQUEST_DURATION = Histogram(
+    "tts_request_duration_seconds",
+    "Time spent handling /v1/audio/speech, up to the start of the response "
+    "body for streamed responses.",
+    ["response_format", "stream"],
+    buckets=LATENCY_BUCKETS,
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "tts_requests_in_flight",
+    "Number of /v1/audio/speech requests currently being handled.",
+    multiprocess_mode="livesum",
+)
+
+STAGE_DURATION = Histogram(
+    "tts_stage_duration_seconds",
+    "Time spent in each stage of the speech pipeline.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+ENCODE_DURATION = Histogram(
+    "tts_encode_duration_seconds",
+    "Time spent encoding PCM to the requested format.",
+    ["response_format"],
+    buckets=LATENCY_BUCKETS,
+)
+
+UPSTREAM_ERRORS = Counter(
+    "tts_upstream_errors_total",
+    "Failed Gemini API calls, by the error class returned to the client.",
+    ["error_class"],
+)
+
+INPUT_CHARACTERS = Histogram(
+    "tts_input_characters",
+    "Number of input characters per speech request.",
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+)
+
+OUTPUT_BYTES = Histogram(
+    "tts_output_bytes",
+    "Size of the audio returned per (non-streamed) speech request.",
+    ["response_format"],
+    buckets=(
+        16 * 1024,
+        64 * 1024,
+        256 * 1024,
+        1024 * 1024,
+        4 * 1024 * 1024,
+        16 * 1024 * 1024,
+        64 * 1024 * 1024,
+    ),
+)
+
+CLIENT_CHARACTERS = Counter(
+    "tts_client_input_characters_total",
+    "Input characters accepted per client API key name.",
+    ["client"],
+)
+
+RATE_LIMITED_REQUESTS = Counter(
+    "tts_rate_limited_requests_total",
+    "Requests rejected by per-key rate limits, by client and exceeded limit.",
+    ["client", "limit"],
+)
+
+ABANDONED_REQUESTS = Counter(
+    "tts_abandoned_requests_total",
+    "Requests whose work was cancelled before completion, by reason "
+    "(deadline or client disconnect) and by the stage that gave up.",
+    ["reason", "stage"],
+)
+
+TRANSCODE_IN_FLIGHT = Gauge(
+    "tts_transcode_jobs_in_flight",
+    "Number of transcode jobs running or waiting for a transcode worker.",
+    multiprocess_mode="livesum",
+)
+
+TRANSCODE_QUEUE_DEPTH = Gauge(
+    "tts_transcode_queue_depth",
+    "Number of transcode jobs waiting for a free transcode worker.",
+    multiprocess_mode="livesum",
+)
+
+TRANSCODE_JOBS = Counter(
+    "tts_transcode_jobs_total",
+    "Transcode jobs by outcome (completed, cancelled before starting, or "
+    "rejected because the queue was full).",
+    ["outcome"],
+)
+
+UPSTREAM_ACTIVE = Gauge(
+    "tts_upstream_active_calls",
+    "Number of Gemini API calls holding an upstream scheduler slot.",
+    multiprocess_mode="livesum",
+)
+
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    "tts_upstream_queue_depth",
+    "Number of Gemini API calls waiting for an upstream scheduler slot.",
+    multiprocess_mode="livesum",
+)
+
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "tts_upstream_queue_wait_seconds",
+    "Time calls admitted by the upstream scheduler waited for their slot.",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+
+UPSTREAM_ADMISSIONS = Counter(
+    "tts_upstream_admissions_total",
+    "Upstream scheduler decisions by priority and outcome (admitted, "
+    "rejected because the queue was full, or timed_out in the queue).",
+    ["priority", "outcome"],
+)
+
+UPSTREAM_KEY_REQUESTS = Counter(
+    "tts_upstream_key_requests_total",
+    "Gemini API calls made with each upstream API key.",
+    ["key_id"],
+)
+
+UPSTREAM_KEY_FAILURES = Counter(
+    "tts_upstream_key_failures_total",
+    "Failed Gemini API calls per upstream API key, by reason (throttled "
+    "and auth put the key into cooldown).",
+    ["key_id", "reason"],
+)
+
+UPSTREAM_KEY_IN_FLIGHT = Gauge(
+    "tts_upstream_key_in_flight",
+    "Number of Gemini API calls in progress with each upstream API key.",
+    ["key_id"],
+    multiprocess_mode="livesum",
+)
+
+UPSTREAM_KEY_COOLDOWN_UNTIL = Gauge(
+    "tts_upstream_key_cooldown_until_timestamp_seconds",
+    "Unix time at which each upstream API key leaves its latest cooldown; "
+    "the key is cooling down while this is greater than time().",
+    ["key_id"],
+    multiprocess_mode="max",
+)
+
+
+def render_metrics() -> bytes:
+    """
+    Renders every metric in the Prometheus text format.
+
+    With several worker processes (PROMETHEUS_MULTIPROC_DIR set by
+    `python -m app`), the values of all workers are merged, so a scrape
+    does not depend on which worker answers it.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead() -> None:
+    """Drops this worker's live gauges from the merged metrics on shutdown."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,8 +1,25 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Literal
+
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field, TypeAdapter, model_validator
 
-from app.core.config import settings
+from app.core.config import Settings, settings
 from app.core.logging import get_logger
+from app.core.tracing import span
+from app.models.schemas import (
+    VALID_QUALITIES,
+    VALID_RESPONSE_FORMATS,
+    AudioOutputOptions,
+)
+from app.utils.error_handlers import PermissionDeniedException
 
 
 # 初始化日志器
@@ -10,33 +27,263 @@ logger = get_logger(__name__)
 
 auth_scheme = HTTPBearer()
 
+# 上游调度优先级：交互式请求优先于批量请求
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+# 当前请求的调度优先级，由调用方使用的 API Key 决定
+request_priority: ContextVar[str] = ContextVar(
+    "request_priority", default=PRIORITY_INTERACTIVE
+)
+
 
-def verify_api_key(credentials: HTTPAuthorizationCredentials = Security(auth_scheme)):
+@dataclass(frozen=True)
+class ClientIdentity:
     """
-    Verify the API key provided in the Authorization header.
+    The caller behind a client API key, with the limits attached to that key.
+
+    Attributes:
+        name: Name used in logs and accounting; never the key itself.
+        priority: Upstream scheduling priority of the key's requests.
+        rate_limit_rpm: Requests per minute allowed for the key (0 = unlimited).
+        characters_per_minute: Input characters per minute (0 = unlimited).
+        characters_per_day: Input characters per day (0 = unlimited).
+        allowed_formats: Response formats the key may request (None = all).
+        quality: Encoding profile for requests that do not set one
+            (None = AUDIO_QUALITY).
     """
-    if not credentials or not credentials.credentials:
-        logger.warning("API request attempted without credentials")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key is missing",
-            headers={"WWW-Authenticate": "Bearer"},
+
+    name: str
+    priority: str = PRIORITY_INTERACTIVE
+    rate_limit_rpm: int = 0
+    characters_per_minute: int = 0
+    characters_per_day: int = 0
+    allowed_formats: frozenset[str] | None = None
+    quality: str | None = None
+
+    def check_format(self, response_format: str) -> None:
+        """
+        Raises:
+            PermissionDeniedException: If the key may not request the format (403).
+        """
+        if self.allowed_formats is None or response_format in self.allowed_formats:
+            return
+        raise PermissionDeniedException(
+            status_code=403,
+            detail={
+                "type": "invalid_request_error",
+                "message": f"This API key is not allowed to request "
+                f"response_format '{response_format}'.",
+                "param": "response_format",
+            },
         )
 
-    api_keys = [key.strip() for key in settings.API_KEYS.split(",")]
-    if credentials.credentials not in api_keys:
-        logger.warning(
-            "API request attempted with invalid key",
-            extra={
-                "key_prefix": credentials.credentials[:8] + "..."
-                if len(credentials.credentials) > 8
-                else "***"
+    def apply_defaults(self, request: AudioOutputOptions) -> None:
+        """Fills in the key's encoding profile if the request does not set one."""
+        if request.quality is None:
+            request.quality = self.quality
+
+
+class ApiKeyEntry(BaseModel):
+    """API_KEYS_FILE 中的一条密钥记录，key 与 key_sha256 二选一。"""
+
+    name: str = Field(min_length=1)
+    key: str | None = Field(default=None, min_length=1)
+    key_sha256: str | None = Field(default=None, pattern=r"^[0-9a-fA-F]{64}$")
+    priority: Literal["interactive", "batch"] = PRIORITY_INTERACTIVE
+    # 未设置的限额使用 RATE_LIMIT_* 默认值
+    rate_limit_rpm: int | None = Field(default=None, ge=0)
+    characters_per_minute: int | None = Field(default=None, ge=0)
+    characters_per_day: int | None = Field(default=None, ge=0)
+    allowed_formats: list[VALID_RESPONSE_FORMATS] | None = None
+    quality: VALID_QUALITIES | None = None
+
+    @model_validator(mode="after")
+    def _require_one_key(self) -> "ApiKeyEntry":
+        if (self.key is None) == (self.key_sha256 is None):
+            raise ValueError("exactly one of 'key' and 'key_sha256' must be set")
+        return self
+
+    @property
+    def digest(self) -> bytes:
+        if self.key is not None:
+            return _digest(self.key)
+        return bytes.fromhex(self.key_sha256)
+
+
+_ENTRIES = TypeAdapter(list[ApiKeyEntry])
+_LIMIT_FIELDS = ("rate_limit_rpm", "characters_per_minute", "characters_per_day")
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.sha256(key.encode()).digest()
+
+
+class ApiKeyRegistry:
+    """
+    Client API keys, indexed by their SHA-256 digest.
+
+    Keys are parsed once: from API_KEYS (named by digest fingerprint, with
+    batch priority for keys in BATCH_API_KEYS) and from the optional
+    API_KEYS_FILE, whose entries take precedence. The file is re-read when
+    its modification time or size changes; a file that fails to parse keeps
+    the previous keys in place. Limits a key does not set come from
+    `default_limits`.
+
+    Presented keys are hashed before the lookup, so comparisons run on
+    digests and their timing reveals nothing about how much of a guessed key
+    matches a real one.
+    """
+
+    def __init__(
+        self,
+        inline_keys: str,
+        batch_keys: set[str],
+        keys_file: str | None = None,
+        reload_interval: float = 5.0,
+        default_limits: dict[str, int] | None = None,
+    ):
+        self.keys_file = keys_file
+        self.reload_interval = reload_interval
+        self.default_limits = default_limits or {}
+        self._inline: dict[bytes, ClientIdentity] = {}
+        for key in dict.fromkeys(k.strip() for k in inline_keys.split(",")):
+            if not key:
+                continue
+            digest = _digest(key)
+            self._inline[digest] = ClientIdentity(
+                name=f"key-{digest.hex()[:8]}",
+                priority=PRIORITY_BATCH if key in batch_keys else PRIORITY_INTERACTIVE,
+                **self.default_limits,
+            )
+        self._keys = dict(self._inline)
+        self._file_signature: tuple[int, int] | None = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        if keys_file:
+            # 启动时文件无效直接报错，而不是以缺少密钥的状态运行
+            self._load_file(os.stat(keys_file))
+
+    @classmethod
+    def from_settings(cls, config: Settings) -> "ApiKeyRegistry":
+        return cls(
+            inline_keys=config.API_KEYS,
+            batch_keys=config.batch_api_keys,
+            keys_file=config.API_KEYS_FILE,
+            reload_interval=config.API_KEYS_RELOAD_INTERVAL_SECONDS,
+            default_limits={
+                "rate_limit_rpm": config.RATE_LIMIT_RPM,
+                "characters_per_minute": config.RATE_LIMIT_CHARACTERS_PER_MINUTE,
+                "characters_per_day": config.RATE_LIMIT_CHARACTERS_PER_DAY,
             },
         )
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
-            headers={"WWW-Authenticate": "Bearer"},
+
+    def lookup(self, key: str) -> ClientIdentity | None:
+        """Returns the identity for `key`, or None if the key is unknown."""
+        if self.keys_file:
+            self._maybe_reload()
+        return self._keys.get(_digest(key))
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.reload_interval
+            try:
+                stat = os.stat(self.keys_file)
+            except OSError as e:
+                logger.error(
+                    "Cannot read API_KEYS_FILE, keeping current keys",
+                    extra={"path": self.keys_file, "error": str(e)},
+                )
+                return
+            if (stat.st_mtime_ns, stat.st_size) == self._file_signature:
+                return
+            try:
+                self._load_file(stat)
+            except (OSError, ValueError) as e:
+                logger.error(
+                    "Invalid API_KEYS_FILE, keeping current keys",
+                    extra={"path": self.keys_file, "error": str(e)},
+                )
+        finally:
+            self._reload_lock.release()
+
+    def _load_file(self, stat: os.stat_result) -> None:
+        with open(self.keys_file, encoding="utf-8") as f:
+            entries = _ENTRIES.validate_python(json.load(f))
+        keys = dict(self._inline)
+        for entry in entries:
+            limits = {
+                field: value
+                for field in _LIMIT_FIELDS
+                if (value := getattr(entry, field)) is not None
+            }
+            keys[entry.digest] = ClientIdentity(
+                name=entry.name,
+                priority=entry.priority,
+                **{**self.default_limits, **limits},
+                allowed_formats=frozenset(entry.allowed_formats)
+                if entry.allowed_formats is not None
+                else None,
+                quality=entry.quality,
+            )
+        # 整体替换映射，并发的查找要么看到旧密钥集合，要么看到新集合
+        self._keys = keys
+        self._file_signature = (stat.st_mtime_ns, stat.st_size)
+        logger.info(
+            "Loaded client API keys",
+            extra={
+                "path": self.keys_file,
+                "file_keys": len(entries),
+                "keys": len(keys),
+            },
         )
 
-    logger.debug("API key verification successful")
+    def stats(self) -> dict:
+        return {"keys": len(self._keys), "keys_file": self.keys_file}
+
+
+api_key_registry = ApiKeyRegistry.from_settings(settings)
+
+
+async def verify_api_key(
+    credentials: HTTPAuthorizationCredentials = Security(auth_scheme),
+) -> ClientIdentity:
+    """
+    Verify the API key provided in the Authorization header.
+
+    Also sets the request's upstream scheduling priority from the key.
+
+    Returns:
+        The identity attached to the key.
+    """
+    with span("verify_api_key"):
+        if not credentials or not credentials.credentials:
+            logger.warning("API request attempted without credentials")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="API key is missing",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        client = api_key_registry.lookup(credentials.credentials)
+        if client is None:
+            logger.warning(
+                "API request attempted with invalid key",
+                extra={
+                    "key_prefix": credentials.credentials[:8] + "..."
+                    if len(credentials.credentials) > 8
+                    else "***"
+                },
+            )
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid API key",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        request_priority.set(client.priority)
+        logger.debug("API key verification successful", extra={"client": client.name})
+        return client
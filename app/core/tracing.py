@@ -0,0 +1,110 @@
+import contextlib
+from typing import Any
+
+from fastapi import FastAPI, Request
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+# Returned by `span()` while tracing is disabled, so instrumented code costs
+# one function call and no allocations.
+_NOOP_SPAN = contextlib.nullcontext()
+
+_tracer = None
+
+
+def span(name: str, **attributes: Any):
+    """
+    Starts a span as the current span, or does nothing if tracing is off.
+
+    Usage::
+
+        with span("audio.transcode", format=fmt) as current:
+            ...
+            if current is not None:
+                current.set_attribute("output_bytes", size)
+
+    Args:
+        name: Span name.
+        **attributes: Attributes set when the span starts.
+
+    Returns:
+        A context manager yielding the span, or None when tracing is off.
+    """
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def setup_tracing(app: FastAPI, exporter=None) -> None:
+    """
+    Enables OpenTelemetry tracing when TRACING_ENABLED is set.
+
+    Installs a tracer provider exporting to TRACING_EXPORTER (or to
+    `exporter`, e.g. an in-memory exporter in tests) and a middleware that
+    continues the W3C trace context from incoming requests.
+
+    Raises:
+        RuntimeError: If tracing is enabled but OpenTelemetry is not installed.
+    """
+    global _tracer
+
+    if not settings.TRACING_ENABLED and exporter is None:
+        return
+
+    try:
+        from opentelemetry import propagate, trace
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            ConsoleSpanExporter,
+            SimpleSpanProcessor,
+        )
+    except ImportError as e:
+        raise RuntimeError(
+            "TRACING_ENABLED requires OpenTelemetry: install with the 'tracing' extra"
+        ) from e
+
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: settings.TRACING_SERVICE_NAME})
+    )
+    if exporter is not None:
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+    elif settings.TRACING_EXPORTER == "console":
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    else:
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+
+    trace.set_tracer_provider(provider)
+    _tracer = provider.get_tracer("gemini-to-openai-tts")
+    server_kind = trace.SpanKind.SERVER
+
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        with _tracer.start_as_current_span(
+            f"{request.method} {request.url.path}",
+            context=propagate.extract(request.headers),
+            kind=server_kind,
+            attributes={
+                "http.request.method": request.method,
+                "url.path": request.url.path,
+            },
+        ) as current:
+            response = await call_next(request)
+            current.set_attribute("http.response.status_code", response.status_code)
+            return response
+
+    logger.info(
+        "OpenTelemetry tracing enabled",
+        extra={"exporter": "custom" if exporter else settings.TRACING_EXPORTER},
+    )
@@ -1,13 +1,33 @@
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
 from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from app.core.config import settings
+from app.core.deadline import run_request
 from app.core.logging import get_logger
-from app.core.security import verify_api_key
+from app.core.metrics import (
+    INPUT_CHARACTERS,
+    OUTPUT_BYTES,
+    REQUEST_DURATION,
+    REQUESTS_IN_FLIGHT,
+    mark_process_dead,
+    render_metrics,
+)
+from app.core.security import ClientIdentity, verify_api_key
+from app.core.tracing import setup_tracing
 from app.models.schemas import (
     AVAILABLE_MODELS,
     VOICE_LIST,
+    AudioOutputOptions,
+    BatchJobResponse,
+    BatchSpeechRequest,
+    DialogueRequest,
     ErrorDetail,
     ErrorResponse,
     ModelInfo,
@@ -15,34 +35,259 @@ from app.models.schemas import (
     SpeechRequest,
     VoicesResponse,
 )
+from app.services.audio_cache import (
+    AudioCache,
+    DiskLRUCache,
+    MemoryLRUCache,
+    output_variant,
+)
 from app.services.audio_processor import AudioProcessor
+from app.services.batch_service import BatchItem, BatchManager, Charge
+from app.services.encoder_pool import FfmpegEncoderPool
 from app.services.gemini_client import GeminiClient
-from app.utils.error_handlers import ServiceException
+from app.services.rate_limiter import RateLimiter, create_quota_store
+from app.services.shared_state import SharedState
+from app.services.speech_service import SpeechService
+from app.services.transcode_executor import TranscodeExecutor
+from app.services.warmup import WarmupManager
+from app.utils.error_handlers import InvalidRequestException, ServiceException
 
 
 # 初始化日志器
 logger = get_logger(__name__)
 
+CONTENT_TYPE_MAP = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/opus",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "pcm": "audio/l16; rate=24000; channels=1",
+}
+
+
+def media_type_for(request: AudioOutputOptions) -> str:
+    """Returns the Content-Type of the audio produced for a request."""
+    if request.response_format == "pcm" and request.sample_rate:
+        return f"audio/l16; rate={request.sample_rate}; channels=1"
+    return CONTENT_TYPE_MAP.get(request.response_format, "application/octet-stream")
+
+
+def check_input_length(length: int, param: str = "input") -> None:
+    """
+    Rejects inputs longer than MAX_INPUT_CHARACTERS, before they are charged
+    against the caller's rate limits.
+
+    Raises:
+        InvalidRequestException: If the input is too long (400).
+    """
+    limit = settings.MAX_INPUT_CHARACTERS
+    if limit <= 0 or length <= limit:
+        return
+    raise InvalidRequestException(
+        status_code=400,
+        detail={
+            "type": "invalid_request_error",
+            "code": "input_too_long",
+            "message": f"The input is {length} characters long; "
+            f"the maximum is {limit}.",
+            "param": param,
+        },
+    )
+
+
+def batch_charge(
+    client: ClientIdentity, response: Response, rate_limiter: RateLimiter
+) -> Charge:
+    """
+    Returns the charge of a batch submission or retry: one request, and the
+    input characters of every item queued. The x-ratelimit-* headers are
+    added to `response`.
+    """
+
+    async def charge(items: list[BatchItem]) -> None:
+        response.headers.update(
+            await rate_limiter.acquire(
+                client, sum(len(item.request.input) for item in items)
+            )
+        )
+
+    return charge
+
+
+def create_audio_cache(shared_dir: Path | None = None) -> AudioCache:
+    """
+    Builds the audio cache tiers enabled in the settings.
+
+    With several worker processes (`shared_dir` set), the disk tier is
+    shared by all of them and is always enabled, defaulting to a directory
+    under `shared_dir`.
+    """
+    tiers = []
+    if settings.AUDIO_CACHE_ENABLED:
+        tiers.append(MemoryLRUCache(max_bytes=settings.AUDIO_CACHE_MEMORY_MAX_BYTES))
+        disk_dir = settings.AUDIO_CACHE_DISK_DIR or (
+            shared_dir / "audio-cache" if shared_dir else None
+        )
+        if disk_dir:
+            tiers.append(
+                DiskLRUCache(
+                    directory=disk_dir,
+                    max_bytes=settings.AUDIO_CACHE_DISK_MAX_BYTES,
+                    shared=shared_dir is not None,
+                )
+            )
+    return AudioCache(tiers)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan handler: builds and tears down shared resources."""
+    logger.info(
+        "Gemini to OpenAI TTS Proxy starting up",
+        extra={
+            "version": "0.1.0",
+            "log_level": settings.LOG_LEVEL,
+            "shared_state_dir": str(settings.shared_state_dir),
+        },
+    )
+    shared_dir = settings.shared_state_dir
+    shared_state = SharedState(shared_dir) if shared_dir else None
+    gemini_client = GeminiClient(shared_state=shared_state)
+    if settings.AUDIO_ENCODER_BACKEND == "ffmpeg_pool":
+        AudioProcessor.encoder = FfmpegEncoderPool(
+            warm_per_format=settings.ENCODER_POOL_WARM_PER_FORMAT,
+            max_concurrency=settings.ENCODER_POOL_MAX_CONCURRENCY,
+            acquire_timeout=settings.ENCODER_POOL_ACQUIRE_TIMEOUT_SECONDS,
+            quality=settings.AUDIO_QUALITY,
+        )
+        AudioProcessor.encoder.start()
+    transcode_executor = TranscodeExecutor(
+        max_workers=settings.TRANSCODE_MAX_WORKERS,
+        max_queue=settings.TRANSCODE_MAX_QUEUE,
+    )
+    speech_service = SpeechService(
+        gemini_client=gemini_client,
+        transcode_executor=transcode_executor,
+        audio_cache=create_audio_cache(shared_dir),
+        shared_state=shared_state,
+    )
+    batch_manager = BatchManager(
+        speech_service=speech_service,
+        storage_dir=Path(
+            settings.BATCH_STORAGE_DIR
+            or Path(tempfile.gettempdir()) / "gemini-tts-batches"
+        ),
+        max_concurrency=settings.BATCH_MAX_CONCURRENCY,
+        max_items=settings.BATCH_MAX_ITEMS,
+        max_pending=settings.BATCH_MAX_PENDING_ITEMS,
+        retention_seconds=settings.BATCH_RETENTION_SECONDS,
+        shared_state=shared_state,
+    )
+    batch_manager.start()
+    rate_limiter = RateLimiter(create_quota_store(shared_state))
+    warmup = (
+        WarmupManager(
+            speech_service=speech_service,
+            manifest_path=Path(settings.WARMUP_MANIFEST),
+            refresh_seconds=settings.WARMUP_REFRESH_SECONDS,
+            concurrency=settings.WARMUP_CONCURRENCY,
+            max_failures=settings.WARMUP_MAX_FAILURES,
+            retry_seconds=settings.WARMUP_RETRY_SECONDS,
+        )
+        if settings.WARMUP_MANIFEST
+        else None
+    )
+    if warmup is not None:
+        warmup.start()
+    app.state.gemini_client = gemini_client
+    app.state.speech_service = speech_service
+    app.state.batch_manager = batch_manager
+    app.state.rate_limiter = rate_limiter
+    app.state.warmup = warmup
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            await warmup.aclose()
+        await batch_manager.aclose()
+        await rate_limiter.aclose()
+        await gemini_client.aclose()
+        transcode_executor.shutdown()
+        if AudioProcessor.encoder is not None:
+            AudioProcessor.encoder.close()
+            AudioProcessor.encoder = None
+        if shared_state is not None:
+            shared_state.close()
+        mark_process_dead()
+        logger.info("Gemini to OpenAI TTS Proxy shut down")
+
+
 app = FastAPI(
     title="Gemini to OpenAI TTS Proxy",
     description="A proxy service to convert OpenAI TTS API calls to Gemini TTS API",
     version="0.1.0",
+    lifespan=lifespan,
 )
+setup_tracing(app)
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Application startup event handler."""
-    logger.info(
-        "Gemini to OpenAI TTS Proxy starting up",
-        extra={"version": "0.1.0", "log_level": settings.LOG_LEVEL},
-    )
+def get_gemini_client(request: Request) -> GeminiClient:
+    """Returns the process-wide Gemini client created in the lifespan."""
+    return request.app.state.gemini_client
+
+
+def get_speech_service(request: Request) -> SpeechService:
+    """Returns the speech pipeline created in the lifespan."""
+    return request.app.state.speech_service
+
+
+def get_batch_manager(request: Request) -> BatchManager:
+    """Returns the batch job manager created in the lifespan."""
+    return request.app.state.batch_manager
+
+
+def get_rate_limiter(request: Request) -> RateLimiter:
+    """Returns the per-key rate limiter created in the lifespan."""
+    return request.app.state.rate_limiter
 
 
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint."""
-    return {"status": "healthy", "service": "gemini-to-openai-tts"}
+    warmup: WarmupManager | None = request.app.state.warmup
+    return {
+        "status": "healthy",
+        "service": "gemini-to-openai-tts",
+        **get_speech_service(request).stats(),
+        "batch": get_batch_manager(request).stats(),
+        "rate_limits": get_rate_limiter(request).stats(),
+        "warmup": warmup.stats() if warmup else None,
+    }
+
+
+@app.get("/ready")
+async def readiness_check(request: Request):
+    """
+    Readiness check endpoint: 503 until the warmup manifest, if any, has
+    been synthesized with at most WARMUP_MAX_FAILURES failed phrases, so
+    load balancers only route traffic afterwards.
+    """
+    warmup: WarmupManager | None = request.app.state.warmup
+    if warmup is None:
+        return {"status": "ready"}
+    if not warmup.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "warmup": warmup.stats()},
+        )
+    return {"status": "ready", "warmup": warmup.stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/v1/audio/models", response_model=ModelsResponse)
@@ -82,6 +327,7 @@ async def service_exception_handler(request: Request, exc: ServiceException):
     )
     return JSONResponse(
         status_code=exc.status_code,
+        headers=exc.headers,
         content=ErrorResponse(
             error=ErrorDetail(
                 message=exc.detail.get("message", "An error occurred"),
@@ -128,66 +374,185 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     responses={
         401: {"model": ErrorResponse, "description": "Unauthorized"},
         403: {"model": ErrorResponse, "description": "Forbidden"},
+        429: {"model": ErrorResponse, "description": "Rate Limit Exceeded"},
+        503: {"model": ErrorResponse, "description": "Service Busy"},
     },
-    dependencies=[Depends(verify_api_key)],
 )
-def text_to_speech(request: SpeechRequest):
+async def text_to_speech(
+    request: SpeechRequest,
+    http_request: Request,
+    client: ClientIdentity = Depends(verify_api_key),
+    speech_service: SpeechService = Depends(get_speech_service),
+    rate_limiter: RateLimiter = Depends(get_rate_limiter),
+):
     """
     Converts text to speech.
+
+    The request is cancelled, releasing its upstream slot and transcode
+    worker, once REQUEST_DEADLINE_SECONDS pass or the client disconnects.
     """
+    client.check_format(request.response_format)
+    check_input_length(len(request.input))
+    client.apply_defaults(request)
+    rate_limit_headers = await rate_limiter.acquire(client, len(request.input))
     logger.info(
         "TTS request received",
         extra={
+            "client": client.name,
             "model": request.model,
             "voice": request.voice,
             "response_format": request.response_format,
             "speed": request.speed,
+            "quality": request.quality,
             "input_length": len(request.input),
             "has_instructions": bool(request.instructions),
+            "stream_format": request.stream_format,
         },
     )
 
-    content_type_map = {
-        "mp3": "audio/mpeg",
-        "opus": "audio/opus",
-        "aac": "audio/aac",
-        "flac": "audio/flac",
-        "wav": "audio/wav",
-        "pcm": "audio/l16; rate=24000; channels=1",
-    }
+    media_type = media_type_for(request)
+    INPUT_CHARACTERS.observe(len(request.input))
+    REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
 
     try:
-        gemini_client = GeminiClient()
+        if request.stream_format == "audio":
+            audio_stream = await run_request(
+                http_request, speech_service.stream(request)
+            )
+            logger.info(
+                "TTS streaming response started",
+                extra={"response_format": request.response_format},
+            )
+            return StreamingResponse(
+                audio_stream, media_type=media_type, headers=rate_limit_headers
+            )
 
-        logger.debug("Generating audio via Gemini API")
-        raw_audio = gemini_client.generate_audio(request)
+        result = await run_request(http_request, speech_service.synthesize(request))
+        OUTPUT_BYTES.labels(request.response_format).observe(len(result.audio))
 
-        logger.debug("Transcoding audio to format: %s", request.response_format)
-        transcoded_audio = AudioProcessor.transcode_audio(
-            raw_audio, request.response_format
+        logger.info(
+            "TTS request completed successfully",
+            extra={
+                "response_format": request.response_format,
+                "output_size_bytes": len(result.audio),
+                "cache_hit": result.cache_hit,
+            },
         )
 
-        media_type = content_type_map.get(
-            request.response_format, "application/octet-stream"
+        return Response(
+            content=result.audio,
+            media_type=media_type,
+            headers={
+                "ETag": f'"{result.cache_key}.{output_variant(request)}"',
+                "Cache-Control": f"private, max-age={settings.AUDIO_CACHE_MAX_AGE}",
+                "X-Cache": "HIT" if result.cache_hit else "MISS",
+                **rate_limit_headers,
+            },
         )
 
+    except ServiceException:
+        # 已携带 OpenAI 风格错误信息的异常交给 service_exception_handler 处理
+        raise
+    except Exception as e:
+        logger.error(
+            "TTS request failed: %s",
+            str(e),
+            extra={
+                "model": request.model,
+                "voice": request.voice,
+                "response_format": request.response_format,
+            },
+            exc_info=True,
+        )
+        raise HTTPException(
+            status_code=500, detail="An internal server error occurred."
+        ) from e
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        REQUEST_DURATION.labels(
+            request.response_format, str(request.stream_format == "audio").lower()
+        ).observe(time.perf_counter() - started)
+
+
+@app.post(
+    "/v1/audio/speech/dialogue",
+    response_model=None,
+    responses={
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        403: {"model": ErrorResponse, "description": "Forbidden"},
+        429: {"model": ErrorResponse, "description": "Rate Limit Exceeded"},
+        503: {"model": ErrorResponse, "description": "Service Busy"},
+    },
+)
+async def dialogue_to_speech(
+    request: DialogueRequest,
+    http_request: Request,
+    client: ClientIdentity = Depends(verify_api_key),
+    speech_service: SpeechService = Depends(get_speech_service),
+    rate_limiter: RateLimiter = Depends(get_rate_limiter),
+):
+    """
+    Converts a dialogue between several voices to speech.
+
+    Up to two speakers are synthesized in one upstream call; larger casts
+    are split into groups of consecutive turns that are synthesized
+    concurrently and joined in order.
+    """
+    client.check_format(request.response_format)
+    check_input_length(request.input_length, "turns")
+    client.apply_defaults(request)
+    rate_limit_headers = await rate_limiter.acquire(client, request.input_length)
+    logger.info(
+        "Dialogue TTS request received",
+        extra={
+            "client": client.name,
+            "model": request.model,
+            "turn_count": len(request.turns),
+            "speaker_count": len({turn.speaker_name for turn in request.turns}),
+            "response_format": request.response_format,
+            "input_length": request.input_length,
+        },
+    )
+
+    INPUT_CHARACTERS.observe(request.input_length)
+    REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+
+    try:
+        result = await run_request(
+            http_request, speech_service.synthesize_dialogue(request)
+        )
+        OUTPUT_BYTES.labels(request.response_format).observe(len(result.audio))
+
         logger.info(
-            "TTS request completed successfully",
+            "Dialogue TTS request completed successfully",
             extra={
                 "response_format": request.response_format,
-                "output_size_bytes": len(transcoded_audio),
+                "output_size_bytes": len(result.audio),
+                "cache_hit": result.cache_hit,
             },
         )
 
-        return Response(content=transcoded_audio, media_type=media_type)
+        return Response(
+            content=result.audio,
+            media_type=media_type_for(request),
+            headers={
+                "ETag": f'"{result.cache_key}.{output_variant(request)}"',
+                "Cache-Control": f"private, max-age={settings.AUDIO_CACHE_MAX_AGE}",
+                "X-Cache": "HIT" if result.cache_hit else "MISS",
+                **rate_limit_headers,
+            },
+        )
 
+    except ServiceException:
+        raise
     except Exception as e:
         logger.error(
-            "TTS request failed: %s",
+            "Dialogue TTS request failed: %s",
             str(e),
             extra={
                 "model": request.model,
-                "voice": request.voice,
                 "response_format": request.response_format,
             },
             exc_info=True,
@@ -195,3 +560,136 @@ def text_to_speech(request: SpeechRequest):
         raise HTTPException(
             status_code=500, detail="An internal server error occurred."
         ) from e
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        REQUEST_DURATION.labels(request.response_format, "false").observe(
+            time.perf_counter() - started
+        )
+
+
+@app.post(
+    "/v1/audio/speech/batch",
+    response_model=BatchJobResponse,
+    status_code=202,
+    responses={
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        403: {"model": ErrorResponse, "description": "Forbidden"},
+        429: {"model": ErrorResponse, "description": "Rate Limit Exceeded"},
+        503: {"model": ErrorResponse, "description": "Service Busy"},
+    },
+)
+async def create_speech_batch(
+    request: BatchSpeechRequest,
+    response: Response,
+    client: ClientIdentity = Depends(verify_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager),
+    rate_limiter: RateLimiter = Depends(get_rate_limiter),
+):
+    """
+    Queues a batch of text-to-speech requests and returns the job status.
+
+    The whole batch is charged against the key's limits once it is accepted:
+    one request, and the input characters of every item.
+    """
+    for index, item in enumerate(request.items):
+        client.check_format(item.response_format)
+        check_input_length(len(item.input), f"items.{index}.input")
+        client.apply_defaults(item)
+
+    job = await batch_manager.submit(
+        request.items,
+        owner=client.name,
+        charge=batch_charge(client, response, rate_limiter),
+    )
+    return job.to_response()
+
+
+@app.get(
+    "/v1/audio/speech/batch/{job_id}",
+    response_model=BatchJobResponse,
+    responses={404: {"model": ErrorResponse, "description": "Not Found"}},
+)
+async def get_speech_batch(
+    job_id: str,
+    client: ClientIdentity = Depends(verify_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager),
+):
+    """
+    Returns the status of a batch job and each of its items.
+
+    Jobs are only visible to the client that submitted them.
+    """
+    return (await batch_manager.get(job_id, client.name)).to_response()
+
+
+@app.post(
+    "/v1/audio/speech/batch/{job_id}/retry",
+    response_model=BatchJobResponse,
+    responses={
+        404: {"model": ErrorResponse, "description": "Not Found"},
+        409: {"model": ErrorResponse, "description": "Job In Progress"},
+        429: {"model": ErrorResponse, "description": "Rate Limit Exceeded"},
+        503: {"model": ErrorResponse, "description": "Service Busy"},
+    },
+)
+async def retry_speech_batch(
+    job_id: str,
+    response: Response,
+    client: ClientIdentity = Depends(verify_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager),
+    rate_limiter: RateLimiter = Depends(get_rate_limiter),
+):
+    """
+    Re-queues the failed items of a batch job.
+
+    The retried items are charged against the key's limits like a new
+    submission, once they can be re-queued: one request, and the input
+    characters of every failed item.
+    """
+
+    job = await batch_manager.retry_failed(
+        job_id, client.name, charge=batch_charge(client, response, rate_limiter)
+    )
+    return job.to_response()
+
+
+@app.get(
+    "/v1/audio/speech/batch/{job_id}/items/{index}",
+    response_class=FileResponse,
+    responses={
+        404: {"model": ErrorResponse, "description": "Not Found"},
+        409: {"model": ErrorResponse, "description": "Item Not Ready"},
+    },
+)
+async def get_speech_batch_item(
+    job_id: str,
+    index: int,
+    client: ClientIdentity = Depends(verify_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager),
+):
+    """
+    Returns the audio of one completed batch item.
+    """
+    item, path = await batch_manager.item_path(job_id, index, client.name)
+    return FileResponse(
+        path,
+        media_type=media_type_for(item.request),
+        filename=item.filename,
+    )
+
+
+@app.get(
+    "/v1/audio/speech/batch/{job_id}/content",
+    response_class=FileResponse,
+    responses={404: {"model": ErrorResponse, "description": "Not Found"}},
+)
+async def get_speech_batch_content(
+    job_id: str,
+    client: ClientIdentity = Depends(verify_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager),
+):
+    """
+    Returns a zip archive with the audio of every completed batch item.
+    """
+    archive = await batch_manager.build_archive(job_id, client.name)
+    return FileResponse(archive, media_type="application/zip", filename=archive.name)
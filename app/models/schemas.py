@@ -1,6 +1,6 @@
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 # 根据 spec.md 文档附录 A，这是 Gemini 支持的有效语音名称。
@@ -71,7 +71,19 @@ VOICE_LIST = [
     "Sulafat",
 ]
 
-VALID_RESPONSE_FORMATS = Literal["mp3", "opus", "aac", "flac", "wav"]
+VALID_RESPONSE_FORMATS = Literal["mp3", "opus", "aac", "flac", "wav", "pcm"]
+
+# 可选的输出采样率（Hz），默认保持 Gemini 输出的 24kHz
+VALID_SAMPLE_RATES = Literal[8000, 16000, 22050, 24000, 44100, 48000]
+
+# 响度归一化的测量方式：近似 ITU-R BS.1770 的积分响度（LUFS）或 RMS 电平（dBFS）
+VALID_LOUDNESS_MEASURES = Literal["lufs", "rms"]
+
+# 压缩格式的编码档位：low 体积最小，high 音质最好；未指定时使用服务端默认值
+VALID_QUALITIES = Literal["low", "standard", "high"]
+
+# 流式输出模式：与 OpenAI 的 `stream_format` 参数保持一致，"audio" 表示直接流式返回音频
+VALID_STREAM_FORMATS = Literal["audio"]
 
 # 支持的模型列表
 AVAILABLE_MODELS = [
@@ -79,7 +91,26 @@ AVAILABLE_MODELS = [
 ]
 
 
-class SpeechRequest(BaseModel):
+class AudioOutputOptions(BaseModel):
+    """
+    输出音频的格式、后处理与编码选项，由单人语音和多人对话请求共用。
+    """
+
+    speed: float | None = Field(default=1.0, ge=0.25, le=4.0)
+    response_format: VALID_RESPONSE_FORMATS | None = "mp3"
+    # 以下为可选的 PCM 后处理，在编码前依次执行：裁剪首尾静音、变速、
+    # 响度归一化、重采样
+    trim_silence: bool = False
+    normalize_loudness: VALID_LOUDNESS_MEASURES | None = None
+    loudness_target: float = Field(default=-16.0, ge=-70.0, le=-1.0)
+    sample_rate: VALID_SAMPLE_RATES | None = None
+    # 编码档位与码率（kbps），仅作用于压缩格式；码率仅对 mp3、opus、aac 生效，
+    # 设置后覆盖档位
+    quality: VALID_QUALITIES | None = None
+    bitrate: int | None = Field(default=None, ge=8, le=256)
+
+
+class SpeechRequest(AudioOutputOptions):
     """
     用于验证 /v1/audio/speech 端点请求体的 Pydantic 模型。
     """
@@ -88,8 +119,50 @@ class SpeechRequest(BaseModel):
     input: str
     voice: VALID_VOICES
     instructions: str | None = None
-    speed: float | None = Field(default=1.0, ge=0.25, le=4.0)
-    response_format: VALID_RESPONSE_FORMATS | None = "mp3"
+    stream_format: VALID_STREAM_FORMATS | None = None
+
+
+class DialogueTurn(BaseModel):
+    """
+    对话中的一轮发言。
+    """
+
+    # 说话人名称会写入发给 Gemini 的对话脚本（"名称: 台词"），因此不能包含
+    # 冒号或换行；未指定时使用语音名称
+    speaker: str | None = Field(
+        default=None, min_length=1, max_length=64, pattern=r"^[^:\n]+$"
+    )
+    voice: VALID_VOICES
+    input: str = Field(min_length=1, pattern=r"\S")
+
+    @property
+    def speaker_name(self) -> str:
+        return self.speaker or self.voice
+
+
+class DialogueRequest(AudioOutputOptions):
+    """
+    用于验证 /v1/audio/speech/dialogue 端点请求体的 Pydantic 模型。
+    """
+
+    model: str
+    turns: list[DialogueTurn] = Field(min_length=1)
+    instructions: str | None = None
+
+    @model_validator(mode="after")
+    def _one_voice_per_speaker(self) -> "DialogueRequest":
+        voices: dict[str, str] = {}
+        for turn in self.turns:
+            if voices.setdefault(turn.speaker_name, turn.voice) != turn.voice:
+                raise ValueError(
+                    f"speaker '{turn.speaker_name}' is assigned more than one voice"
+                )
+        return self
+
+    @property
+    def input_length(self) -> int:
+        """台词的总字符数，用于限流计费。"""
+        return sum(len(turn.input) for turn in self.turns)
 
 
 class ErrorDetail(BaseModel):
@@ -134,3 +207,47 @@ class VoicesResponse(BaseModel):
     """
 
     voices: list[str]
+
+
+class BatchSpeechRequest(BaseModel):
+    """
+    /v1/audio/speech/batch 端点请求体的 Pydantic 模型。
+    """
+
+    items: list[SpeechRequest] = Field(min_length=1)
+
+
+class BatchItemStatus(BaseModel):
+    """
+    批量任务中单个条目状态的 Pydantic 模型。
+    """
+
+    index: int
+    status: Literal["queued", "in_progress", "completed", "failed"]
+    response_format: str
+    size_bytes: int | None = None
+    error: ErrorDetail | None = None
+
+
+class BatchRequestCounts(BaseModel):
+    """
+    批量任务条目计数的 Pydantic 模型。
+    """
+
+    total: int
+    completed: int
+    failed: int
+
+
+class BatchJobResponse(BaseModel):
+    """
+    批量任务状态响应的 Pydantic 模型。
+    """
+
+    id: str
+    object: Literal["speech.batch"] = "speech.batch"
+    status: Literal["in_progress", "completed"]
+    created_at: int
+    completed_at: int | None = None
+    request_counts: BatchRequestCounts
+    items: list[BatchItemStatus]
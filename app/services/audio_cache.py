@@ -0,0 +1,369 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Protocol
+
+from app.core.logging import get_logger
+from app.models.schemas import AudioOutputOptions, DialogueRequest, SpeechRequest
+from app.services.audio_processor import (
+    BITRATE_FORMATS,
+    DEFAULT_QUALITY,
+    IN_PROCESS_FORMATS,
+    SAMPLE_RATE,
+)
+from app.services.post_processing import output_quality
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+PCM_VARIANT = "pcm"
+TMP_SUFFIX = ".tmp"
+# How often a shared disk tier re-reads the directory to account for entries
+# written by other processes
+SHARED_RESCAN_INTERVAL = 60.0
+
+
+def speech_cache_key(request: SpeechRequest) -> str:
+    """
+    Returns a content address for the audio a SpeechRequest will produce.
+
+    Only the fields that influence synthesis are hashed; `response_format`
+    and `speed` are left out so a single upstream result can serve every
+    output format and speed. Text is hashed exactly as it is sent upstream:
+    inputs that differ only in surrounding whitespace may not synthesize
+    the same audio.
+
+    Args:
+        request: The speech request to hash.
+
+    Returns:
+        A hex-encoded SHA-256 digest.
+    """
+    normalized = {
+        "model": request.model,
+        "voice": request.voice,
+        "input": request.input,
+        "instructions": request.instructions or None,
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def dialogue_cache_key(request: DialogueRequest) -> str:
+    """
+    Returns a content address for the audio a DialogueRequest will produce.
+
+    Like `speech_cache_key`, only the fields that influence synthesis are
+    hashed. The payload has its own shape, so a dialogue never shares an
+    address with a single-voice request.
+    """
+    normalized = {
+        "model": request.model,
+        "turns": [
+            [turn.speaker_name, turn.voice, turn.input] for turn in request.turns
+        ],
+        "instructions": request.instructions or None,
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def output_variant(request: AudioOutputOptions) -> str:
+    """
+    Returns the cache variant holding the encoded output of a request.
+
+    Outputs are cached per format and per post-processing or encoding
+    option that differs from the default, e.g. "mp3" or
+    "mp3@1.5x,trim,lufs-16,16000hz,low".
+    """
+    options = []
+    speed = float(request.speed or 1.0)
+    if speed != 1.0:
+        options.append(f"{speed:g}x")
+    if request.trim_silence:
+        options.append("trim")
+    if request.normalize_loudness is not None:
+        options.append(f"{request.normalize_loudness}{request.loudness_target:g}")
+    if request.sample_rate and request.sample_rate != SAMPLE_RATE:
+        options.append(f"{request.sample_rate}hz")
+    target_format = request.response_format
+    if request.bitrate is not None and target_format in BITRATE_FORMATS:
+        options.append(f"{request.bitrate}k")
+    elif (
+        target_format not in IN_PROCESS_FORMATS
+        and output_quality(request) != DEFAULT_QUALITY
+    ):
+        options.append(output_quality(request))
+    if not options:
+        return request.response_format
+    return f"{request.response_format}@{','.join(options)}"
+
+
+class CacheBackend(Protocol):
+    """Interface implemented by every audio cache tier."""
+
+    name: str
+    # Blocking tiers (e.g. disk I/O) are called from a worker thread.
+    blocking: bool
+    # Shared tiers are visible to every worker process of the host.
+    shared: bool
+
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes) -> None: ...
+
+    def stats(self) -> dict[str, int]: ...
+
+
+class MemoryLRUCache:
+    """
+    In-memory LRU cache bounded by the total size of the stored values.
+    """
+
+    name = "memory"
+    blocking = False
+    shared = False
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class DiskLRUCache:
+    """
+    On-disk cache, one file per entry, evicting least recently used files
+    once the directory exceeds `max_bytes`.
+
+    With `shared=True` the directory is used by several worker processes:
+    entries written by another process are read even if this process has
+    not indexed them, and the index is rebuilt from the directory every
+    SHARED_RESCAN_INTERVAL seconds. Reads touch the file's mtime, so
+    recency is shared too and eviction stays close to a host-wide LRU.
+    """
+
+    name = "disk"
+    blocking = True
+
+    def __init__(self, directory: str, max_bytes: int, shared: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        self._scanned_at = 0.0
+
+        # Rebuild the index from what previous runs left behind.
+        with self._lock:
+            self._scan()
+            self._evict()
+
+    def _scan(self) -> None:
+        """Rebuilds the index from the directory, oldest first."""
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.endswith(TMP_SUFFIX):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        entries.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in entries)
+        self._size = sum(self._entries.values())
+        self._scanned_at = time.monotonic()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._path(key).unlink(missing_ok=True)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            indexed = key in self._entries
+            if indexed:
+                self._entries.move_to_end(key)
+            elif not self.shared:
+                return None
+        try:
+            value = self._path(key).read_bytes()
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self._lock:
+                size = self._entries.pop(key, 0)
+                self._size -= size
+            return None
+        if not indexed:
+            # Written by another worker process
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = len(value)
+                    self._size += len(value)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}{TMP_SUFFIX}")
+        tmp_path.write_bytes(value)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if (
+                self.shared
+                and time.monotonic() - self._scanned_at > SHARED_RESCAN_INTERVAL
+            ):
+                self._scan()
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(value)
+            self._size += len(value)
+            self._evict()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class AudioCache:
+    """
+    Tiered, content-addressed cache for synthesized speech.
+
+    Each speech request is stored as raw PCM (shared by every output format)
+    and as the encoded outputs that have been produced from it. Tiers are
+    consulted in order; a hit in a slower tier is promoted to the faster ones.
+
+    Pinned entries (see `pin`) are kept in memory outside of the tiers, are
+    never evicted, and are served even when the tiers are disabled.
+    """
+
+    def __init__(self, tiers: list[CacheBackend]):
+        self.tiers = tiers
+        self._pinned: dict[str, bytes] = {}
+        self._hits: dict[str, int] = {}
+        self._misses: dict[str, int] = {}
+
+    @property
+    def shared(self) -> bool:
+        """Whether entries are visible to every worker process of the host."""
+        return any(tier.shared for tier in self.tiers)
+
+    @staticmethod
+    def _entry_key(key: str, variant: str) -> str:
+        return f"{key}.{variant}"
+
+    @staticmethod
+    async def _call(tier: CacheBackend, method: str, *args):
+        func = getattr(tier, method)
+        if tier.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def get(self, key: str, variant: str = PCM_VARIANT) -> bytes | None:
+        """
+        Looks up a cached entry.
+
+        Args:
+            key: The request's content address (see `speech_cache_key`).
+            variant: `"pcm"` for raw audio, or an encoded output (see
+                `output_variant`).
+
+        Returns:
+            The cached bytes, or None on a miss.
+        """
+        entry_key = self._entry_key(key, variant)
+        # Count per format, so that speeds do not multiply the counters
+        counter = variant.partition("@")[0]
+        value = self._pinned.get(entry_key)
+        if value is not None:
+            self._hits[counter] = self._hits.get(counter, 0) + 1
+            return value
+        for index, tier in enumerate(self.tiers):
+            value = await self._call(tier, "get", entry_key)
+            if value is None:
+                continue
+            for faster_tier in self.tiers[:index]:
+                await self._call(faster_tier, "set", entry_key, value)
+            self._hits[counter] = self._hits.get(counter, 0) + 1
+            logger.debug(
+                "Audio cache hit",
+                extra={"variant": variant, "tier": tier.name, "key": key[:16]},
+            )
+            return value
+
+        self._misses[counter] = self._misses.get(counter, 0) + 1
+        return None
+
+    async def set(self, key: str, value: bytes, variant: str = PCM_VARIANT) -> None:
+        """Stores an entry in every tier."""
+        entry_key = self._entry_key(key, variant)
+        for tier in self.tiers:
+            try:
+                await self._call(tier, "set", entry_key, value)
+            except OSError as e:
+                logger.warning(
+                    "Failed to write audio cache entry",
+                    extra={"tier": tier.name, "error": str(e)},
+                )
+
+    def pin(self, key: str, value: bytes, variant: str = PCM_VARIANT) -> None:
+        """Keeps an entry in memory until it is unpinned."""
+        self._pinned[self._entry_key(key, variant)] = value
+
+    def unpin(self, key: str, variant: str = PCM_VARIANT) -> None:
+        self._pinned.pop(self._entry_key(key, variant), None)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and per-tier usage."""
+        return {
+            "hits": dict(self._hits),
+            "misses": dict(self._misses),
+            "pinned": {
+                "entries": len(self._pinned),
+                "size_bytes": sum(len(value) for value in self._pinned.values()),
+            },
+            "tiers": {tier.name: tier.stats() for tier in self.tiers},
+        }
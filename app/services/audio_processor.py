@@ -1,25 +1,309 @@
-import base64
-import io
+import binascii
+import struct
+import subprocess
+from typing import TYPE_CHECKING
 
+import numpy as np
 from pydub import AudioSegment
 
+from app.core import deadline
 from app.core.logging import get_logger
-from app.utils.error_handlers import AudioProcessingException
+from app.core.metrics import ENCODE_DURATION, STAGE_DURATION
+from app.core.tracing import span
+from app.utils.error_handlers import AudioProcessingException, ServiceException
+
+
+if TYPE_CHECKING:
+    from app.services.encoder_pool import FfmpegEncoderPool
 
 
 # 初始化日志器
 logger = get_logger(__name__)
 
+# According to Gemini API docs, the audio is 24kHz, 16-bit, mono PCM
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+# Formats produced in-process, without spawning ffmpeg
+IN_PROCESS_FORMATS = frozenset({"pcm", "wav"})
+
+# Data size used in streamed WAV headers, where the final length is unknown
+UNKNOWN_WAV_DATA_SIZE = 0xFFFFFFFF - 36
+
+# Silence detection used when trimming the joins of segmented audio: 10ms
+# chunks quieter than -50 dBFS, as pydub.silence.detect_leading_silence
+SILENCE_THRESHOLD_DBFS = -50.0
+SILENCE_CHUNK = SAMPLE_RATE // 100
+# Number of chunks analysed at once while looking for the end of silence
+SILENCE_SCAN_CHUNKS = 100
+
+# How often a blocking ffmpeg encode checks whether its caller gave up
+FFMPEG_POLL_INTERVAL = 0.1
+
+
+def ffmpeg_pcm_input_args(sample_rate: int = SAMPLE_RATE) -> list[str]:
+    """Returns ffmpeg arguments for reading raw 16-bit mono PCM from stdin."""
+    return [
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "s16le",
+        "-ar",
+        str(sample_rate),
+        "-ac",
+        str(CHANNELS),
+        "-i",
+        "pipe:0",
+    ]
+
+
+# ffmpeg arguments for reading Gemini's raw PCM (24kHz, 16-bit, mono)
+FFMPEG_PCM_INPUT_ARGS = ffmpeg_pcm_input_args()
+
+# ffmpeg output arguments for each compressed format. Every muxer here can
+# write to a non-seekable pipe.
+FFMPEG_OUTPUT_ARGS: dict[str, list[str]] = {
+    "mp3": ["-c:a", "libmp3lame", "-f", "mp3"],
+    "opus": ["-c:a", "libopus", "-application", "voip", "-f", "ogg"],
+    "aac": ["-c:a", "aac", "-f", "adts"],
+    "flac": ["-c:a", "flac", "-f", "flac"],
+}
+
+DEFAULT_QUALITY = "standard"
+
+# Encoder settings per format and quality, sized for 24kHz mono speech: LAME
+# VBR levels for mp3, speech bitrates for opus (in VoIP mode) and aac. Opus
+# encode time depends mostly on its complexity, so lower profiles also use a
+# cheaper one. flac is lossless at every level; its quality only trades
+# encode time for size, and level 5 is both the fastest and smallest on speech.
+ENCODING_PROFILES: dict[str, dict[str, list[str]]] = {
+    "mp3": {
+        "low": ["-q:a", "7"],
+        "standard": ["-q:a", "5"],
+        "high": ["-q:a", "2"],
+    },
+    "opus": {
+        "low": ["-b:a", "16k", "-compression_level", "0"],
+        "standard": ["-b:a", "24k", "-compression_level", "5"],
+        "high": ["-b:a", "32k", "-compression_level", "10"],
+    },
+    "aac": {
+        "low": ["-b:a", "32k"],
+        "standard": ["-b:a", "48k"],
+        "high": ["-b:a", "64k"],
+    },
+    "flac": {
+        "low": ["-compression_level", "0"],
+        "standard": ["-compression_level", "5"],
+        "high": ["-compression_level", "8"],
+    },
+}
+
+# Formats whose bitrate can be set explicitly, overriding the quality profile
+BITRATE_FORMATS = frozenset({"mp3", "opus", "aac"})
+
+
+def ffmpeg_output_args(
+    target_format: str, quality: str = DEFAULT_QUALITY, bitrate: int | None = None
+) -> list[str]:
+    """
+    Returns ffmpeg output arguments for encoding to a compressed format.
+
+    Args:
+        target_format: One of the FFMPEG_OUTPUT_ARGS formats.
+        quality: Encoding profile, one of "low", "standard" and "high".
+        bitrate: Bitrate in kbps; replaces the profile for BITRATE_FORMATS
+            and is ignored otherwise.
+    """
+    if bitrate is not None and target_format in BITRATE_FORMATS:
+        settings = ["-b:a", f"{bitrate}k"]
+    else:
+        settings = ENCODING_PROFILES[target_format][quality]
+    return [*FFMPEG_OUTPUT_ARGS[target_format], *settings]
+
+
+def communicate(process: subprocess.Popen, data: bytes) -> tuple[bytes, bytes]:
+    """
+    Writes `data` to an ffmpeg process's stdin and returns its stdout and
+    stderr once it exits.
+
+    While waiting, gives up as soon as the request's deadline passes or the
+    transcode job is cancelled (see `TranscodeExecutor.run`). The process is
+    killed whenever it has not exited on return.
+
+    Raises:
+        DeadlineExceededException: If the request's deadline passes (504).
+        RequestCancelledException: If the caller stopped waiting.
+    """
+    pending: bytes | None = data
+    try:
+        while True:
+            try:
+                return process.communicate(
+                    pending, timeout=deadline.clamp(FFMPEG_POLL_INTERVAL)
+                )
+            except subprocess.TimeoutExpired:
+                # Input is only accepted by the first call
+                pending = None
+                if deadline.is_cancelled():
+                    raise deadline.abandoned() from None
+                left = deadline.remaining()
+                if left is not None and left <= 0:
+                    raise deadline.deadline_exceeded("transcode") from None
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
 
 class AudioProcessor:
+    # Encoder used for compressed formats; one ffmpeg process per call when unset
+    encoder: "FfmpegEncoderPool | None" = None
+
     @staticmethod
-    def transcode_audio(raw_audio_data: str, target_format: str) -> bytes:
+    def decode_pcm(raw_audio_data: str | bytes) -> bytes:
+        """
+        Returns the raw PCM bytes for audio data returned by the Gemini API.
+
+        Args:
+            raw_audio_data: Base64 encoded string, or already decoded bytes.
+
+        Returns:
+            The decoded PCM audio data. Already decoded bytes are returned
+            as is, without a copy.
+        """
+        if isinstance(raw_audio_data, str):
+            # a2b_base64 reads an ASCII str in place, where b64decode would
+            # first encode it to a temporary bytes object
+            with STAGE_DURATION.labels("base64_decode").time():
+                return binascii.a2b_base64(raw_audio_data)
+        return raw_audio_data
+
+    @staticmethod
+    def wav_header(data_size: int, sample_rate: int = SAMPLE_RATE) -> bytes:
+        """
+        Builds the 44-byte RIFF/WAVE header for `data_size` bytes of PCM.
+
+        Args:
+            data_size: Size of the PCM payload in bytes.
+            sample_rate: Sample rate of the PCM.
+
+        Returns:
+            The canonical PCM WAV header.
+        """
+        byte_rate = sample_rate * SAMPLE_WIDTH * CHANNELS
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF",
+            36 + data_size,
+            b"WAVE",
+            b"fmt ",
+            16,  # fmt chunk size
+            1,  # PCM
+            CHANNELS,
+            sample_rate,
+            byte_rate,
+            SAMPLE_WIDTH * CHANNELS,  # block align
+            SAMPLE_WIDTH * 8,  # bits per sample
+            b"data",
+            data_size,
+        )
+
+    @staticmethod
+    def concatenate_pcm(
+        segments: list[bytes], crossfade_ms: int = 0, trim_silence: bool = False
+    ) -> bytes:
+        """
+        Stitches PCM segments (24kHz, 16-bit, mono) together in order.
+
+        Segments are read through zero-copy NumPy views; only the crossfaded
+        joins are computed separately, and everything is written once into
+        the output.
+
+        Args:
+            segments: Decoded PCM segments in playback order.
+            crossfade_ms: Length of the linear crossfade applied at each join.
+            trim_silence: Whether to trim silence on both sides of each join.
+
+        Returns:
+            The concatenated PCM audio data.
+        """
+        if not crossfade_ms and not trim_silence:
+            return b"".join(segments)
+
+        views = [np.frombuffer(segment, dtype="<i2") for segment in segments]
+        if trim_silence:
+            last = len(views) - 1
+            for index, view in enumerate(views):
+                if index > 0:
+                    view = view[AudioProcessor.leading_silence(view) :]
+                if index < last:
+                    trailing = AudioProcessor.leading_silence(view[::-1])
+                    view = view[: len(view) - trailing]
+                views[index] = view
+
+        crossfade = crossfade_ms * SAMPLE_RATE // 1000
+        pieces = []
+        pending = views[0]
+        for view in views[1:]:
+            fade = min(crossfade, len(pending), len(view))
+            if fade:
+                ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+                mixed = pending[-fade:] * (1.0 - ramp) + view[:fade] * ramp
+                pieces.append(pending[:-fade])
+                pieces.append(np.rint(mixed).astype("<i2"))
+            else:
+                pieces.append(pending)
+            pending = view[fade:]
+        pieces.append(pending)
+        return b"".join(pieces)
+
+    @staticmethod
+    def leading_silence(samples: np.ndarray) -> int:
+        """
+        Returns the number of leading samples that are silent, in whole
+        SILENCE_CHUNK steps.
+        """
+        # Compare mean squares against the squared threshold amplitude
+        threshold = (32768 * 10 ** (SILENCE_THRESHOLD_DBFS / 20)) ** 2
+        block_size = SILENCE_CHUNK * SILENCE_SCAN_CHUNKS
+        for start in range(0, len(samples), block_size):
+            block = samples[start : start + block_size].astype(np.float64)
+            offsets = np.arange(0, len(block), SILENCE_CHUNK)
+            sizes = np.minimum(SILENCE_CHUNK, len(block) - offsets)
+            mean_squares = np.add.reduceat(block * block, offsets) / sizes
+            loud = np.flatnonzero(mean_squares >= threshold)
+            if len(loud):
+                return start + int(offsets[loud[0]])
+        return len(samples)
+
+    @staticmethod
+    def encoder_stats() -> dict:
+        """Returns statistics for the encoder backend in use."""
+        if AudioProcessor.encoder is None:
+            return {"backend": "pydub"}
+        return AudioProcessor.encoder.stats()
+
+    @staticmethod
+    def transcode_audio(
+        raw_audio_data: str | bytes,
+        target_format: str,
+        sample_rate: int = SAMPLE_RATE,
+        quality: str = DEFAULT_QUALITY,
+        bitrate: int | None = None,
+    ) -> bytes:
         """
         Transcodes raw PCM audio data to the specified target format.
 
         Args:
-            raw_audio_data: The raw PCM audio data from Gemini API (base64 encoded).
+            raw_audio_data: The raw PCM audio data from Gemini API (base64 encoded
+                string or decoded bytes).
             target_format: The target audio format (e.g., 'mp3', 'wav').
+            sample_rate: Sample rate of the PCM, if it was resampled.
+            quality: Encoding profile for compressed formats.
+            bitrate: Bitrate in kbps for lossy formats, overriding `quality`.
 
         Returns:
             The transcoded audio data as bytes.
@@ -31,37 +315,39 @@ class AudioProcessor:
             "Starting audio transcoding",
             extra={
                 "target_format": target_format,
-                "input_data_length": len(raw_audio_data)
-                if isinstance(raw_audio_data, str)
-                else len(raw_audio_data),
+                "input_data_length": len(raw_audio_data),
             },
         )
 
         try:
             # Decode base64 audio data from Gemini API
-            if isinstance(raw_audio_data, str):
-                # If it's a string, decode from base64
-                decoded_audio = base64.b64decode(raw_audio_data)
-            else:
-                # If it's already bytes, assume it's already decoded
-                decoded_audio = raw_audio_data
-
-            # Load raw PCM data with specified parameters
-            # According to Gemini API docs, the audio is 24kHz, 16-bit, mono PCM
-            audio_segment = AudioSegment.from_raw(
-                io.BytesIO(decoded_audio),
-                sample_width=2,  # 16-bit
-                frame_rate=24000,  # 24kHz
-                channels=1,  # Mono
-            )
-
-            # Export to the target format in-memory
-            buffer = io.BytesIO()
-            audio_segment.export(buffer, format=target_format)
+            decoded_audio = AudioProcessor.decode_pcm(raw_audio_data)
 
-            # Get the bytes value from the buffer
-            buffer.seek(0)
-            transcoded_data = buffer.read()
+            # PCM and WAV are produced in-process: the PCM is returned as-is,
+            # or prefixed with a RIFF header (a single copy into the output)
+            with (
+                span(
+                    "audio.transcode",
+                    format=target_format,
+                    input_bytes=len(decoded_audio),
+                ) as current,
+                ENCODE_DURATION.labels(target_format).time(),
+            ):
+                if target_format == "pcm":
+                    transcoded_data = decoded_audio
+                elif target_format == "wav":
+                    transcoded_data = b"".join(
+                        (
+                            AudioProcessor.wav_header(len(decoded_audio), sample_rate),
+                            memoryview(decoded_audio),
+                        )
+                    )
+                else:
+                    transcoded_data = AudioProcessor._export(
+                        decoded_audio, target_format, sample_rate, quality, bitrate
+                    )
+                if current is not None:
+                    current.set_attribute("output_bytes", len(transcoded_data))
 
             logger.debug(
                 "Audio transcoding completed successfully",
@@ -72,6 +358,8 @@ class AudioProcessor:
             )
 
             return transcoded_data
+        except ServiceException:
+            raise
         except Exception as e:
             logger.error(
                 "Audio transcoding failed",
@@ -89,3 +377,48 @@ class AudioProcessor:
                     "message": f"Internal server error during audio processing: {str(e)}",
                 },
             ) from e
+
+    @staticmethod
+    def _export(
+        decoded_audio: bytes,
+        target_format: str,
+        sample_rate: int = SAMPLE_RATE,
+        quality: str = DEFAULT_QUALITY,
+        bitrate: int | None = None,
+    ) -> bytes:
+        """
+        Encodes PCM audio to a compressed format, through the configured
+        encoder pool if there is one, otherwise through a one-off ffmpeg
+        process. The PCM is piped straight into ffmpeg, without a pydub
+        AudioSegment or temporary files.
+
+        The pool's processes are started for 24kHz input, so resampled PCM
+        always goes through a one-off process. Either way, ffmpeg is killed
+        if the request's deadline passes or its caller gives up.
+        """
+        encoder = AudioProcessor.encoder
+        if (
+            encoder is not None
+            and sample_rate == SAMPLE_RATE
+            and encoder.supports(target_format)
+        ):
+            return encoder.encode(decoded_audio, target_format, quality, bitrate)
+
+        process = subprocess.Popen(
+            [
+                AudioSegment.converter,
+                *ffmpeg_pcm_input_args(sample_rate),
+                *ffmpeg_output_args(target_format, quality, bitrate),
+                "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        stdout, stderr = communicate(process, decoded_audio)
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg exited with code {process.returncode}: "
+                f"{stderr.decode(errors='replace').strip()}"
+            )
+        return stdout
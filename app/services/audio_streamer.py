@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator
+
+from pydub import AudioSegment
+
+from app.core.logging import get_logger
+from app.services.audio_processor import (
+    DEFAULT_QUALITY,
+    SAMPLE_RATE,
+    UNKNOWN_WAV_DATA_SIZE,
+    AudioProcessor,
+    ffmpeg_output_args,
+    ffmpeg_pcm_input_args,
+)
+from app.utils.error_handlers import AudioProcessingException
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+READ_CHUNK_SIZE = 4096
+
+
+class StreamingEncoder:
+    """
+    Encodes a stream of raw PCM chunks into the target format on the fly.
+
+    A single ffmpeg process is kept running for the whole response: PCM is
+    written to its stdin as it arrives from upstream and encoded frames are
+    read from its stdout as soon as ffmpeg emits them.
+    """
+
+    def __init__(
+        self,
+        target_format: str,
+        sample_rate: int = SAMPLE_RATE,
+        quality: str = DEFAULT_QUALITY,
+        bitrate: int | None = None,
+    ):
+        """
+        Args:
+            target_format: The target audio format (e.g., 'mp3', 'pcm').
+            sample_rate: Sample rate of the incoming PCM.
+            quality: Encoding profile for compressed formats.
+            bitrate: Bitrate in kbps for lossy formats, overriding `quality`.
+        """
+        self.target_format = target_format
+        self.sample_rate = sample_rate
+        self.quality = quality
+        self.bitrate = bitrate
+
+    async def encode(self, pcm_chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Encodes PCM chunks (16-bit, mono, at `sample_rate`) incrementally.
+
+        Args:
+            pcm_chunks: Async iterator of raw PCM chunks.
+
+        Yields:
+            Encoded audio bytes, in order.
+
+        Raises:
+            AudioProcessingException: If the encoder process fails.
+        """
+        if self.target_format in ("pcm", "wav"):
+            if self.target_format == "wav":
+                # The total length is unknown up front; players treat the
+                # maximum size as "read until end of stream".
+                yield AudioProcessor.wav_header(UNKNOWN_WAV_DATA_SIZE, self.sample_rate)
+            async for chunk in pcm_chunks:
+                yield chunk
+            return
+
+        process = await asyncio.create_subprocess_exec(
+            AudioSegment.converter,
+            *ffmpeg_pcm_input_args(self.sample_rate),
+            *ffmpeg_output_args(self.target_format, self.quality, self.bitrate),
+            "-flush_packets",
+            "1",
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        logger.debug(
+            "Started streaming encoder",
+            extra={"target_format": self.target_format, "pid": process.pid},
+        )
+
+        async def feed() -> None:
+            try:
+                async for chunk in pcm_chunks:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            finally:
+                with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+                    process.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        output_size = 0
+        try:
+            while chunk := await process.stdout.read(READ_CHUNK_SIZE):
+                output_size += len(chunk)
+                yield chunk
+
+            # Surface upstream errors raised while feeding the encoder.
+            await feeder
+            stderr = await process.stderr.read()
+            return_code = await process.wait()
+            if return_code != 0:
+                raise AudioProcessingException(
+                    status_code=500,
+                    detail={
+                        "type": "api_error",
+                        "message": "Internal server error during audio processing: "
+                        f"{stderr.decode(errors='replace').strip()}",
+                    },
+                )
+
+            logger.debug(
+                "Streaming encoder finished",
+                extra={
+                    "target_format": self.target_format,
+                    "output_size_bytes": output_size,
+                },
+            )
+        finally:
+            if not feeder.done():
+                feeder.cancel()
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await feeder
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
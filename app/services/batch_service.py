@@ -0,0 +1,640 @@
+import asyncio
+import contextlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+import zipfile
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.core.logging import get_logger
+from app.core.security import PRIORITY_BATCH, request_priority
+from app.models.schemas import (
+    BatchItemStatus,
+    BatchJobResponse,
+    BatchRequestCounts,
+    ErrorDetail,
+    SpeechRequest,
+)
+from app.services.shared_state import SharedState
+from app.services.speech_service import SpeechService
+from app.utils.error_handlers import (
+    CapacityExceededException,
+    ConflictException,
+    NotFoundException,
+    ServiceException,
+)
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+FAILED = "failed"
+
+JOB_ID_PATTERN = re.compile(r"^batch_[0-9a-f]{32}$")
+SNAPSHOT_FILENAME = "job.json"
+# Minimum time between snapshots of a job while its items are processed
+SNAPSHOT_INTERVAL = 1.0
+# How long a retry waits for another worker process retrying the same job
+TAKEOVER_LOCK_TIMEOUT = 5.0
+# Seconds between two scans for expired jobs
+PURGE_INTERVAL = 60.0
+
+# Called with the items of a job once it is accepted, before they are queued;
+# raising rejects the job (e.g. when the client is over its rate limits)
+Charge = Callable[[list["BatchItem"]], Awaitable[None]]
+
+
+@dataclass
+class BatchItem:
+    """One speech request of a batch job."""
+
+    index: int
+    request: SpeechRequest
+    status: str = QUEUED
+    size_bytes: int | None = None
+    error: dict | None = None
+
+    @property
+    def filename(self) -> str:
+        return f"{self.index:05d}.{self.request.response_format}"
+
+
+@dataclass
+class BatchJob:
+    """A batch of speech requests whose results are written to disk."""
+
+    id: str
+    directory: Path
+    items: list[BatchItem]
+    # Name of the client (see ClientIdentity) that submitted the job
+    owner: str | None = None
+    # Id of the BatchManager (worker process) running the job
+    worker: str | None = None
+    created_at: float = field(default_factory=time.time)
+    completed_at: float | None = None
+    saved_at: float = 0.0
+    save_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def count(self, status: str) -> int:
+        return sum(1 for item in self.items if item.status == status)
+
+    @property
+    def finished(self) -> bool:
+        return all(item.status in (COMPLETED, FAILED) for item in self.items)
+
+    def to_snapshot(self) -> dict:
+        return {
+            "id": self.id,
+            "owner": self.owner,
+            "worker": self.worker,
+            "created_at": self.created_at,
+            "completed_at": self.completed_at,
+            "items": [
+                {
+                    "index": item.index,
+                    "request": item.request.model_dump(),
+                    "status": item.status,
+                    "size_bytes": item.size_bytes,
+                    "error": item.error,
+                }
+                for item in self.items
+            ],
+        }
+
+    @classmethod
+    def from_snapshot(cls, directory: Path, snapshot: dict) -> "BatchJob":
+        return cls(
+            id=snapshot["id"],
+            directory=directory,
+            owner=snapshot.get("owner"),
+            worker=snapshot.get("worker"),
+            created_at=snapshot["created_at"],
+            completed_at=snapshot["completed_at"],
+            items=[
+                BatchItem(
+                    index=item["index"],
+                    request=SpeechRequest.model_validate(item["request"]),
+                    status=item["status"],
+                    size_bytes=item["size_bytes"],
+                    error=item["error"],
+                )
+                for item in snapshot["items"]
+            ],
+        )
+
+    def to_response(self) -> BatchJobResponse:
+        return BatchJobResponse(
+            id=self.id,
+            status=COMPLETED if self.finished else IN_PROGRESS,
+            created_at=int(self.created_at),
+            completed_at=int(self.completed_at) if self.completed_at else None,
+            request_counts=BatchRequestCounts(
+                total=len(self.items),
+                completed=self.count(COMPLETED),
+                failed=self.count(FAILED),
+            ),
+            items=[
+                BatchItemStatus(
+                    index=item.index,
+                    status=item.status,
+                    response_format=item.request.response_format,
+                    size_bytes=item.size_bytes,
+                    error=ErrorDetail(
+                        message=item.error.get("message", "An error occurred"),
+                        type=item.error.get("type", "api_error"),
+                        param=item.error.get("param"),
+                        code=item.error.get("code"),
+                    )
+                    if item.error
+                    else None,
+                )
+                for item in self.items
+            ],
+        )
+
+
+class BatchManager:
+    """
+    Runs batch speech jobs in the background.
+
+    Items from every job share one queue drained by `max_concurrency`
+    workers, so bulk work never uses more than that many upstream slots
+    (and still goes through the API key pool's quotas). Each item runs the
+    regular speech pipeline, including the audio cache, and its result is
+    written to `storage_dir/<job id>/`. Failed items can be re-queued
+    without redoing the ones that succeeded. Finished jobs are deleted
+    after `retention_seconds`.
+
+    With `shared_state`, the state of each job is also written to a
+    snapshot in its directory, so that other worker processes sharing
+    `storage_dir` can report its status, serve its results and retry it
+    once finished. A retry takes the job over under a lock shared by the
+    workers; the snapshot records which worker runs the job, and a worker
+    drops its in-memory copy of a job another worker has taken over.
+    """
+
+    def __init__(
+        self,
+        speech_service: SpeechService,
+        storage_dir: Path,
+        max_concurrency: int,
+        max_items: int,
+        max_pending: int,
+        retention_seconds: float,
+        shared_state: SharedState | None = None,
+    ):
+        """
+        Args:
+            speech_service: Pipeline used to synthesize each item.
+            storage_dir: Directory where job results are written.
+            max_concurrency: Number of items synthesized at once.
+            max_items: Maximum number of items in one job.
+            max_pending: Maximum number of queued items across all jobs.
+            retention_seconds: How long finished jobs are kept.
+            shared_state: If set, jobs are shared with the other worker
+                processes using it.
+        """
+        self.speech_service = speech_service
+        self.storage_dir = storage_dir
+        self.max_concurrency = max_concurrency
+        self.max_items = max_items
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.shared_state = shared_state
+        self.worker_id = uuid.uuid4().hex
+        self._jobs: dict[str, BatchJob] = {}
+        self._queue: asyncio.Queue[tuple[BatchJob, BatchItem]] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._purge_task: asyncio.Task | None = None
+        self._running = 0
+        # Queue capacity held for jobs being charged
+        self._reserved = 0
+        # Retries wait for their charge before queueing; this keeps two
+        # retries of one job from both queueing its failed items
+        self._retry_lock = asyncio.Lock()
+
+    def start(self) -> None:
+        """
+        Creates the storage directory, starts the workers and the task
+        deleting expired jobs.
+        """
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)
+        ]
+        self._purge_task = asyncio.create_task(self._purge_periodically())
+
+    async def aclose(self) -> None:
+        """Stops the workers; items still queued are abandoned."""
+        tasks = (
+            [*self._workers, self._purge_task] if self._purge_task else self._workers
+        )
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._purge_task = None
+
+    @property
+    def share_jobs(self) -> bool:
+        """Whether jobs are snapshotted for other worker processes."""
+        return self.shared_state is not None
+
+    @property
+    def pending(self) -> int:
+        """Number of items queued or being synthesized."""
+        return self._queue.qsize() + self._running
+
+    def _check_capacity(self, count: int) -> None:
+        if self.pending + self._reserved + count > self.max_pending:
+            raise CapacityExceededException(
+                status_code=503,
+                detail={
+                    "type": "server_error",
+                    "message": "Too many batch items are already queued. Please retry later.",
+                },
+            )
+
+    @contextlib.asynccontextmanager
+    async def _reserve(self, count: int) -> AsyncIterator[None]:
+        """
+        Holds queue capacity for `count` items, so they can still be queued
+        right after the context, whatever was submitted meanwhile.
+
+        Raises:
+            CapacityExceededException: If the queue cannot take the items.
+        """
+        self._check_capacity(count)
+        self._reserved += count
+        try:
+            yield
+        finally:
+            self._reserved -= count
+
+    def _enqueue(self, job: BatchJob, items: list[BatchItem]) -> None:
+        self._check_capacity(len(items))
+        for item in items:
+            item.status = QUEUED
+            item.error = None
+            self._queue.put_nowait((job, item))
+
+    async def submit(
+        self,
+        requests: list[SpeechRequest],
+        owner: str | None = None,
+        charge: Charge | None = None,
+    ) -> BatchJob:
+        """
+        Creates a job for `requests` and queues all of its items.
+
+        Args:
+            requests: The speech requests to synthesize.
+            owner: Name of the submitting client; only it can see the job.
+            charge: Called with the items once the job has been accepted,
+                so a rejected job is never charged.
+
+        Raises:
+            ServiceException: If the job has too many items (400).
+            CapacityExceededException: If the queue cannot take the items.
+        """
+        if len(requests) > self.max_items:
+            raise ServiceException(
+                status_code=400,
+                detail={
+                    "type": "invalid_request_error",
+                    "message": f"A batch can contain at most {self.max_items} items.",
+                    "param": "items",
+                },
+            )
+        job_id = f"batch_{uuid.uuid4().hex}"
+        job = BatchJob(
+            id=job_id,
+            directory=self.storage_dir / job_id,
+            owner=owner,
+            worker=self.worker_id,
+            items=[
+                BatchItem(
+                    index=index,
+                    request=request.model_copy(update={"stream_format": None}),
+                )
+                for index, request in enumerate(requests)
+            ],
+        )
+        async with self._reserve(len(job.items)):
+            if charge is not None:
+                await charge(job.items)
+            await asyncio.to_thread(job.directory.mkdir, parents=True, exist_ok=True)
+        self._enqueue(job, job.items)
+        self._jobs[job_id] = job
+        await self._save(job)
+        logger.info(
+            "Batch job submitted", extra={"job_id": job_id, "item_count": len(requests)}
+        )
+        return job
+
+    async def _save(self, job: BatchJob) -> None:
+        """Writes the job's snapshot, if jobs are shared between workers."""
+        if not self.share_jobs:
+            return
+        async with job.save_lock:
+            job.saved_at = time.monotonic()
+            data = json.dumps(job.to_snapshot())
+            path = job.directory / SNAPSHOT_FILENAME
+
+            def write() -> None:
+                tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+                tmp_path.write_text(data)
+                os.replace(tmp_path, path)
+
+            await asyncio.to_thread(write)
+
+    async def _load(self, job_id: str) -> BatchJob | None:
+        """Reads the snapshot of a job, as last written by the worker running it."""
+        if not self.share_jobs or not JOB_ID_PATTERN.match(job_id):
+            return None
+        directory = self.storage_dir / job_id
+        try:
+            data = await asyncio.to_thread((directory / SNAPSHOT_FILENAME).read_text)
+        except FileNotFoundError:
+            return None
+        return BatchJob.from_snapshot(directory, json.loads(data))
+
+    async def get(self, job_id: str, owner: str | None = None) -> BatchJob:
+        """
+        Returns a job, from this process or (with `share_jobs`) from the
+        snapshot written by the worker process running it.
+
+        Args:
+            job_id: The job's id.
+            owner: If set, jobs submitted by another client are reported
+                as not found, so their ids cannot be probed.
+
+        Raises:
+            NotFoundException: If there is no job with this id (for `owner`).
+        """
+        job = self._jobs.get(job_id)
+        if self.share_jobs:
+            snapshot = await self._load(job_id)
+            if snapshot is not None and snapshot.worker != self.worker_id:
+                # Another worker took the job over; our copy is stale
+                if job is not None:
+                    del self._jobs[job_id]
+                job = snapshot
+            elif job is None:
+                job = snapshot
+        if job is None or (owner is not None and job.owner != owner):
+            raise NotFoundException(
+                status_code=404,
+                detail={
+                    "type": "invalid_request_error",
+                    "message": f"No batch job found with id '{job_id}'.",
+                    "param": "job_id",
+                },
+            )
+        return job
+
+    async def retry_failed(
+        self, job_id: str, owner: str | None = None, charge: Charge | None = None
+    ) -> BatchJob:
+        """
+        Re-queues the failed items of a job.
+
+        Args:
+            job_id: The job's id.
+            owner: If set, jobs submitted by another client are not found.
+            charge: Called with the failed items once they can be re-queued.
+
+        Raises:
+            NotFoundException: If there is no job with this id (for `owner`).
+            ConflictException: If another worker process is still running
+                the job.
+        """
+        job = await self.get(job_id, owner)
+        async with self._retry_lock:
+            if not self.share_jobs:
+                return await self._retry(job, charge)
+            # Serialize takeovers, so concurrent retries in several workers do
+            # not both run the same items
+            async with self.shared_state.lock(
+                f"batch-{job_id}", timeout=TAKEOVER_LOCK_TIMEOUT
+            ):
+                return await self._retry(await self.get(job_id, owner), charge)
+
+    async def _retry(self, job: BatchJob, charge: Charge | None) -> BatchJob:
+        failed = [item for item in job.items if item.status == FAILED]
+        if not failed:
+            return job
+        if job.id not in self._jobs and not job.finished:
+            raise ConflictException(
+                status_code=409,
+                detail={
+                    "type": "invalid_request_error",
+                    "message": f"Batch job '{job.id}' is still in progress.",
+                    "param": "job_id",
+                },
+            )
+        async with self._reserve(len(failed)):
+            if charge is not None:
+                await charge(failed)
+        if job.id not in self._jobs:
+            # Take over the finished job from the worker that ran it
+            job.worker = self.worker_id
+            self._jobs[job.id] = job
+        self._enqueue(job, failed)
+        job.completed_at = None
+        await self._save(job)
+        logger.info(
+            "Retrying failed batch items",
+            extra={"job_id": job.id, "item_count": len(failed)},
+        )
+        return job
+
+    async def item_path(
+        self, job_id: str, index: int, owner: str | None = None
+    ) -> tuple[BatchItem, Path]:
+        """
+        Returns a completed item and the path of its audio file.
+
+        Raises:
+            NotFoundException: If the job or item does not exist.
+            ConflictException: If the item has not completed.
+        """
+        job = await self.get(job_id, owner)
+        if not 0 <= index < len(job.items):
+            raise NotFoundException(
+                status_code=404,
+                detail={
+                    "type": "invalid_request_error",
+                    "message": f"Batch job '{job_id}' has no item {index}.",
+                    "param": "index",
+                },
+            )
+        item = job.items[index]
+        if item.status != COMPLETED:
+            raise ConflictException(
+                status_code=409,
+                detail={
+                    "type": "invalid_request_error",
+                    "message": f"Item {index} is not available (status: {item.status}).",
+                    "param": "index",
+                },
+            )
+        return item, job.directory / item.filename
+
+    async def build_archive(self, job_id: str, owner: str | None = None) -> Path:
+        """
+        Writes a zip of every completed item of a job and returns its path.
+        """
+        job = await self.get(job_id, owner)
+        completed = [item for item in job.items if item.status == COMPLETED]
+        archive = job.directory / f"{job.id}.zip"
+
+        def write() -> None:
+            tmp_path = archive.with_name(f"{archive.name}.{uuid.uuid4().hex}.tmp")
+            # Audio is already compressed; storing avoids burning CPU for nothing
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as zf:
+                for item in completed:
+                    zf.write(job.directory / item.filename, item.filename)
+            os.replace(tmp_path, archive)
+
+        await asyncio.to_thread(write)
+        return archive
+
+    async def _worker(self) -> None:
+        # Batch items always queue behind interactive requests upstream
+        request_priority.set(PRIORITY_BATCH)
+        while True:
+            job, item = await self._queue.get()
+            self._running += 1
+            try:
+                await self._process(job, item)
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+
+    async def _process(self, job: BatchJob, item: BatchItem) -> None:
+        item.status = IN_PROGRESS
+        try:
+            result = await self.speech_service.synthesize(item.request)
+            await asyncio.to_thread(
+                (job.directory / item.filename).write_bytes, result.audio
+            )
+        except ServiceException as e:
+            item.status = FAILED
+            item.error = e.detail
+        except Exception as e:
+            logger.error(
+                "Batch item failed",
+                extra={"job_id": job.id, "index": item.index, "error": str(e)},
+                exc_info=True,
+            )
+            item.status = FAILED
+            item.error = {
+                "type": "api_error",
+                "message": "An internal server error occurred.",
+            }
+        else:
+            item.status = COMPLETED
+            item.size_bytes = len(result.audio)
+
+        if job.finished and job.completed_at is None:
+            job.completed_at = time.time()
+            logger.info(
+                "Batch job finished",
+                extra={
+                    "job_id": job.id,
+                    "completed": job.count(COMPLETED),
+                    "failed": job.count(FAILED),
+                },
+            )
+        if job.finished or time.monotonic() - job.saved_at >= SNAPSHOT_INTERVAL:
+            await self._save(job)
+
+    async def _purge_periodically(self) -> None:
+        while True:
+            try:
+                await self._purge_expired()
+            except Exception as e:
+                logger.error(
+                    "Failed to purge expired batch jobs",
+                    extra={"error": str(e)},
+                    exc_info=True,
+                )
+            await asyncio.sleep(PURGE_INTERVAL)
+
+    def _expired(self, completed_at: float | None, now: float) -> bool:
+        return bool(completed_at) and now - completed_at > self.retention_seconds
+
+    async def _purge_expired(self) -> None:
+        """
+        Deletes the jobs finished more than `retention_seconds` ago.
+
+        Besides the jobs of this process, `storage_dir` is scanned, so jobs
+        finished by other worker processes or left behind by a previous run
+        of the service are deleted too.
+        """
+        now = time.time()
+        expired = [
+            job for job in self._jobs.values() if self._expired(job.completed_at, now)
+        ]
+        for job in expired:
+            del self._jobs[job.id]
+            await asyncio.to_thread(shutil.rmtree, job.directory, ignore_errors=True)
+
+        for job_id, completed_at in await asyncio.to_thread(self._scan_storage):
+            if job_id in self._jobs or not self._expired(completed_at, now):
+                continue
+            if not self.share_jobs:
+                await asyncio.to_thread(
+                    shutil.rmtree, self.storage_dir / job_id, ignore_errors=True
+                )
+                continue
+            # Another worker may be retrying the job; check it again under
+            # the lock its takeover holds
+            async with self.shared_state.lock(
+                f"batch-{job_id}", timeout=TAKEOVER_LOCK_TIMEOUT
+            ):
+                snapshot = await self._load(job_id)
+                if snapshot is None or self._expired(snapshot.completed_at, now):
+                    await asyncio.to_thread(
+                        shutil.rmtree, self.storage_dir / job_id, ignore_errors=True
+                    )
+
+    def _scan_storage(self) -> list[tuple[str, float | None]]:
+        """
+        Lists the job directories in `storage_dir` with the time their job
+        finished, taken from its snapshot or, for directories without one,
+        from their modification time.
+        """
+        jobs = []
+        for directory in self.storage_dir.iterdir():
+            if not JOB_ID_PATTERN.match(directory.name) or not directory.is_dir():
+                continue
+            try:
+                snapshot = json.loads((directory / SNAPSHOT_FILENAME).read_text())
+                completed_at = snapshot.get("completed_at")
+            except FileNotFoundError:
+                try:
+                    completed_at = directory.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+            except ValueError:
+                continue
+            jobs.append((directory.name, completed_at))
+        return jobs
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of tracked jobs and pending items."""
+        return {
+            "jobs": len(self._jobs),
+            "pending_items": self.pending,
+            "max_pending_items": self.max_pending,
+        }
@@ -0,0 +1,239 @@
+import queue
+import subprocess
+import threading
+
+from pydub import AudioSegment
+
+from app.core import deadline
+from app.core.logging import get_logger
+from app.services.audio_processor import (
+    BITRATE_FORMATS,
+    DEFAULT_QUALITY,
+    FFMPEG_OUTPUT_ARGS,
+    FFMPEG_PCM_INPUT_ARGS,
+    communicate,
+    ffmpeg_output_args,
+)
+from app.utils.error_handlers import CapacityExceededException
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+
+class FfmpegEncoderPool:
+    """
+    Pre-spawned ffmpeg encoders that take PCM on stdin and write the encoded
+    audio to stdout.
+
+    ffmpeg only finalizes its output once stdin is closed, so each process
+    encodes exactly one job and is then discarded. The pool keeps
+    `warm_per_format` processes already started for every format, so a job
+    never pays for process startup and codec initialization, and audio
+    moves through pipes instead of pydub's temporary files. Checking out a
+    warm process only takes it from the pool: its replacement is spawned by
+    a background thread, off the request path. Warm processes that died
+    while idle are detected on checkout and replaced the same way.
+
+    Warm processes encode with the pool's default `quality` profile; jobs
+    asking for another profile or an explicit bitrate start their own
+    process, within the same concurrency limit.
+    """
+
+    def __init__(
+        self,
+        warm_per_format: int,
+        max_concurrency: int,
+        acquire_timeout: float,
+        quality: str = DEFAULT_QUALITY,
+    ):
+        """
+        Args:
+            warm_per_format: Number of idle processes kept ready per format.
+            max_concurrency: Maximum number of encodes running at once.
+            acquire_timeout: How long an encode waits for a free slot before
+                it is rejected.
+            quality: Encoding profile of the warm processes.
+        """
+        self.warm_per_format = warm_per_format
+        self.quality = quality
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self._warm: dict[str, queue.SimpleQueue[subprocess.Popen]] = {
+            target_format: queue.SimpleQueue() for target_format in FFMPEG_OUTPUT_ARGS
+        }
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Formats whose warm processes need a replacement; None stops the
+        # refill thread
+        self._refills: queue.SimpleQueue[str | None] = queue.SimpleQueue()
+        self._refill_thread: threading.Thread | None = None
+        self._closed = False
+        self._completed = 0
+        self._cold_starts = 0
+        self._custom = 0
+        self._unhealthy = 0
+        self._rejected = 0
+
+    def start(self) -> None:
+        """Spawns the initial warm processes for every format and the refill thread."""
+        for target_format, warm in self._warm.items():
+            for _ in range(self.warm_per_format):
+                warm.put(self._spawn(target_format, self.quality))
+        self._refill_thread = threading.Thread(
+            target=self._refill, name="encoder-refill", daemon=True
+        )
+        self._refill_thread.start()
+        logger.info(
+            "Started ffmpeg encoder pool",
+            extra={
+                "formats": list(self._warm),
+                "warm_per_format": self.warm_per_format,
+                "quality": self.quality,
+            },
+        )
+
+    def supports(self, target_format: str) -> bool:
+        return target_format in FFMPEG_OUTPUT_ARGS
+
+    def _spawn(
+        self, target_format: str, quality: str, bitrate: int | None = None
+    ) -> subprocess.Popen:
+        return subprocess.Popen(
+            [
+                AudioSegment.converter,
+                *FFMPEG_PCM_INPUT_ARGS,
+                *ffmpeg_output_args(target_format, quality, bitrate),
+                "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def _refill(self) -> None:
+        """Spawns a replacement for every warm process checked out, until closed."""
+        while (target_format := self._refills.get()) is not None:
+            try:
+                process = self._spawn(target_format, self.quality)
+            except OSError as e:
+                logger.error(
+                    "Failed to spawn warm encoder process",
+                    extra={"target_format": target_format, "error": str(e)},
+                )
+                continue
+            self._warm[target_format].put(process)
+
+    def _checkout(self, target_format: str) -> subprocess.Popen:
+        """Takes a live warm process for `target_format`; its replacement is queued."""
+        warm = self._warm[target_format]
+        while True:
+            try:
+                process = warm.get_nowait()
+            except queue.Empty:
+                self._cold_starts += 1
+                return self._spawn(target_format, self.quality)
+
+            alive = process.poll() is None
+            if not self._closed:
+                self._refills.put(target_format)
+            if alive:
+                return process
+
+            self._unhealthy += 1
+            logger.warning(
+                "Discarding dead warm encoder process",
+                extra={
+                    "target_format": target_format,
+                    "pid": process.pid,
+                    "return_code": process.returncode,
+                },
+            )
+
+    def encode(
+        self,
+        pcm: bytes,
+        target_format: str,
+        quality: str = DEFAULT_QUALITY,
+        bitrate: int | None = None,
+    ) -> bytes:
+        """
+        Encodes PCM audio (24kHz, 16-bit, mono) to `target_format`.
+
+        Args:
+            pcm: The PCM audio.
+            target_format: One of the pool's formats.
+            quality: Encoding profile.
+            bitrate: Bitrate in kbps for lossy formats, overriding `quality`.
+
+        Raises:
+            CapacityExceededException: If no encode slot frees up in time.
+            DeadlineExceededException: If the request's deadline passes.
+            RequestCancelledException: If the caller stopped waiting.
+            RuntimeError: If ffmpeg fails.
+        """
+        if not self._slots.acquire(timeout=deadline.clamp(self.acquire_timeout)):
+            left = deadline.remaining()
+            if left is not None and left <= 0:
+                raise deadline.deadline_exceeded("encoder_slot")
+            self._rejected += 1
+            logger.warning(
+                "All encoder slots busy, rejecting job",
+                extra={"max_concurrency": self.max_concurrency},
+            )
+            raise CapacityExceededException(
+                status_code=503,
+                detail={
+                    "type": "server_error",
+                    "message": "The server is busy processing audio. Please retry shortly.",
+                },
+            )
+
+        try:
+            if quality == self.quality and (
+                bitrate is None or target_format not in BITRATE_FORMATS
+            ):
+                process = self._checkout(target_format)
+            else:
+                self._custom += 1
+                process = self._spawn(target_format, quality, bitrate)
+            stdout, stderr = communicate(process, pcm)
+            if process.returncode != 0:
+                raise RuntimeError(
+                    f"ffmpeg exited with code {process.returncode}: "
+                    f"{stderr.decode(errors='replace').strip()}"
+                )
+            self._completed += 1
+            return stdout
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Returns a snapshot of the pool's counters."""
+        return {
+            "backend": "ffmpeg_pool",
+            "warm": {
+                target_format: warm.qsize()
+                for target_format, warm in self._warm.items()
+            },
+            "completed": self._completed,
+            "cold_starts": self._cold_starts,
+            "custom_profile": self._custom,
+            "unhealthy": self._unhealthy,
+            "rejected": self._rejected,
+        }
+
+    def close(self) -> None:
+        """Stops the refill thread and terminates every idle warm process."""
+        self._closed = True
+        if self._refill_thread is not None:
+            self._refills.put(None)
+            self._refill_thread.join()
+            self._refill_thread = None
+        for warm in self._warm.values():
+            while True:
+                try:
+                    process = warm.get_nowait()
+                except queue.Empty:
+                    break
+                process.kill()
+                process.wait()
@@ -1,46 +1,459 @@
+import asyncio
+import base64
+import contextlib
+import math
+import time
+from collections.abc import AsyncIterator
+from typing import NoReturn
+
+import httpx
 from google import genai
 from google.api_core import exceptions as google_exceptions
 from google.api_core.exceptions import (
+    DeadlineExceeded,
     InternalServerError,
     InvalidArgument,
     PermissionDenied,
     ServiceUnavailable,
+    TooManyRequests,
 )
+from google.genai import errors as genai_errors
 from google.genai import types
 
 from app.core.config import settings
+from app.core.deadline import clamp
 from app.core.logging import get_logger
+from app.core.metrics import (
+    STAGE_DURATION,
+    UPSTREAM_ERRORS,
+    UPSTREAM_KEY_COOLDOWN_UNTIL,
+    UPSTREAM_KEY_FAILURES,
+    UPSTREAM_KEY_IN_FLIGHT,
+    UPSTREAM_KEY_REQUESTS,
+)
+from app.core.tracing import span
 from app.models.schemas import SpeechRequest
+from app.services.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+from app.services.shared_state import SharedState
+from app.services.upstream_scheduler import UpstreamScheduler
 from app.utils.error_handlers import UpstreamAPIException
 
 
 # 初始化日志器
 logger = get_logger(__name__)
 
+# 触发换用其他 API Key 重试的上游错误：限流（429）和鉴权失败（403）
+KEY_FAILOVER_ERRORS = (TooManyRequests, PermissionDenied)
+
+# Gemini 多说话人语音合成在一次调用中支持的最多说话人数
+MAX_SPEAKERS_PER_CALL = 2
+
+# 多 worker 模式下，从 SharedState 同步其他进程设置的 Key 冷却状态的间隔（秒）
+COOLDOWN_SYNC_INTERVAL = 1.0
+
+
+# google-genai SDK 错误中的 status 字段与 google.api_core 异常类型的对应关系
+_SDK_STATUS_ERRORS: dict[str, type[google_exceptions.GoogleAPICallError]] = {
+    "INVALID_ARGUMENT": InvalidArgument,
+    "PERMISSION_DENIED": PermissionDenied,
+    "RESOURCE_EXHAUSTED": google_exceptions.ResourceExhausted,
+    "UNAVAILABLE": ServiceUnavailable,
+    "INTERNAL": InternalServerError,
+}
+
+
+@contextlib.contextmanager
+def _translate_sdk_errors():
+    """
+    将 google-genai SDK 抛出的 APIError 转换为对应的 google.api_core 异常，
+    以便统一按异常类型处理上游错误。
+    """
+    try:
+        yield
+    except genai_errors.APIError as e:
+        message = e.message or str(e)
+        error_class = _SDK_STATUS_ERRORS.get(e.status or "")
+        if error_class is not None:
+            raise error_class(message) from e
+        raise google_exceptions.from_http_status(e.code, message) from e
+    except httpx.TimeoutException as e:
+        raise DeadlineExceeded(f"Upstream request timed out: {e}") from e
+    except httpx.TransportError as e:
+        # 连接失败、连接被重置等网络错误
+        raise ServiceUnavailable(f"Upstream connection error: {e}") from e
+
+
+class TokenBucket:
+    """
+    令牌桶限流器：按每分钟请求数（RPM）匀速补充令牌，容量为一分钟的配额。
+
+    方法均为协程，与需要访问 SharedState 的 SharedTokenBucket 接口一致。
+    """
+
+    def __init__(self, rate_per_minute: int):
+        """
+        Args:
+            rate_per_minute: 每分钟允许的请求数，0 表示不限流。
+        """
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    async def available(self, now: float) -> float:
+        """返回当前可用的令牌数。"""
+        if self.unlimited:
+            return float("inf")
+        self._refill(now)
+        return self.tokens
+
+    async def try_take(self, now: float) -> bool:
+        """尝试取走一个令牌，成功返回 True。"""
+        if self.unlimited:
+            return True
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def seconds_until_available(self, now: float) -> float:
+        """返回距离下一个令牌可用还需等待的秒数。"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class SharedTokenBucket:
+    """
+    与 TokenBucket 接口相同的令牌桶，令牌保存在 SharedState 中，
+    由同一主机上的所有 worker 进程共享，使 RPM 限制对整个主机生效。
+    """
+
+    SCOPE = "gemini-keys"
+
+    def __init__(self, state: SharedState, name: str, rate_per_minute: int):
+        self.state = state
+        self.name = name
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    async def available(self, now: float) -> float:
+        if self.unlimited:
+            return float("inf")
+        return await self.state.peek_tokens(self.SCOPE, self.name, self.capacity, 60.0)
+
+    async def try_take(self, now: float) -> bool:
+        if self.unlimited:
+            return True
+        allowed, _ = await self.state.take_tokens(
+            self.SCOPE, [(self.name, 1, self.capacity, 60.0)]
+        )
+        return allowed
+
+    async def seconds_until_available(self, now: float) -> float:
+        if self.unlimited:
+            return 0.0
+        return max(0.0, (1 - await self.available(now)) / self.rate)
+
+
+class ApiKeyState:
+    """
+    单个上游 API Key 的状态：对应的 SDK 客户端、限流令牌桶、冷却时间和用量计数。
+    """
+
+    def __init__(
+        self,
+        key_id: str,
+        client: genai.Client,
+        rate_per_minute: int,
+        shared_state: SharedState | None = None,
+    ):
+        self.key_id = key_id
+        self.client = client
+        self.bucket = (
+            SharedTokenBucket(shared_state, key_id, rate_per_minute)
+            if shared_state is not None
+            else TokenBucket(rate_per_minute)
+        )
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.auth_failures = 0
+
+    def is_cooling_down(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def stats(self, now: float) -> dict:
+        return {
+            "key_id": self.key_id,
+            "requests": self.requests,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "auth_failures": self.auth_failures,
+            "in_flight": self.in_flight,
+            "cooling_down": self.is_cooling_down(now),
+            "cooldown_remaining_seconds": round(max(0.0, self.cooldown_until - now), 1),
+        }
+
+
+class ApiKeyPool:
+    """
+    在多个上游 API Key 之间做负载均衡的调度器。
+
+    每个 Key 有独立的令牌桶限流；返回 429 或 403 的 Key 会进入冷却期，
+    冷却期内不会被选中。所有 Key 都不可用时，最多等待
+    GEMINI_KEY_MAX_WAIT_SECONDS 秒，超时则以 429 拒绝请求。
+
+    传入 `shared_state` 时，冷却状态在所有 worker 进程之间共享：一个进程
+    发现 Key 被限流后，其他进程最多 COOLDOWN_SYNC_INTERVAL 秒后也会跳过它。
+    """
+
+    def __init__(
+        self, keys: list[ApiKeyState], shared_state: SharedState | None = None
+    ):
+        self.keys = keys
+        self.shared_state = shared_state
+        self._next_cooldown_sync = 0.0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    async def _select(self, now: float) -> ApiKeyState | None:
+        candidates = []
+        for key in self.keys:
+            if key.is_cooling_down(now):
+                continue
+            available = await key.bucket.available(now)
+            if available >= 1:
+                candidates.append((available, -key.in_flight, key))
+        if not candidates:
+            return None
+        # 优先选择剩余配额最多、当前并发最少的 Key
+        return max(candidates, key=lambda candidate: candidate[:2])[2]
+
+    async def _sync_cooldowns(self, now: float) -> None:
+        """合并其他 worker 进程记录的冷却状态。"""
+        if self.shared_state is None or now < self._next_cooldown_sync:
+            return
+        self._next_cooldown_sync = now + COOLDOWN_SYNC_INTERVAL
+        # 共享状态使用墙上时间，换算为本进程的单调时钟
+        offset = now - time.time()
+        cooldowns = await self.shared_state.cooldowns()
+        for key in self.keys:
+            until = cooldowns.get(key.key_id)
+            if until is not None:
+                key.cooldown_until = max(key.cooldown_until, until + offset)
+                UPSTREAM_KEY_COOLDOWN_UNTIL.labels(key.key_id).set(until)
+
+    async def _seconds_until_any_available(self, now: float) -> float:
+        return min(
+            [
+                max(
+                    key.cooldown_until - now,
+                    await key.bucket.seconds_until_available(now),
+                )
+                for key in self.keys
+            ]
+        )
+
+    async def acquire(self) -> ApiKeyState:
+        """
+        选出一个可用的 Key 并占用一个令牌，调用结束后必须调用 `release`。
+
+        Raises:
+            UpstreamAPIException: 如果在最长等待时间内没有可用的 Key。
+        """
+        deadline = time.monotonic() + settings.GEMINI_KEY_MAX_WAIT_SECONDS
+        while True:
+            now = time.monotonic()
+            await self._sync_cooldowns(now)
+            key = await self._select(now)
+            if key is not None and await key.bucket.try_take(now):
+                key.in_flight += 1
+                key.requests += 1
+                UPSTREAM_KEY_IN_FLIGHT.labels(key.key_id).inc()
+                UPSTREAM_KEY_REQUESTS.labels(key.key_id).inc()
+                return key
+
+            wait = await self._seconds_until_any_available(now)
+            if now + wait > deadline:
+                logger.warning(
+                    "No upstream API key available",
+                    extra={"retry_after_seconds": round(wait, 1)},
+                )
+                raise UpstreamAPIException(
+                    status_code=429,
+                    detail={
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                        "message": "All upstream API keys are currently rate limited. Please retry later.",
+                    },
+                )
+            await asyncio.sleep(max(wait, 0.01))
+
+    async def release(self, key: ApiKeyState, error: Exception | None = None) -> None:
+        """
+        归还 Key，并根据调用结果更新其健康状态。
+
+        Args:
+            key: `acquire` 返回的 Key。
+            error: 调用失败时的异常；429 和 403 会让 Key 进入冷却期。
+        """
+        key.in_flight -= 1
+        UPSTREAM_KEY_IN_FLIGHT.labels(key.key_id).dec()
+        if error is None:
+            return
+        key.failures += 1
+        if isinstance(error, TooManyRequests):
+            key.throttled += 1
+            reason = "throttled"
+            cooldown = settings.GEMINI_KEY_COOLDOWN_SECONDS
+        elif isinstance(error, PermissionDenied):
+            key.auth_failures += 1
+            reason = "auth"
+            cooldown = settings.GEMINI_KEY_AUTH_COOLDOWN_SECONDS
+        else:
+            UPSTREAM_KEY_FAILURES.labels(key.key_id, "error").inc()
+            return
+        UPSTREAM_KEY_FAILURES.labels(key.key_id, reason).inc()
+        key.cooldown_until = time.monotonic() + cooldown
+        UPSTREAM_KEY_COOLDOWN_UNTIL.labels(key.key_id).set(time.time() + cooldown)
+        if self.shared_state is not None:
+            await self.shared_state.set_cooldown(key.key_id, time.time() + cooldown)
+        logger.warning(
+            "Upstream API key put into cooldown",
+            extra={
+                "key_id": key.key_id,
+                "error_type": type(error).__name__,
+                "cooldown_seconds": cooldown,
+            },
+        )
+
+    def stats(self) -> list[dict]:
+        """返回每个 Key 的用量与健康状态。"""
+        now = time.monotonic()
+        return [key.stats(now) for key in self.keys]
+
 
 class GeminiClient:
     """
     封装了与 Google Gemini API 进行文本转语音交互的客户端。
     """
 
-    def __init__(self):
+    def __init__(self, shared_state: SharedState | None = None):
         """
         初始化 Gemini 客户端，通过 API 密钥进行配置，并准备 TTS 模型。
+
+        客户端在进程内共享（由应用 lifespan 创建和关闭），底层使用一个
+        带连接池、keep-alive 和 HTTP/2 的 httpx 传输层，避免每个请求都
+        重新建立 TLS 连接。每个上游 API Key 对应一个 SDK 客户端，它们
+        共用同一个连接池，由 ApiKeyPool 负责调度。
+
+        Args:
+            shared_state: 多 worker 模式下各进程共享的状态，用于让 Key 的
+                RPM 配额和冷却状态对整个主机生效。
         """
         logger.debug("Initializing Gemini client")
-        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        self._transport = httpx.AsyncHTTPTransport(
+            http2=settings.GEMINI_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.GEMINI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GEMINI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.GEMINI_HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.key_pool = ApiKeyPool(
+            [
+                ApiKeyState(
+                    key_id=f"key-{index}",
+                    client=genai.Client(
+                        api_key=api_key,
+                        http_options=types.HttpOptions(
+                            base_url=settings.GEMINI_BASE_URL,
+                            async_client_args={"transport": self._transport},
+                        ),
+                    ),
+                    rate_per_minute=settings.GEMINI_KEY_RPM,
+                    shared_state=shared_state,
+                )
+                for index, api_key in enumerate(settings.gemini_api_keys)
+            ],
+            shared_state=shared_state,
+        )
+        self.resilience = ResilientCaller(
+            max_attempts=settings.GEMINI_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.GEMINI_RETRY_BASE_DELAY_SECONDS,
+            max_delay=settings.GEMINI_RETRY_MAX_DELAY_SECONDS,
+            retry_budget_ratio=settings.GEMINI_RETRY_BUDGET_RATIO,
+            hedge_enabled=settings.GEMINI_HEDGE_ENABLED,
+            hedge_delay=settings.GEMINI_HEDGE_DELAY_SECONDS,
+            hedge_min_samples=settings.GEMINI_HEDGE_MIN_SAMPLES,
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=settings.CIRCUIT_BREAKER_RESET_SECONDS,
+            ),
+        )
+        self.scheduler = UpstreamScheduler(
+            max_concurrency=settings.UPSTREAM_MAX_CONCURRENCY,
+            max_queue=settings.UPSTREAM_MAX_QUEUE,
+            queue_timeout=settings.UPSTREAM_QUEUE_TIMEOUT_SECONDS,
+        )
         self.model = "gemini-2.5-flash-preview-tts"
-        logger.debug("Gemini client initialized with model: %s", self.model)
+        logger.debug(
+            "Gemini client initialized with model: %s",
+            self.model,
+            extra={
+                "http2": settings.GEMINI_HTTP2,
+                "max_connections": settings.GEMINI_HTTP_MAX_CONNECTIONS,
+                "api_key_count": len(self.key_pool),
+            },
+        )
+
+    async def aclose(self) -> None:
+        """
+        关闭底层连接池，释放所有 keep-alive 连接。
+        """
+        await self._transport.aclose()
+        logger.debug("Gemini client connection pool closed")
+
+    def stats(self) -> dict:
+        """
+        返回上游 API Key 的用量统计，用于规划配额。
+        """
+        return {
+            "api_keys": self.key_pool.stats(),
+            "resilience": self.resilience.stats(),
+            "scheduler": self.scheduler.stats(),
+        }
 
     def _construct_prompt(self, request: SpeechRequest) -> str:
         """
         根据技术规约 3.3 节的要求，从 SpeechRequest 对象构造 prompt。
 
-        此方法将 `instructions` 和非默认的 `speed` 参数合并到
-        一个单独的文本 prompt 中，以指导 TTS 模型的发音。
+        此方法将 `instructions` 与输入文本合并到一个单独的文本 prompt
+        中，以指导 TTS 模型的发音。`speed` 不写入 prompt：上游始终按
+        正常语速合成，语速由 SpeechService 对返回的 PCM 做变速处理。
 
         Args:
-            request: 包含输入文本、语速和指示的 SpeechRequest 对象。
+            request: 包含输入文本和指示的 SpeechRequest 对象。
 
         Returns:
             为 Gemini API 调用构造的完整 prompt 字符串。
@@ -51,18 +464,6 @@ class GeminiClient:
         if request.instructions:
             prompt_parts.append(request.instructions)
 
-        # 根据规约，如果 `speed` 不是默认值 1.0，则添加语速指令。
-        # 我们使用自然语言指令来表达语速要求。
-        if request.speed and request.speed != 1.0:
-            if request.speed < 1.0:
-                prompt_parts.append(
-                    f"请以较慢的语速朗读，大约是正常语速的 {request.speed} 倍。"
-                )
-            else:
-                prompt_parts.append(
-                    f"请以较快的语速朗读，大约是正常语速的 {request.speed} 倍。"
-                )
-
         # 最后，添加核心的输入文本。
         prompt_parts.append(request.input)
 
@@ -71,12 +472,54 @@ class GeminiClient:
             "Constructed prompt for TTS",
             extra={
                 "prompt_length": len(final_prompt),
-                "has_speed_instruction": bool(request.speed and request.speed != 1.0),
                 "has_custom_instructions": bool(request.instructions),
             },
         )
         return final_prompt
 
+    def _construct_dialogue_prompt(
+        self, turns: list[tuple[str, str]], instructions: str | None
+    ) -> str:
+        """
+        把对话轮次写成 Gemini 多说话人合成所需的脚本。
+
+        每轮台词占一行，格式为 "说话人: 台词"，说话人名称与语音配置中的
+        名称一一对应；只有一个说话人时不写名称，直接朗读台词。
+        `instructions` 与单人合成一样放在开头。
+
+        Args:
+            turns: 按顺序排列的 (说话人, 台词)。
+            instructions: 可选的朗读指示。
+
+        Returns:
+            为 Gemini API 调用构造的完整 prompt 字符串。
+        """
+        speakers = list(dict.fromkeys(speaker for speaker, _ in turns))
+        prompt_parts = []
+        if instructions:
+            prompt_parts.append(instructions)
+        if len(speakers) == 1:
+            prompt_parts.append("\n".join(text for _, text in turns))
+        else:
+            lines = [f"{speaker}: {text}" for speaker, text in turns]
+            prompt_parts.append(
+                "TTS the following conversation between "
+                + " and ".join(speakers)
+                + ":\n"
+                + "\n".join(lines)
+            )
+
+        final_prompt = "\n\n".join(prompt_parts)
+        logger.debug(
+            "Constructed dialogue prompt for TTS",
+            extra={
+                "prompt_length": len(final_prompt),
+                "speakers": len(speakers),
+                "turns": len(turns),
+            },
+        )
+        return final_prompt
+
     def _get_voice_config(self, voice_name: str) -> types.VoiceConfig:
         """
         根据语音名称创建语音配置对象。
@@ -93,7 +536,24 @@ class GeminiClient:
             )
         )
 
-    def generate_audio(self, request: SpeechRequest) -> str:
+    def _build_config(self, request: SpeechRequest) -> types.GenerateContentConfig:
+        """
+        构造只返回音频模态的 GenerateContentConfig。
+
+        Args:
+            request: 包含语音名称的 SpeechRequest 对象。
+
+        Returns:
+            用于 TTS 调用的生成配置。
+        """
+        return types.GenerateContentConfig(
+            response_modalities=["AUDIO"],
+            speech_config=types.SpeechConfig(
+                voice_config=self._get_voice_config(request.voice)
+            ),
+        )
+
+    async def generate_audio(self, request: SpeechRequest) -> str | bytes:
         """
         使用 Gemini TTS API 从文本生成音频。
 
@@ -104,45 +564,341 @@ class GeminiClient:
             request: 包含生成语音所需全部信息的 SpeechRequest 对象。
 
         Returns:
-            表示生成音频的 base64 编码字符串。
+            SDK 返回的音频数据，原样传递不做复制：通常是已解码的 PCM
+            bytes，也可能是 base64 编码的字符串（由 decode_pcm 处理）。
 
         Raises:
             UpstreamAPIException: 如果 Gemini API 调用失败或返回可处理的错误。
         """
-        prompt = self._construct_prompt(request)
-        voice_config = self._get_voice_config(request.voice)
+        with (
+            span("gemini.construct_prompt"),
+            STAGE_DURATION.labels("prompt_construction").time(),
+        ):
+            prompt = self._construct_prompt(request)
+
+        return await self._generate(
+            prompt, self._build_config(request), request.voice, request.input
+        )
+
+    async def generate_dialogue_audio(
+        self,
+        turns: list[tuple[str, str]],
+        voices: dict[str, str],
+        instructions: str | None = None,
+    ) -> str | bytes:
+        """
+        使用 Gemini 多说话人语音合成，在一次调用中生成一段对话的音频。
+
+        Args:
+            turns: 按顺序排列的 (说话人, 台词)，最多包含
+                MAX_SPEAKERS_PER_CALL 个不同的说话人。
+            voices: 每个说话人使用的语音名称。
+            instructions: 可选的朗读指示。
+
+        Returns:
+            SDK 返回的音频数据，与 `generate_audio` 相同。
+
+        Raises:
+            ValueError: 如果说话人数超过 MAX_SPEAKERS_PER_CALL。
+            UpstreamAPIException: 如果 Gemini API 调用失败或返回可处理的错误。
+        """
+        speakers = list(dict.fromkeys(speaker for speaker, _ in turns))
+        if len(speakers) > MAX_SPEAKERS_PER_CALL:
+            raise ValueError(
+                f"A single call supports at most {MAX_SPEAKERS_PER_CALL} "
+                f"speakers, got {len(speakers)}"
+            )
+
+        with (
+            span("gemini.construct_prompt"),
+            STAGE_DURATION.labels("prompt_construction").time(),
+        ):
+            prompt = self._construct_dialogue_prompt(turns, instructions)
+
+        if len(speakers) == 1:
+            speech_config = types.SpeechConfig(
+                voice_config=self._get_voice_config(voices[speakers[0]])
+            )
+        else:
+            speech_config = types.SpeechConfig(
+                multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
+                    speaker_voice_configs=[
+                        types.SpeakerVoiceConfig(
+                            speaker=speaker,
+                            voice_config=self._get_voice_config(voices[speaker]),
+                        )
+                        for speaker in speakers
+                    ]
+                )
+            )
+        config = types.GenerateContentConfig(
+            response_modalities=["AUDIO"], speech_config=speech_config
+        )
+        return await self._generate(
+            prompt,
+            config,
+            ",".join(voices[speaker] for speaker in speakers),
+            "\n".join(text for _, text in turns),
+        )
 
+    async def _generate(
+        self,
+        prompt: str,
+        config: types.GenerateContentConfig,
+        voice: str,
+        input_text: str,
+    ) -> str | bytes:
+        """
+        经过调度、重试和 Key 故障转移发起一次合成调用，返回其中的音频数据。
+
+        Args:
+            prompt: 发给模型的完整 prompt。
+            config: 生成配置。
+            voice: 所用语音（多个时以逗号分隔），用于日志和追踪。
+            input_text: 原始输入文本，用于错误日志。
+        """
         logger.info(
             "Generating audio via Gemini API",
             extra={
                 "model": self.model,
-                "voice": request.voice,
+                "voice": voice,
                 "prompt_preview": prompt[:100] + "..." if len(prompt) > 100 else prompt,
             },
         )
 
-        try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_modalities=["AUDIO"],
-                    speech_config=types.SpeechConfig(voice_config=voice_config),
-                ),
+        async with self.scheduler.slot() as queue_wait:
+            # 不超过所属请求剩余的时间（见 deadline.run_request）
+            deadline = time.monotonic() + clamp(
+                settings.GEMINI_REQUEST_DEADLINE_SECONDS
+            )
+            try:
+                response, key_id = await self.resilience.call(
+                    lambda: self._generate_with_failover(prompt, config, voice),
+                    deadline,
+                )
+            except CircuitOpenError as e:
+                self._raise_circuit_open(e)
+            except google_exceptions.GoogleAPICallError as e:
+                self._raise_upstream_error(e, voice, input_text)
+
+        # 提取音频数据（SDK 已解码的 bytes，或 base64 编码的字符串）
+        audio_data = response.candidates[0].content.parts[0].inline_data.data
+
+        logger.info(
+            "Successfully generated audio from Gemini API",
+            extra={
+                "audio_data_length": len(audio_data),
+                "voice": voice,
+                "key_id": key_id,
+                "queue_wait_seconds": round(queue_wait, 3),
+            },
+        )
+
+        return audio_data
+
+    async def _generate_with_failover(
+        self, prompt: str, config: types.GenerateContentConfig, voice: str
+    ) -> tuple[types.GenerateContentResponse, str]:
+        """
+        发起一次上游调用；若所用 Key 被限流或鉴权失败，则换用其他 Key。
+
+        Returns:
+            上游响应，以及最终成功的 Key 标识。
+
+        Raises:
+            GoogleAPICallError: 上游调用失败，且没有可换用的 Key。
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            key = await self.key_pool.acquire()
+            error = None
+            try:
+                with (
+                    span(
+                        "gemini.generate_content",
+                        model=self.model,
+                        voice=voice,
+                        prompt_length=len(prompt),
+                        key_id=key.key_id,
+                    ),
+                    STAGE_DURATION.labels("gemini_generate_content").time(),
+                    _translate_sdk_errors(),
+                ):
+                    response = await key.client.aio.models.generate_content(
+                        model=self.model,
+                        contents=prompt,
+                        config=config,
+                    )
+            except google_exceptions.GoogleAPICallError as e:
+                error = e
+            finally:
+                await self.key_pool.release(key, error)
+
+            if error is None:
+                return response, key.key_id
+            if not isinstance(error, KEY_FAILOVER_ERRORS) or attempt >= len(
+                self.key_pool
+            ):
+                raise error
+            logger.warning(
+                "Retrying Gemini API call with another key",
+                extra={"key_id": key.key_id, "error_type": type(error).__name__},
             )
 
-            # 提取音频数据（base64 编码的字符串）
-            audio_data = response.candidates[0].content.parts[0].inline_data.data
+    async def generate_audio_stream(
+        self, request: SpeechRequest
+    ) -> AsyncIterator[bytes]:
+        """
+        使用 Gemini 流式接口逐块生成音频。
+
+        每收到一个响应分片就立即产出其中解码后的 PCM 数据，使调用方
+        可以在整段语音合成完成之前开始编码和返回音频。
+
+        Args:
+            request: 包含生成语音所需全部信息的 SpeechRequest 对象。
+
+        Yields:
+            24kHz、16-bit、单声道的原始 PCM 数据块。
+
+        Raises:
+            UpstreamAPIException: 如果 Gemini API 调用失败或返回可处理的错误。
+        """
+        with (
+            span("gemini.construct_prompt"),
+            STAGE_DURATION.labels("prompt_construction").time(),
+        ):
+            prompt = self._construct_prompt(request)
+
+        logger.info(
+            "Streaming audio via Gemini API",
+            extra={
+                "model": self.model,
+                "voice": request.voice,
+                "prompt_preview": prompt[:100] + "..." if len(prompt) > 100 else prompt,
+            },
+        )
+
+        async with self.scheduler.slot() as queue_wait:
+            try:
+                self.resilience.circuit_breaker.before_call()
+            except CircuitOpenError as e:
+                self._raise_circuit_open(e)
+
+            config = self._build_config(request)
+            attempts = len(self.key_pool)
+            total_bytes = 0
+            for attempt in range(1, attempts + 1):
+                key = await self.key_pool.acquire()
+                error = None
+                try:
+                    with (
+                        span(
+                            "gemini.generate_content_stream",
+                            model=self.model,
+                            voice=request.voice,
+                            prompt_length=len(prompt),
+                            key_id=key.key_id,
+                        ),
+                        _translate_sdk_errors(),
+                    ):
+                        stream = await key.client.aio.models.generate_content_stream(
+                            model=self.model,
+                            contents=prompt,
+                            config=config,
+                        )
+                        async for chunk in stream:
+                            for data in self._iter_audio_data(chunk):
+                                total_bytes += len(data)
+                                yield data
+                except google_exceptions.GoogleAPICallError as e:
+                    error = e
+                finally:
+                    await self.key_pool.release(key, error)
+
+                if error is None:
+                    self.resilience.record_outcome(None)
+                    break
+                # 只有在尚未向调用方输出任何音频时才能换用其他 Key 重试
+                if (
+                    isinstance(error, KEY_FAILOVER_ERRORS)
+                    and attempt < attempts
+                    and total_bytes == 0
+                ):
+                    logger.warning(
+                        "Retrying Gemini API stream with another key",
+                        extra={
+                            "key_id": key.key_id,
+                            "error_type": type(error).__name__,
+                        },
+                    )
+                    continue
+                self.resilience.record_outcome(error)
+                self._raise_upstream_error(error, request.voice, request.input)
 
             logger.info(
-                "Successfully generated audio from Gemini API",
-                extra={"audio_data_length": len(audio_data), "voice": request.voice},
+                "Finished streaming audio from Gemini API",
+                extra={
+                    "audio_data_length": total_bytes,
+                    "voice": request.voice,
+                    "key_id": key.key_id,
+                    "queue_wait_seconds": round(queue_wait, 3),
+                },
             )
 
-            return audio_data
+    @staticmethod
+    def _iter_audio_data(chunk: types.GenerateContentResponse) -> list[bytes]:
+        """
+        从流式响应分片中提取解码后的 PCM 数据。
+        """
+        if not chunk.candidates or not chunk.candidates[0].content:
+            return []
+        audio = []
+        for part in chunk.candidates[0].content.parts or []:
+            if not part.inline_data or not part.inline_data.data:
+                continue
+            data = part.inline_data.data
+            audio.append(base64.b64decode(data) if isinstance(data, str) else data)
+        return audio
+
+    def _raise_circuit_open(self, e: CircuitOpenError) -> NoReturn:
+        """
+        熔断器打开时快速失败，不再向上游发送请求。
+
+        Raises:
+            UpstreamAPIException: 始终抛出。
+        """
+        UPSTREAM_ERRORS.labels("circuit_open").inc()
+        logger.warning(
+            "Gemini API circuit breaker open, failing fast",
+            extra={"retry_after_seconds": round(e.retry_after, 1)},
+        )
+        raise UpstreamAPIException(
+            status_code=503,
+            detail={
+                "type": "api_error",
+                "message": "The upstream API (Gemini) is temporarily unavailable. Please retry later.",
+            },
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        ) from e
+
+    def _raise_upstream_error(
+        self, e: google_exceptions.GoogleAPICallError, voice: str, input_text: str
+    ) -> NoReturn:
+        """
+        将 Google API 异常映射为带有 OpenAI 风格错误信息的 UpstreamAPIException。
+
+        Args:
+            e: 上游调用抛出的异常。
+            voice: 触发该异常的请求所用的语音，用于日志记录。
+            input_text: 触发该异常的输入文本，用于日志记录。
 
-        except PermissionDenied as e:
+        Raises:
+            UpstreamAPIException: 始终抛出。
+        """
+        if isinstance(e, PermissionDenied):
             # API Key 无效或权限不足
+            UPSTREAM_ERRORS.labels("authentication").inc()
             logger.error(
                 "Gemini API authentication failed",
                 extra={"error": str(e)},
@@ -155,16 +911,17 @@ class GeminiClient:
                     "message": "Upstream API authentication failed. Check server configuration.",
                 },
             ) from e
-        except InvalidArgument as e:
+        if isinstance(e, InvalidArgument):
             # 输入文本可能被内容策略阻止
+            UPSTREAM_ERRORS.labels("content_policy").inc()
             logger.warning(
                 "Gemini API rejected request due to content policy",
                 extra={
                     "error": str(e),
-                    "voice": request.voice,
-                    "input_preview": request.input[:50] + "..."
-                    if len(request.input) > 50
-                    else request.input,
+                    "voice": voice,
+                    "input_preview": input_text[:50] + "..."
+                    if len(input_text) > 50
+                    else input_text,
                 },
             )
             raise UpstreamAPIException(
@@ -174,31 +931,61 @@ class GeminiClient:
                     "message": "The input text was blocked by the upstream content safety policy.",
                 },
             ) from e
-        except (ServiceUnavailable, InternalServerError) as e:
-            # Gemini 服务暂时不可用或内部错误
+        if isinstance(e, TooManyRequests):
+            # 上游配额耗尽，且没有其他可用的 Key
+            UPSTREAM_ERRORS.labels("rate_limited").inc()
+            logger.warning(
+                "Gemini API rate limit exceeded",
+                extra={"error": str(e)},
+            )
+            raise UpstreamAPIException(
+                status_code=429,
+                detail={
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                    "message": "The upstream API (Gemini) rate limit was exceeded. Please retry later.",
+                },
+            ) from e
+        if isinstance(e, DeadlineExceeded):
+            # 在请求截止时间内上游没有返回结果
+            UPSTREAM_ERRORS.labels("deadline_exceeded").inc()
             logger.error(
-                "Gemini API service unavailable",
-                extra={"error": str(e), "error_type": type(e).__name__},
-                exc_info=True,
+                "Gemini API request timed out",
+                extra={"error": str(e)},
             )
             raise UpstreamAPIException(
-                status_code=502,
+                status_code=504,
                 detail={
                     "type": "api_error",
-                    "message": "The upstream API (Gemini) is currently unavailable.",
+                    "message": "The upstream API (Gemini) did not respond in time.",
                 },
             ) from e
-        except google_exceptions.GoogleAPICallError as e:
-            # 其他未指定的 Google API 错误
+        if isinstance(e, ServiceUnavailable | InternalServerError):
+            # Gemini 服务暂时不可用或内部错误
+            UPSTREAM_ERRORS.labels("unavailable").inc()
             logger.error(
-                "Unexpected Gemini API error",
+                "Gemini API service unavailable",
                 extra={"error": str(e), "error_type": type(e).__name__},
                 exc_info=True,
             )
             raise UpstreamAPIException(
-                status_code=500,
+                status_code=502,
                 detail={
                     "type": "api_error",
-                    "message": f"An unexpected upstream API error occurred: {e}",
+                    "message": "The upstream API (Gemini) is currently unavailable.",
                 },
             ) from e
+        # 其他未指定的 Google API 错误
+        UPSTREAM_ERRORS.labels("unexpected").inc()
+        logger.error(
+            "Unexpected Gemini API error",
+            extra={"error": str(e), "error_type": type(e).__name__},
+            exc_info=True,
+        )
+        raise UpstreamAPIException(
+            status_code=500,
+            detail={
+                "type": "api_error",
+                "message": f"An unexpected upstream API error occurred: {e}",
+            },
+        ) from e
@@ -0,0 +1,350 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.core.config import settings
+from app.models.schemas import AudioOutputOptions
+from app.services.audio_processor import SAMPLE_RATE, AudioProcessor
+from app.services.time_stretch import TimeStretcher, time_stretch
+
+
+# Normalization never raises the sample peak above this level
+PEAK_CEILING_DBFS = -1.0
+
+# BS.1770 gating: 400ms blocks overlapping by 75%, absolute and relative gates
+LOUDNESS_BLOCK = SAMPLE_RATE * 4 // 10
+LOUDNESS_HOP = LOUDNESS_BLOCK // 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# Number of 100ms sub-blocks transformed at once
+LOUDNESS_BATCH = 256
+
+# Resampling filter: Kaiser-windowed sinc, as scipy.signal.resample_poly
+RESAMPLE_HALF_ZEROS = 10
+RESAMPLE_KAISER_BETA = 5.0
+# Number of output samples computed at once
+RESAMPLE_BATCH = 4096
+
+
+def _biquad_power(
+    b: tuple[float, float, float], a: tuple[float, float, float], bins: int
+) -> np.ndarray:
+    """Returns |H|^2 of a digital biquad at the bins of an rfft of `bins` samples."""
+    z = np.exp(-1j * np.pi * np.arange(bins // 2 + 1) / (bins / 2))
+    response = (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+
+def _k_weighting_power(bins: int) -> np.ndarray:
+    """
+    Returns the power response of the BS.1770 K-weighting filter at
+    SAMPLE_RATE: a +4 dB high shelf above 1.5kHz followed by a 38Hz
+    high-pass, with the coefficients derived for this sample rate.
+    """
+    # Shelving pre-filter
+    gain = 10 ** (4.0 / 40)
+    w0 = 2 * math.pi * 1500.0 / SAMPLE_RATE
+    alpha = math.sin(w0) / (2 * (1 / math.sqrt(2)))
+    cos, root = math.cos(w0), 2 * math.sqrt(gain) * alpha
+    shelf = _biquad_power(
+        (
+            gain * ((gain + 1) + (gain - 1) * cos + root),
+            -2 * gain * ((gain - 1) + (gain + 1) * cos),
+            gain * ((gain + 1) + (gain - 1) * cos - root),
+        ),
+        (
+            (gain + 1) - (gain - 1) * cos + root,
+            2 * ((gain - 1) - (gain + 1) * cos),
+            (gain + 1) - (gain - 1) * cos - root,
+        ),
+        bins,
+    )
+    # RLB high-pass
+    w0 = 2 * math.pi * 38.0 / SAMPLE_RATE
+    alpha = math.sin(w0) / (2 * 0.5)
+    cos = math.cos(w0)
+    high_pass = _biquad_power(
+        ((1 + cos) / 2, -(1 + cos), (1 + cos) / 2),
+        (1 + alpha, -2 * cos, 1 - alpha),
+        bins,
+    )
+    return shelf * high_pass
+
+
+_K_WEIGHTING = _k_weighting_power(LOUDNESS_HOP)
+# Parseval weights of an rfft: the bins between DC and Nyquist count twice
+_K_WEIGHTING[1:-1] *= 2
+
+
+def integrated_loudness(samples: np.ndarray) -> float:
+    """
+    Measures the integrated loudness of 24kHz int16 samples, in LUFS.
+
+    An approximation of ITU-R BS.1770, not a compliant meter: the gating
+    is BS.1770's (the mean square of 400ms blocks, gated at -70 LUFS and
+    then 10 LU below the loudness of the remaining blocks), but instead of
+    running its IIR pre-filter and RLB filter over the signal, their
+    magnitude response weights the spectrum of each 100ms sub-block (four
+    make up a block), with no filter state carried across sub-blocks.
+    Steady tones and speech measure within a fraction of a LU of a
+    compliant meter; low frequencies and transients at sub-block edges
+    may differ more.
+
+    Returns:
+        The loudness, or -inf for silence.
+    """
+    count = -(-len(samples) // LOUDNESS_HOP)
+    if count == 0:
+        return -math.inf
+    energies = np.empty(count)
+    for start in range(0, count, LOUDNESS_BATCH):
+        block = samples[start * LOUDNESS_HOP : (start + LOUDNESS_BATCH) * LOUDNESS_HOP]
+        rows = -(-len(block) // LOUDNESS_HOP)
+        padded = np.zeros(rows * LOUDNESS_HOP, dtype=np.float64)
+        padded[: len(block)] = block
+        padded /= 32768
+        spectrum = np.fft.rfft(padded.reshape(rows, LOUDNESS_HOP), axis=1)
+        energies[start : start + rows] = (
+            np.abs(spectrum) ** 2 @ _K_WEIGHTING
+        ) / LOUDNESS_HOP
+    # Mean square of each 400ms block; clips shorter than that form one block
+    if count >= 4:
+        mean_squares = sliding_window_view(energies, 4).sum(axis=1) / LOUDNESS_BLOCK
+    else:
+        mean_squares = np.array([energies.sum() / len(samples)])
+
+    gated = mean_squares[mean_squares > 10 ** ((ABSOLUTE_GATE_LUFS + 0.691) / 10)]
+    if not len(gated):
+        return -math.inf
+    relative_gate = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = gated[gated > 10 ** ((relative_gate + 0.691) / 10)]
+    return -0.691 + 10 * math.log10(gated.mean())
+
+
+def rms_level(samples: np.ndarray) -> float:
+    """Returns the RMS level of int16 samples in dBFS, or -inf for silence."""
+    if not len(samples):
+        return -math.inf
+    mean_square = np.dot(samples, samples.astype(np.float64)) / len(samples)
+    if mean_square == 0:
+        return -math.inf
+    return 10 * math.log10(mean_square / 32768**2)
+
+
+def normalize_loudness(samples: np.ndarray, measure: str, target: float) -> np.ndarray:
+    """
+    Applies the gain that brings the samples to `target` loudness.
+
+    Args:
+        samples: 24kHz int16 samples.
+        measure: "lufs" for integrated loudness (see
+            `integrated_loudness`), "rms" for the RMS level in dBFS.
+        target: Target loudness, in the unit of `measure`.
+
+    Returns:
+        The normalized samples. The gain is reduced where needed to keep the
+        sample peak at PEAK_CEILING_DBFS; silence is returned unchanged.
+    """
+    level = integrated_loudness(samples) if measure == "lufs" else rms_level(samples)
+    if math.isinf(level):
+        return samples
+    gain_db = target - level
+    peak = max(int(samples.max()), -int(samples.min()))
+    if peak:
+        gain_db = min(gain_db, PEAK_CEILING_DBFS - 20 * math.log10(peak / 32768))
+    gain = np.float32(10 ** (gain_db / 20))
+    return np.clip(np.rint(samples * gain), -32768, 32767).astype("<i2")
+
+
+def trim_silence(samples: np.ndarray) -> np.ndarray:
+    """Returns a view of the samples without leading and trailing silence."""
+    start = AudioProcessor.leading_silence(samples)
+    end = len(samples) - AudioProcessor.leading_silence(samples[start:][::-1])
+    return samples[start:end]
+
+
+def _resampling_filter(up: int, down: int) -> np.ndarray:
+    """
+    Designs the polyphase low-pass filter for resampling by `up / down`.
+
+    Returns:
+        An (up, taps) array; row `p` holds the taps of phase `p`, reversed
+        so that it is applied to input windows in ascending order.
+    """
+    factor = max(up, down)
+    half_length = RESAMPLE_HALF_ZEROS * factor
+    positions = np.arange(-half_length, half_length + 1)
+    taps = np.sinc(positions / factor) * np.kaiser(len(positions), RESAMPLE_KAISER_BETA)
+    # Zero-stuffing divides the signal by `up`; each phase sums to one
+    taps *= up / taps.sum()
+    per_phase = -(-len(taps) // up)
+    padded = np.zeros(per_phase * up)
+    padded[: len(taps)] = taps
+    return padded.reshape(per_phase, up).T[:, ::-1].astype(np.float32)
+
+
+class Resampler:
+    """
+    Converts 24kHz, 16-bit, mono PCM to another sample rate.
+
+    A polyphase FIR resampler: conceptually the input is upsampled by `up`,
+    low-pass filtered and decimated by `down`, but each output sample is
+    computed directly from one phase of the filter. Output samples are
+    computed in vectorized batches. Like TimeStretcher, it can be fed PCM
+    incrementally; the output is `ceil(input_samples * up / down)` samples
+    long and is aligned with the input (the filter delay is compensated).
+    """
+
+    def __init__(self, sample_rate: int):
+        divisor = math.gcd(sample_rate, SAMPLE_RATE)
+        self.up = sample_rate // divisor
+        self.down = SAMPLE_RATE // divisor
+        self._phases = _resampling_filter(self.up, self.down)
+        self._taps = self._phases.shape[1]
+        self._delay = RESAMPLE_HALF_ZEROS * max(self.up, self.down)
+        # Input starting at absolute sample `_buffer_start`; the filter reads
+        # silence before the start
+        self._buffer = np.zeros(self._taps - 1, dtype="<i2")
+        self._buffer_start = 1 - self._taps
+        self._received = 0
+        self._produced = 0
+        self._odd_byte = b""
+
+    def process(self, pcm: bytes) -> bytes:
+        """Consumes a PCM chunk and returns the output completed by it."""
+        data = self._odd_byte + pcm if self._odd_byte else pcm
+        end = len(data) - len(data) % 2
+        self._odd_byte = bytes(data[end:])
+        samples = np.frombuffer(data, dtype="<i2", count=end // 2)
+        self._received += len(samples)
+        self._buffer = np.concatenate((self._buffer, samples))
+        available = self._buffer_start + len(self._buffer)
+        # Output n reads the input up to (n * down + delay) // up
+        ready = (available * self.up - 1 - self._delay) // self.down + 1
+        return self._run(min(ready, self._total()))
+
+    def flush(self) -> bytes:
+        """Returns the remaining output once all of the input has been processed."""
+        total = self._total()
+        last = ((total - 1) * self.down + self._delay) // self.up
+        missing = last + 1 - (self._buffer_start + len(self._buffer))
+        if missing > 0:
+            self._buffer = np.concatenate(
+                (self._buffer, np.zeros(missing, dtype="<i2"))
+            )
+        return self._run(total)
+
+    def _total(self) -> int:
+        return -(-self._received * self.up // self.down)
+
+    def _run(self, end: int) -> bytes:
+        if end <= self._produced:
+            return b""
+        chunks = []
+        windows = sliding_window_view(self._buffer, self._taps)
+        for start in range(self._produced, end, RESAMPLE_BATCH):
+            outputs = np.arange(start, min(start + RESAMPLE_BATCH, end))
+            positions = outputs * self.down + self._delay
+            first = positions // self.up - (self._taps - 1) - self._buffer_start
+            samples = np.einsum(
+                "ij,ij->i",
+                windows[first].astype(np.float32),
+                self._phases[positions % self.up],
+            )
+            chunks.append(np.clip(np.rint(samples), -32768, 32767).astype("<i2"))
+        self._produced = end
+        # Drop the input no later output can read
+        keep_from = (
+            (end * self.down + self._delay) // self.up
+            - (self._taps - 1)
+            - self._buffer_start
+        )
+        if keep_from > 0:
+            self._buffer = self._buffer[keep_from:]
+            self._buffer_start += keep_from
+        return b"".join(chunks)
+
+
+def resample(pcm: bytes, sample_rate: int) -> bytes:
+    """Returns 24kHz PCM converted to `sample_rate`."""
+    if sample_rate == SAMPLE_RATE:
+        return pcm
+    resampler = Resampler(sample_rate)
+    return resampler.process(pcm) + resampler.flush()
+
+
+def has_post_processing(request: AudioOutputOptions) -> bool:
+    """Whether the PCM of a request is modified before it is encoded."""
+    return (
+        (request.speed or 1.0) != 1.0
+        or request.trim_silence
+        or request.normalize_loudness is not None
+        or output_sample_rate(request) != SAMPLE_RATE
+    )
+
+
+def output_sample_rate(request: AudioOutputOptions) -> int:
+    return request.sample_rate or SAMPLE_RATE
+
+
+def output_quality(request: AudioOutputOptions) -> str:
+    """Returns the encoding profile of a request, or the server default."""
+    return request.quality or settings.AUDIO_QUALITY
+
+
+def post_process(pcm: bytes, request: AudioOutputOptions) -> bytes:
+    """
+    Applies the post-processing requested for a speech request to its PCM.
+
+    The steps run in order: silence trimming, time-stretching to `speed`,
+    loudness normalization and resampling to `sample_rate`.
+
+    Args:
+        pcm: The synthesized 24kHz, 16-bit, mono PCM.
+        request: The speech request.
+
+    Returns:
+        PCM at the request's output sample rate.
+    """
+    if request.trim_silence:
+        pcm = trim_silence(np.frombuffer(pcm, dtype="<i2")).tobytes()
+    pcm = time_stretch(pcm, request.speed or 1.0)
+    if request.normalize_loudness is not None:
+        samples = normalize_loudness(
+            np.frombuffer(pcm, dtype="<i2"),
+            request.normalize_loudness,
+            request.loudness_target,
+        )
+        pcm = samples.tobytes()
+    return resample(pcm, output_sample_rate(request))
+
+
+def needs_whole_clip(request: AudioOutputOptions) -> bool:
+    """Whether post-processing needs the whole clip, so it cannot be streamed."""
+    return request.trim_silence or request.normalize_loudness is not None
+
+
+class StreamingPostProcessor:
+    """
+    Applies the post-processing steps that work incrementally (speed and
+    resampling) to streamed PCM.
+    """
+
+    def __init__(self, request: AudioOutputOptions):
+        self.stages: list[TimeStretcher | Resampler] = []
+        if (request.speed or 1.0) != 1.0:
+            self.stages.append(TimeStretcher(request.speed))
+        if output_sample_rate(request) != SAMPLE_RATE:
+            self.stages.append(Resampler(output_sample_rate(request)))
+
+    def process(self, pcm: bytes) -> bytes:
+        for stage in self.stages:
+            pcm = stage.process(pcm)
+        return pcm
+
+    def flush(self) -> bytes:
+        pcm = b""
+        for stage in self.stages:
+            pcm = stage.process(pcm) + stage.flush()
+        return pcm
@@ -0,0 +1,323 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import Protocol
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import CLIENT_CHARACTERS, RATE_LIMITED_REQUESTS
+from app.core.security import ClientIdentity
+from app.services.shared_state import SharedState
+from app.utils.error_handlers import RateLimitExceededException
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class Limit:
+    """
+    一个令牌桶：容量为 `capacity`，每 `window` 秒匀速补满。
+
+    `name` 同时用作存储键和 x-ratelimit-*-{name} 响应头的后缀。
+    """
+
+    name: str
+    capacity: int
+    window: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.window
+
+
+class QuotaStore(Protocol):
+    """
+    令牌桶状态的存储后端。
+
+    `take` 必须是原子的：要么所有桶都扣减成功，要么都不扣减。
+    """
+
+    async def take(
+        self, scope: str, costs: list[tuple[Limit, int]]
+    ) -> tuple[bool, list[float]]:
+        """
+        从 `scope` 的各个桶中扣除对应的消耗。
+
+        Returns:
+            (是否全部扣减成功, 各桶在本次操作后的令牌数)。
+        """
+        ...
+
+    async def aclose(self) -> None: ...
+
+
+class MemoryQuotaStore:
+    """进程内的令牌桶存储，每个进程（副本）各自计数。"""
+
+    def __init__(self):
+        self._buckets: dict[tuple[str, str], tuple[float, float]] = {}
+
+    async def take(
+        self, scope: str, costs: list[tuple[Limit, int]]
+    ) -> tuple[bool, list[float]]:
+        now = time.monotonic()
+        levels = []
+        for limit, _ in costs:
+            tokens, updated_at = self._buckets.get(
+                (scope, limit.name), (limit.capacity, now)
+            )
+            levels.append(min(limit.capacity, tokens + (now - updated_at) * limit.rate))
+        allowed = all(
+            level >= cost for level, (_, cost) in zip(levels, costs, strict=True)
+        )
+        if allowed:
+            levels = [
+                level - cost for level, (_, cost) in zip(levels, costs, strict=True)
+            ]
+        # 被拒绝时也记录补充后的令牌数，结果与原子扣减等价
+        for level, (limit, _) in zip(levels, costs, strict=True):
+            self._buckets[(scope, limit.name)] = (level, now)
+        return allowed, levels
+
+    async def aclose(self) -> None:
+        self._buckets.clear()
+
+
+class SharedQuotaStore:
+    """保存在 SharedState 中的令牌桶，由同一主机上的所有 worker 进程共享。"""
+
+    def __init__(self, state: SharedState):
+        self.state = state
+
+    async def take(
+        self, scope: str, costs: list[tuple[Limit, int]]
+    ) -> tuple[bool, list[float]]:
+        return await self.state.take_tokens(
+            scope,
+            [(limit.name, cost, limit.capacity, limit.window) for limit, cost in costs],
+        )
+
+    async def aclose(self) -> None:
+        # SharedState 由应用 lifespan 负责关闭
+        pass
+
+
+# KEYS: 各个桶的哈希键；ARGV: 每个桶依次为 cost, capacity, window。
+# 使用 Redis 服务器时间，各副本之间的时钟偏差不影响补充速率。
+_TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local levels = {}
+local allowed = 1
+for i = 1, #KEYS do
+    local cost = tonumber(ARGV[3 * i - 2])
+    local capacity = tonumber(ARGV[3 * i - 1])
+    local window = tonumber(ARGV[3 * i])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    levels[i] = math.min(capacity, tokens + math.max(0, now - ts) * capacity / window)
+    if levels[i] < cost then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i = 1, #KEYS do
+    if allowed == 1 then
+        levels[i] = levels[i] - tonumber(ARGV[3 * i - 2])
+        redis.call('HSET', KEYS[i], 'tokens', levels[i], 'ts', now)
+        redis.call('PEXPIRE', KEYS[i], math.ceil(tonumber(ARGV[3 * i]) * 1000))
+    end
+    result[i + 1] = tostring(levels[i])
+end
+return result
+"""
+
+
+class RedisQuotaStore:
+    """
+    保存在 Redis 中的令牌桶，多个副本共享同一份配额。
+
+    扣减由一个 Lua 脚本原子完成。Redis 不可用时放行请求并记录错误，
+    避免限流后端的故障导致整个服务不可用。
+    """
+
+    def __init__(self, url: str, prefix: str = "tts:ratelimit"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "RATE_LIMIT_BACKEND=redis requires redis: install with the 'redis' extra"
+            ) from e
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_TAKE_SCRIPT)
+
+    async def take(
+        self, scope: str, costs: list[tuple[Limit, int]]
+    ) -> tuple[bool, list[float]]:
+        args = []
+        for limit, cost in costs:
+            args += [cost, limit.capacity, limit.window]
+        try:
+            result = await self._script(
+                keys=[f"{self.prefix}:{scope}:{limit.name}" for limit, _ in costs],
+                args=args,
+            )
+        except Exception as e:
+            logger.error(
+                "Rate limit store unavailable, allowing request",
+                extra={"scope": scope, "error": str(e)},
+            )
+            return True, [float(limit.capacity) for limit, _ in costs]
+        return bool(result[0]), [float(level) for level in result[1:]]
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+def create_quota_store(shared_state: SharedState | None = None) -> QuotaStore:
+    """
+    Builds the rate limit store selected by RATE_LIMIT_BACKEND.
+
+    The "memory" backend keeps counters on this host: in this process, or in
+    `shared_state` when several worker processes run.
+    """
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisQuotaStore(settings.RATE_LIMIT_REDIS_URL)
+    if shared_state is not None:
+        return SharedQuotaStore(shared_state)
+    return MemoryQuotaStore()
+
+
+def _format_reset(seconds: float) -> str:
+    """按 OpenAI 的格式表示重置时间，例如 "20ms"、"1.5s"、"6m0s"、"2h3m0s"。"""
+    if seconds < 1:
+        return f"{math.ceil(seconds * 1000)}ms"
+    if (tenths := math.ceil(seconds * 10) / 10) < 60:
+        return f"{tenths:g}s"
+    minutes, secs = divmod(math.ceil(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes}m{secs}s" if hours else f"{minutes}m{secs}s"
+
+
+class RateLimiter:
+    """
+    按客户端 API Key 限流并统计用量。
+
+    每个 Key 最多有三个令牌桶：每分钟请求数、每分钟输入字符数和每天
+    输入字符数（限额来自 ClientIdentity，0 表示不限制）。同名的 Key
+    共享同一份配额。超出任一限额时以 429 拒绝，并返回 OpenAI 风格的
+    x-ratelimit-* 响应头和 Retry-After。
+    """
+
+    def __init__(self, store: QuotaStore):
+        self.store = store
+        self.allowed = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _limits(client: ClientIdentity) -> list[Limit]:
+        limits = [
+            Limit("requests", client.rate_limit_rpm, 60.0),
+            Limit("characters", client.characters_per_minute, 60.0),
+            Limit("characters-per-day", client.characters_per_day, 86400.0),
+        ]
+        return [limit for limit in limits if limit.capacity > 0]
+
+    async def acquire(
+        self, client: ClientIdentity, characters: int, requests: int = 1
+    ) -> dict[str, str]:
+        """
+        扣除一次调用的配额，必须在调用上游之前执行。
+
+        Args:
+            client: 发起调用的客户端。
+            characters: 本次调用的输入字符数。
+            requests: 本次调用计入的请求数。
+
+        Returns:
+            要附加到响应上的 x-ratelimit-* 响应头。
+
+        Raises:
+            RateLimitExceededException: 如果超出任一限额（429）。
+        """
+        limits = self._limits(client)
+        if not limits:
+            self.allowed += 1
+            CLIENT_CHARACTERS.labels(client.name).inc(characters)
+            return {}
+
+        costs = [
+            (limit, requests if limit.name == "requests" else characters)
+            for limit in limits
+        ]
+        allowed, levels = await self.store.take(client.name, costs)
+
+        headers = {}
+        for (limit, _), level in zip(costs, levels, strict=True):
+            headers[f"x-ratelimit-limit-{limit.name}"] = str(limit.capacity)
+            headers[f"x-ratelimit-remaining-{limit.name}"] = str(max(0, int(level)))
+            headers[f"x-ratelimit-reset-{limit.name}"] = _format_reset(
+                (limit.capacity - level) / limit.rate
+            )
+
+        if allowed:
+            self.allowed += 1
+            CLIENT_CHARACTERS.labels(client.name).inc(characters)
+            return headers
+
+        self.rejected += 1
+        # 优先报告等待也无法满足的限额
+        limit, cost, level = max(
+            (
+                (limit, cost, level)
+                for (limit, cost), level in zip(costs, levels, strict=True)
+                if level < cost
+            ),
+            key=lambda exceeded: exceeded[1] > exceeded[0].capacity,
+        )
+        RATE_LIMITED_REQUESTS.labels(client.name, limit.name).inc()
+        logger.warning(
+            "Client rate limit exceeded",
+            extra={
+                "client": client.name,
+                "limit": limit.name,
+                "capacity": limit.capacity,
+                "requested": cost,
+            },
+        )
+        unit = "requests" if limit.name == "requests" else "characters"
+        period = "day" if limit.window >= 86400 else "minute"
+        message = (
+            f"Rate limit reached for {unit} per {period}: "
+            f"limit {limit.capacity}, requested {cost}."
+        )
+        if cost > limit.capacity:
+            # 单次调用就超过了桶容量，等待也无法满足
+            message += " Reduce the size of the request."
+        else:
+            retry_after = (cost - level) / limit.rate
+            headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+            message += f" Please try again in {_format_reset(retry_after)}."
+        raise RateLimitExceededException(
+            status_code=429,
+            detail={
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+                "message": message,
+            },
+            headers=headers,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.store).__name__,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+    async def aclose(self) -> None:
+        await self.store.aclose()
@@ -0,0 +1,349 @@
+import asyncio
+import random
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    GoogleAPICallError,
+    InternalServerError,
+    ServiceUnavailable,
+    TooManyRequests,
+)
+
+from app.core.logging import get_logger
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# 可以重试的上游错误：服务暂时不可用、内部错误和超时
+RETRYABLE_ERRORS = (ServiceUnavailable, InternalServerError, DeadlineExceeded)
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态时抛出，表示暂时不再向上游发送请求。"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Circuit open, retry after {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    """
+    连续失败计数熔断器。
+
+    连续 `failure_threshold` 次上游故障后熔断器打开，在 `reset_timeout`
+    秒内直接拒绝请求；之后进入半开状态，只放行一个探测请求：成功则
+    关闭熔断器，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        在发起上游调用前检查熔断器。
+
+        Raises:
+            CircuitOpenError: 如果熔断器打开，或半开状态下已有探测请求。
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        retry_after = max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+        raise CircuitOpenError(retry_after)
+
+    def record_success(self) -> None:
+        """上游调用成功（或上游健康地拒绝了请求）。"""
+        if self._state != self.CLOSED:
+            logger.info("Upstream recovered, closing circuit breaker")
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """上游调用因上游故障失败。"""
+        self._consecutive_failures += 1
+        self._probe_in_flight = False
+        if (
+            self._state == self.HALF_OPEN
+            or self._consecutive_failures >= self.failure_threshold
+        ):
+            if self._state != self.OPEN:
+                logger.warning(
+                    "Opening circuit breaker",
+                    extra={
+                        "consecutive_failures": self._consecutive_failures,
+                        "reset_timeout_seconds": self.reset_timeout,
+                    },
+                )
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def record_neutral(self) -> None:
+        """调用结果不能说明上游健康状况（例如被限流），只释放探测名额。"""
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "rejected": self.rejected,
+        }
+
+
+class RetryBudget:
+    """
+    全局重试预算：每个请求按 `ratio` 积累令牌，每次重试消耗一个令牌，
+    避免上游大面积故障时重试把流量放大数倍。
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_request(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class LatencyTracker:
+    """记录最近成功调用的耗时，用于计算对冲请求的触发阈值。"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p))
+        return ordered[index]
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    指数退避加全抖动（full jitter）：在 [0, min(max_delay, base * 2^n)] 内随机。
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class ResilientCaller:
+    """
+    为上游调用提供重试、对冲请求、熔断和整体截止时间。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        retry_budget_ratio: float,
+        hedge_enabled: bool,
+        hedge_delay: float,
+        hedge_min_samples: int,
+        circuit_breaker: CircuitBreaker,
+    ):
+        """
+        Args:
+            max_attempts: 单个请求的最大尝试次数（含第一次）。
+            base_delay: 指数退避的基础等待时间（秒）。
+            max_delay: 单次退避的最长等待时间（秒）。
+            retry_budget_ratio: 每个请求为全局重试预算积累的令牌数。
+            hedge_enabled: 是否启用对冲请求。
+            hedge_delay: 发出对冲请求前的等待时间（秒），0 表示使用最近
+                成功调用耗时的 p95。
+            hedge_min_samples: 使用 p95 作为阈值前至少需要的样本数。
+            circuit_breaker: 上游熔断器。
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = RetryBudget(retry_budget_ratio)
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.circuit_breaker = circuit_breaker
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _hedge_after(self) -> float | None:
+        if not self.hedge_enabled:
+            return None
+        if self.hedge_delay > 0:
+            return self.hedge_delay
+        if len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(0.95)
+
+    async def _hedged(self, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        先发出一个请求，若超过阈值仍未返回则再发出一个，取先成功的结果。
+        """
+        hedge_after = self._hedge_after()
+        if hedge_after is None:
+            return await func()
+
+        primary = asyncio.ensure_future(func())
+        hedge: asyncio.Future[T] | None = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done:
+                return primary.result()
+
+            self.hedges += 1
+            logger.debug(
+                "Sending hedged upstream request", extra={"after_seconds": hedge_after}
+            )
+            hedge = asyncio.ensure_future(func())
+            pending = {primary, hedge}
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    async def call(self, func: Callable[[], Awaitable[T]], deadline: float) -> T:
+        """
+        在截止时间前调用 `func()`，对可重试的上游错误进行退避重试。
+
+        Args:
+            func: 发起一次上游调用的无参协程函数。
+            deadline: 整个请求的截止时间（`time.monotonic()` 时间）。
+
+        Returns:
+            `func()` 的返回值。
+
+        Raises:
+            CircuitOpenError: 如果熔断器打开。
+            DeadlineExceeded: 如果在截止时间前没有成功。
+            GoogleAPICallError: 不可重试的上游错误，或重试次数用尽。
+        """
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.circuit_breaker.before_call()
+            remaining = deadline - time.monotonic()
+            started = time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise TimeoutError
+                async with asyncio.timeout(remaining):
+                    result = await self._hedged(func)
+            except TimeoutError:
+                self.circuit_breaker.record_failure()
+                raise DeadlineExceeded(
+                    "The upstream request did not complete before the deadline."
+                ) from None
+            except BaseException as e:
+                self.record_outcome(e)
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                if (
+                    attempt >= self.max_attempts
+                    or time.monotonic() + delay >= deadline
+                    or not self.retry_budget.try_spend()
+                ):
+                    raise
+                self.retries += 1
+                logger.warning(
+                    "Retrying upstream call after transient error",
+                    extra={
+                        "attempt": attempt,
+                        "delay_seconds": round(delay, 3),
+                        "error_type": type(e).__name__,
+                    },
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            self.latency.record(time.monotonic() - started)
+            self.record_outcome(None)
+            return result
+
+    def record_outcome(self, error: BaseException | None) -> None:
+        """
+        根据一次上游调用的结果更新熔断器。
+
+        Args:
+            error: 调用抛出的异常，成功时为 None。
+        """
+        if error is None:
+            self.circuit_breaker.record_success()
+        elif isinstance(error, RETRYABLE_ERRORS):
+            self.circuit_breaker.record_failure()
+        elif isinstance(error, GoogleAPICallError) and not isinstance(
+            error, TooManyRequests
+        ):
+            # 上游正常响应了一个客户端错误，说明上游本身是健康的
+            self.circuit_breaker.record_success()
+        else:
+            # 限流、取消等结果不能说明上游是否健康
+            self.circuit_breaker.record_neutral()
+
+    def stats(self) -> dict:
+        p95 = self.latency.percentile(0.95)
+        return {
+            "circuit_breaker": self.circuit_breaker.stats(),
+            "retries": self.retries,
+            "retry_budget_tokens": round(self.retry_budget.tokens, 2),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
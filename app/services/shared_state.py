@@ -0,0 +1,212 @@
+import asyncio
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from app.core.logging import get_logger
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+LOCK_POLL_INTERVAL = 0.05
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    scope TEXT NOT NULL,
+    name TEXT NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (scope, name)
+);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    key_id TEXT PRIMARY KEY,
+    until REAL NOT NULL
+);
+"""
+
+
+class SharedState:
+    """
+    State shared by the worker processes of one host.
+
+    Token buckets and upstream key cooldowns live in a SQLite database in
+    `directory`; point it at a tmpfs such as /dev/shm to keep it in shared
+    memory. Every operation is a short transaction, but it may wait up to
+    the busy timeout while another process holds the database, so the
+    public methods run it in a worker thread (like the disk cache tier)
+    rather than on the event loop. Cross-process locks are `flock` locks on
+    files in the same directory.
+
+    Times are wall-clock (time.time()) so that every process agrees on them.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.lock_dir = directory / "locks"
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            directory / "state.db",
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # The state is worthless after a crash, so skip fsyncs entirely
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+
+    async def take_tokens(
+        self, scope: str, buckets: list[tuple[str, int, float, float]]
+    ) -> tuple[bool, list[float]]:
+        """
+        Atomically takes tokens from several token buckets.
+
+        Args:
+            scope: Namespace of the buckets, e.g. the client name.
+            buckets: (name, cost, capacity, window) per bucket; a bucket
+                holds `capacity` tokens and refills fully in `window` seconds.
+
+        Returns:
+            Whether every bucket had enough tokens (if not, none are taken),
+            and the number of tokens left in each bucket.
+        """
+        return await asyncio.to_thread(self._take_tokens, scope, buckets)
+
+    def _take_tokens(
+        self, scope: str, buckets: list[tuple[str, int, float, float]]
+    ) -> tuple[bool, list[float]]:
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                for name, _, capacity, window in buckets:
+                    row = self._db.execute(
+                        "SELECT tokens, updated_at FROM buckets"
+                        " WHERE scope = ? AND name = ?",
+                        (scope, name),
+                    ).fetchone()
+                    tokens, updated_at = row or (capacity, now)
+                    elapsed = max(0.0, now - updated_at)
+                    levels.append(min(capacity, tokens + elapsed * capacity / window))
+                allowed = all(
+                    level >= bucket[1]
+                    for level, bucket in zip(levels, buckets, strict=True)
+                )
+                if allowed:
+                    levels = [
+                        level - bucket[1]
+                        for level, bucket in zip(levels, buckets, strict=True)
+                    ]
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                    [
+                        (scope, bucket[0], level, now)
+                        for level, bucket in zip(levels, buckets, strict=True)
+                    ],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return allowed, levels
+
+    async def peek_tokens(
+        self, scope: str, name: str, capacity: float, window: float
+    ) -> float:
+        """Returns the tokens currently in a bucket, without taking any."""
+        return await asyncio.to_thread(self._peek_tokens, scope, name, capacity, window)
+
+    def _peek_tokens(
+        self, scope: str, name: str, capacity: float, window: float
+    ) -> float:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE scope = ? AND name = ?",
+                (scope, name),
+            ).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated_at = row
+        return min(
+            capacity, tokens + max(0.0, time.time() - updated_at) * capacity / window
+        )
+
+    async def set_cooldown(self, key_id: str, until: float) -> None:
+        """Records that an upstream key should not be used before `until`."""
+        await asyncio.to_thread(self._set_cooldown, key_id, until)
+
+    def _set_cooldown(self, key_id: str, until: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO cooldowns VALUES (?, ?) ON CONFLICT (key_id)"
+                " DO UPDATE SET until = max(until, excluded.until)",
+                (key_id, until),
+            )
+
+    async def cooldowns(self) -> dict[str, float]:
+        """Returns the end of each upstream key's cooldown that is still running."""
+        return await asyncio.to_thread(self._cooldowns)
+
+    def _cooldowns(self) -> dict[str, float]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT key_id, until FROM cooldowns WHERE until > ?", (time.time(),)
+            ).fetchall()
+        return dict(rows)
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float) -> AsyncIterator[bool]:
+        """
+        Holds an exclusive lock shared by every worker process.
+
+        Waits at most `timeout` seconds; the context then runs without the
+        lock, so a stuck holder delays other workers but never blocks them.
+
+        Yields:
+            Whether the lock was acquired.
+        """
+        path = self.lock_dir / f"{name}.lock"
+        deadline = time.monotonic() + timeout
+        fd = None
+        while fd is None:
+            candidate = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(candidate, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(candidate)
+                if time.monotonic() >= deadline:
+                    logger.warning(
+                        "Timed out waiting for shared lock", extra={"lock": name}
+                    )
+                    break
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+                continue
+            # The previous holder unlinks the file before unlocking; a lock on
+            # an unlinked file would not exclude anyone, so start over.
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(candidate).st_ino:
+                os.close(candidate)
+                continue
+            fd = candidate
+
+        try:
+            yield fd is not None
+        finally:
+            if fd is not None:
+                path.unlink(missing_ok=True)
+                os.close(fd)
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
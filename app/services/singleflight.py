@@ -0,0 +1,82 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+from app.core.logging import get_logger
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """An in-flight call shared by every caller using the same key."""
+
+    def __init__(self, task: asyncio.Task[T]):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """
+    Deduplicates concurrent calls that share a key.
+
+    The first caller for a key starts the work in its own task; callers
+    arriving while it is running await the same task and receive the same
+    result or exception. A caller that is cancelled only stops waiting; the
+    shared task is cancelled only once no caller is waiting for it anymore.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call[T]] = {}
+        self._coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct keys currently being computed."""
+        return len(self._calls)
+
+    def _forget(self, key: str, call: _Call[T]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every waiter went away.
+        if not call.task.cancelled():
+            call.task.exception()
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `func()` unless a call for `key` is already in flight, in which
+        case its result is awaited instead.
+
+        Args:
+            key: Identifies calls that produce the same result.
+            func: Zero-argument coroutine function doing the actual work.
+
+        Returns:
+            The result of the (possibly shared) call.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task: self._forget(key, call))
+        else:
+            self._coalesced += 1
+            logger.debug("Coalescing request onto in-flight call", extra={"key": key})
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                logger.debug("All waiters cancelled, cancelling shared call")
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of in-flight and coalesced calls."""
+        return {"in_flight": self.in_flight, "coalesced": self._coalesced}
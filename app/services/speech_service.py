@@ -0,0 +1,383 @@
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+
+from app.core.config import settings
+from app.core.deadline import deadline_exceeded, request_deadline, timeout_at
+from app.core.logging import get_logger
+from app.models.schemas import AudioOutputOptions, DialogueRequest, SpeechRequest
+from app.services.audio_cache import (
+    AudioCache,
+    dialogue_cache_key,
+    output_variant,
+    speech_cache_key,
+)
+from app.services.audio_processor import IN_PROCESS_FORMATS, AudioProcessor
+from app.services.audio_streamer import StreamingEncoder
+from app.services.gemini_client import MAX_SPEAKERS_PER_CALL, GeminiClient
+from app.services.post_processing import (
+    StreamingPostProcessor,
+    has_post_processing,
+    needs_whole_clip,
+    output_quality,
+    output_sample_rate,
+    post_process,
+)
+from app.services.shared_state import SharedState
+from app.services.singleflight import SingleFlight
+from app.services.text_splitter import group_turns, split_text
+from app.services.transcode_executor import TranscodeExecutor
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+
+@dataclass
+class SpeechResult:
+    """Encoded audio produced for a speech request."""
+
+    audio: bytes
+    cache_key: str
+    cache_hit: bool
+
+
+class SpeechService:
+    """
+    Runs the /v1/audio/speech pipeline: cache lookup, upstream synthesis
+    and transcoding.
+
+    Concurrent cache misses for the same request share a single upstream
+    call; each caller then transcodes the shared PCM to its own format.
+    With several worker processes and a shared cache tier, this extends
+    across processes: one worker synthesizes while the others wait for the
+    result to land in the shared cache. Long inputs are split into segments
+    that are synthesized concurrently.
+
+    Upstream always synthesizes at normal speed; `speed` and the other
+    post-processing options are applied to the PCM before encoding, so one
+    synthesis serves every variant of the same text.
+
+    Dialogues go through the same pipeline; their turns are grouped into
+    multi-speaker upstream calls that are synthesized concurrently.
+    """
+
+    def __init__(
+        self,
+        gemini_client: GeminiClient,
+        transcode_executor: TranscodeExecutor,
+        audio_cache: AudioCache,
+        shared_state: SharedState | None = None,
+    ):
+        self.gemini_client = gemini_client
+        self.transcode_executor = transcode_executor
+        self.audio_cache = audio_cache
+        self.shared_state = shared_state
+        self.singleflight: SingleFlight[bytes] = SingleFlight()
+
+    async def get_pcm(self, request: SpeechRequest, cache_key: str) -> bytes:
+        """
+        Returns the raw PCM for a request, synthesizing it on a cache miss.
+        """
+        pcm, _ = await self._get_pcm(
+            cache_key, lambda: self._generate_pcm(request, cache_key)
+        )
+        return pcm
+
+    async def _get_pcm(
+        self, cache_key: str, generate: Callable[[], Awaitable[bytes]]
+    ) -> tuple[bytes, bool]:
+        """
+        Returns the cached PCM for `cache_key`, or runs `generate` once for it.
+
+        Returns:
+            The PCM, and whether it was found in the cache.
+        """
+        pcm = await self.audio_cache.get(cache_key)
+        if pcm is not None:
+            return pcm, True
+
+        pcm = await self.singleflight.do(
+            cache_key, lambda: self._synthesize_pcm(cache_key, generate)
+        )
+        return pcm, False
+
+    async def _synthesize_pcm(
+        self, cache_key: str, generate: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        if self.shared_state is None or not self.audio_cache.shared:
+            return await generate()
+
+        async with self.shared_state.lock(
+            f"pcm-{cache_key}", timeout=settings.GEMINI_REQUEST_DEADLINE_SECONDS
+        ):
+            # Another worker may have synthesized it while we waited
+            pcm = await self.audio_cache.get(cache_key)
+            if pcm is not None:
+                return pcm
+            return await generate()
+
+    async def _generate_pcm(self, request: SpeechRequest, cache_key: str) -> bytes:
+        segments = split_text(request.input, settings.CHUNK_MAX_CHARS)
+        if len(segments) > 1:
+            pcm = await self._synthesize_segments(request, segments)
+        else:
+            logger.debug("Generating audio via Gemini API")
+            raw_audio = await self.gemini_client.generate_audio(request)
+            pcm = AudioProcessor.decode_pcm(raw_audio)
+        await self.audio_cache.set(cache_key, pcm)
+        return pcm
+
+    async def _synthesize_segments(
+        self, request: SpeechRequest, segments: list[str]
+    ) -> bytes:
+        """
+        Synthesizes each segment concurrently (at most CHUNK_MAX_PARALLEL at
+        a time) and stitches the results back together in order.
+
+        Every segment goes through `generate_audio`, so instructions are
+        applied to each of them.
+        """
+        logger.info(
+            "Synthesizing long input in segments",
+            extra={
+                "input_length": len(request.input),
+                "segment_count": len(segments),
+                "max_parallel": settings.CHUNK_MAX_PARALLEL,
+            },
+        )
+        return await self._synthesize_concurrently(
+            [
+                lambda segment=segment: self.gemini_client.generate_audio(
+                    request.model_copy(update={"input": segment})
+                )
+                for segment in segments
+            ]
+        )
+
+    async def _generate_dialogue_pcm(
+        self, request: DialogueRequest, cache_key: str
+    ) -> bytes:
+        """
+        Synthesizes a dialogue in as few upstream calls as possible.
+
+        Consecutive turns are grouped so that each group has at most
+        MAX_SPEAKERS_PER_CALL speakers and CHUNK_MAX_CHARS characters; each
+        group is one multi-speaker call, and the groups are synthesized
+        concurrently and stitched together in order.
+        """
+        voices = {turn.speaker_name: turn.voice for turn in request.turns}
+        groups = group_turns(
+            [(turn.speaker_name, turn.input) for turn in request.turns],
+            MAX_SPEAKERS_PER_CALL,
+            settings.CHUNK_MAX_CHARS,
+        )
+        logger.info(
+            "Synthesizing dialogue",
+            extra={
+                "turn_count": len(request.turns),
+                "speaker_count": len(voices),
+                "group_count": len(groups),
+            },
+        )
+        pcm = await self._synthesize_concurrently(
+            [
+                lambda group=group: self.gemini_client.generate_dialogue_audio(
+                    group, voices, request.instructions
+                )
+                for group in groups
+            ]
+        )
+        await self.audio_cache.set(cache_key, pcm)
+        return pcm
+
+    async def _synthesize_concurrently(
+        self, calls: list[Callable[[], Awaitable[str | bytes]]]
+    ) -> bytes:
+        """
+        Runs upstream calls concurrently (at most CHUNK_MAX_PARALLEL at a
+        time) and stitches their audio together in order.
+
+        The first failure cancels the remaining calls.
+        """
+        semaphore = asyncio.Semaphore(settings.CHUNK_MAX_PARALLEL)
+
+        async def synthesize(call: Callable[[], Awaitable[str | bytes]]) -> bytes:
+            async with semaphore:
+                raw_audio = await call()
+            return AudioProcessor.decode_pcm(raw_audio)
+
+        tasks = [asyncio.create_task(synthesize(call)) for call in calls]
+        try:
+            pcm_segments = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if len(pcm_segments) == 1:
+            return pcm_segments[0]
+        return await self.transcode_executor.run(
+            AudioProcessor.concatenate_pcm,
+            pcm_segments,
+            settings.CHUNK_CROSSFADE_MS,
+            settings.CHUNK_TRIM_SILENCE,
+        )
+
+    async def _render(self, pcm: bytes, request: AudioOutputOptions) -> bytes:
+        """Post-processes the PCM and encodes it to the requested format."""
+        target_format = request.response_format
+        if target_format in IN_PROCESS_FORMATS and not has_post_processing(request):
+            return AudioProcessor.transcode_audio(pcm, target_format)
+        logger.debug("Transcoding audio to format: %s", target_format)
+        return await self.transcode_executor.run(
+            _post_process_and_transcode, pcm, request
+        )
+
+    async def synthesize(self, request: SpeechRequest) -> SpeechResult:
+        """
+        Produces the encoded audio for a request.
+
+        Encoded outputs are served from the cache when available; otherwise
+        the (possibly cached) PCM is post-processed and transcoded on the
+        transcode executor. pcm and wav are produced from the PCM and are
+        not cached separately.
+        """
+        cache_key = speech_cache_key(request)
+        return await self._encode(
+            request,
+            cache_key,
+            lambda: self._get_pcm(
+                cache_key, lambda: self._generate_pcm(request, cache_key)
+            ),
+        )
+
+    async def synthesize_dialogue(self, request: DialogueRequest) -> SpeechResult:
+        """Produces the encoded audio for a dialogue, like `synthesize`."""
+        cache_key = dialogue_cache_key(request)
+        return await self._encode(
+            request,
+            cache_key,
+            lambda: self._get_pcm(
+                cache_key, lambda: self._generate_dialogue_pcm(request, cache_key)
+            ),
+        )
+
+    async def _encode(
+        self,
+        request: AudioOutputOptions,
+        cache_key: str,
+        get_pcm: Callable[[], Awaitable[tuple[bytes, bool]]],
+    ) -> SpeechResult:
+        """Serves the encoded output from the cache, or renders it from `get_pcm`."""
+        target_format = request.response_format
+
+        if target_format in IN_PROCESS_FORMATS:
+            pcm, cache_hit = await get_pcm()
+            audio = await self._render(pcm, request)
+            return SpeechResult(audio=audio, cache_key=cache_key, cache_hit=cache_hit)
+
+        variant = output_variant(request)
+        audio = await self.audio_cache.get(cache_key, variant)
+        if audio is not None:
+            return SpeechResult(audio=audio, cache_key=cache_key, cache_hit=True)
+
+        pcm, _ = await get_pcm()
+        audio = await self._render(pcm, request)
+        await self.audio_cache.set(cache_key, audio, variant)
+        return SpeechResult(audio=audio, cache_key=cache_key, cache_hit=False)
+
+    async def stream(self, request: SpeechRequest) -> AsyncIterator[bytes]:
+        """
+        Starts streaming encoded audio while Gemini is still synthesizing.
+
+        The first upstream chunk is awaited before returning, so upstream
+        errors are raised here rather than in the middle of the response. A
+        stream still running at the request's deadline is cut off.
+        Already cached outputs, and outputs whose post-processing needs the
+        whole clip (silence trimming, loudness normalization), are returned
+        as a single chunk.
+        """
+        target_format = request.response_format
+        if needs_whole_clip(request):
+            cached = (await self.synthesize(request)).audio
+        elif target_format in IN_PROCESS_FORMATS:
+            cached = await self.audio_cache.get(speech_cache_key(request))
+            if cached is not None:
+                cached = await self._render(cached, request)
+        else:
+            cached = await self.audio_cache.get(
+                speech_cache_key(request), output_variant(request)
+            )
+        if cached is not None:
+
+            async def cached_chunks():
+                yield cached
+
+            return cached_chunks()
+
+        pcm_stream = self.gemini_client.generate_audio_stream(request)
+        first_chunk = await anext(pcm_stream, b"")
+        # The rest of the body is sent after the endpoint returns; it is
+        # still bound by the request's deadline
+        deadline = request_deadline.get()
+
+        async def pcm_chunks():
+            try:
+                if first_chunk:
+                    yield first_chunk
+                while True:
+                    try:
+                        async with timeout_at(deadline):
+                            chunk = await anext(pcm_stream, None)
+                    except TimeoutError:
+                        raise deadline_exceeded("upstream_stream") from None
+                    if chunk is None:
+                        break
+                    yield chunk
+            finally:
+                await pcm_stream.aclose()
+
+        chunks = pcm_chunks()
+        if has_post_processing(request):
+            chunks = self._post_process_stream(chunks, StreamingPostProcessor(request))
+        encoder = StreamingEncoder(
+            target_format,
+            output_sample_rate(request),
+            output_quality(request),
+            request.bitrate,
+        )
+        return encoder.encode(chunks)
+
+    async def _post_process_stream(
+        self, pcm_chunks: AsyncIterator[bytes], processor: StreamingPostProcessor
+    ) -> AsyncIterator[bytes]:
+        """Post-processes streamed PCM chunk by chunk, as it arrives."""
+        try:
+            async for chunk in pcm_chunks:
+                processed = await self.transcode_executor.run(processor.process, chunk)
+                if processed:
+                    yield processed
+            yield await self.transcode_executor.run(processor.flush)
+        finally:
+            await pcm_chunks.aclose()
+
+    def stats(self) -> dict:
+        """Returns runtime statistics for /health."""
+        return {
+            "gemini": self.gemini_client.stats(),
+            "transcode_executor": self.transcode_executor.stats(),
+            "audio_encoder": AudioProcessor.encoder_stats(),
+            "audio_cache": self.audio_cache.stats(),
+            "singleflight": self.singleflight.stats(),
+        }
+
+
+def _post_process_and_transcode(pcm: bytes, request: AudioOutputOptions) -> bytes:
+    return AudioProcessor.transcode_audio(
+        post_process(pcm, request),
+        request.response_format,
+        output_sample_rate(request),
+        output_quality(request),
+        request.bitrate,
+    )
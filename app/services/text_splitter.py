@@ -0,0 +1,134 @@
+import re
+
+
+# 段落分隔：一个或多个空行
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# 句末标点（中日文全角标点 + 英文标点），标点本身保留在前一句末尾
+_SENTENCE_RE = re.compile(r"(?<=[。！？；…!?;])|(?<=[.])(?=\s)")
+# 句内停顿标点，用于拆分过长的句子
+_CLAUSE_RE = re.compile(r"(?<=[，、：,:])")
+
+
+def _separator(left: str, right: str) -> str:
+    """
+    返回拼接两个片段时使用的分隔符：拉丁文字之间补一个空格，中日文不加。
+    """
+    return " " if left[-1:].isascii() and right[:1].isascii() else ""
+
+
+def _pack(pieces: list[tuple[str, str]], max_chars: int) -> list[str]:
+    """
+    将 (分隔符, 片段) 序列贪心地合并为不超过 max_chars 的段落。
+    """
+    segments: list[str] = []
+    current = ""
+    for separator, piece in pieces:
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        if current:
+            segments.append(current)
+        current = piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+def _with_separators(pieces: list[str]) -> list[tuple[str, str]]:
+    return [
+        (_separator(pieces[i - 1], piece) if i else "", piece)
+        for i, piece in enumerate(pieces)
+    ]
+
+
+def _split_long(sentence: str, max_chars: int) -> list[str]:
+    """
+    拆分单个过长的句子：先按句内停顿标点，再按空白，最后按长度硬切。
+    """
+    if len(sentence) <= max_chars:
+        return [sentence]
+
+    clauses = [c.strip() for c in _CLAUSE_RE.split(sentence) if c.strip()]
+    if len(clauses) > 1:
+        pieces = [p for c in clauses for p in _split_long(c, max_chars)]
+        return _pack(_with_separators(pieces), max_chars)
+
+    words = sentence.split()
+    if len(words) > 1:
+        pieces = [p for w in words for p in _split_long(w, max_chars)]
+        return _pack([(" ", p) for p in pieces], max_chars)
+
+    return [sentence[i : i + max_chars] for i in range(0, len(sentence), max_chars)]
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """
+    按段落和句子边界把长文本拆分为不超过 max_chars 的片段。
+
+    相邻的短句和短段落会合并到同一片段中；需要断开时，优先在段落
+    边界断开，其次是句末标点（同时支持中日文全角标点和英文
+    标点），再次是逗号等句内停顿；只有在单个词语本身超长时才按长度
+    硬切。各片段按原文顺序返回，拼接后与原文内容一致（空白除外）。
+
+    Args:
+        text: 待拆分的输入文本。
+        max_chars: 每个片段允许的最大字符数。
+
+    Returns:
+        拆分后的文本片段列表；文本足够短时只包含一个元素。
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces: list[tuple[str, str]] = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        sentences = [s.strip() for s in _SENTENCE_RE.split(paragraph) if s.strip()]
+        parts = [p for s in sentences for p in _split_long(s, max_chars)]
+        if not parts:
+            continue
+        paragraph_pieces = _with_separators(parts)
+        # 段落之间保留空行，以便模型在段落处自然停顿
+        paragraph_pieces[0] = ("\n\n", paragraph_pieces[0][1])
+        pieces.extend(paragraph_pieces)
+    return _pack(pieces, max_chars)
+
+
+def group_turns(
+    turns: list[tuple[str, str]], max_speakers: int, max_chars: int
+) -> list[list[tuple[str, str]]]:
+    """
+    把对话的 (说话人, 台词) 轮次按原顺序分组，使每组都能在一次上游调用中
+    合成：每组最多包含 max_speakers 个不同的说话人，台词总长不超过
+    max_chars。
+
+    超过 max_chars 的台词先用 split_text 拆分为同一说话人的连续多轮；
+    一轮台词不会跨组，各组拼接后与原对话顺序一致。
+
+    Args:
+        turns: 按顺序排列的 (说话人, 台词) 列表。
+        max_speakers: 每组允许的最多说话人数。
+        max_chars: 每组台词允许的最大总字符数。
+
+    Returns:
+        分组后的轮次列表。
+    """
+    groups: list[list[tuple[str, str]]] = []
+    current: list[tuple[str, str]] = []
+    speakers: set[str] = set()
+    length = 0
+    for speaker, text in turns:
+        for piece in split_text(text, max_chars):
+            too_many_speakers = (
+                speaker not in speakers and len(speakers) >= max_speakers
+            )
+            if current and (too_many_speakers or length + len(piece) > max_chars):
+                groups.append(current)
+                current, speakers, length = [], set(), 0
+            current.append((speaker, piece))
+            speakers.add(speaker)
+            length += len(piece)
+    if current:
+        groups.append(current)
+    return groups
@@ -0,0 +1,169 @@
+import numpy as np
+
+from app.services.audio_processor import SAMPLE_RATE, SAMPLE_WIDTH
+
+
+# WSOLA parameters for 24kHz speech: 30ms frames overlapped by half, and a
+# search tolerance of ±10ms, which covers one pitch period of most voices.
+FRAME_LENGTH = round(SAMPLE_RATE * 0.03)
+SYNTHESIS_HOP = FRAME_LENGTH // 2
+TOLERANCE = round(SAMPLE_RATE * 0.01)
+
+# A periodic Hann window sums to exactly 1 at 50% overlap. The first frame
+# has nothing to overlap with, so its leading half is left unattenuated.
+WINDOW = (
+    0.5 - 0.5 * np.cos(2 * np.pi * np.arange(FRAME_LENGTH) / FRAME_LENGTH)
+).astype(np.float32)
+FIRST_WINDOW = WINDOW.copy()
+FIRST_WINDOW[:SYNTHESIS_HOP] = 1.0
+
+
+class TimeStretcher:
+    """
+    Changes the tempo of 24kHz, 16-bit, mono PCM without changing its pitch.
+
+    Implements WSOLA (waveform similarity overlap-add): output frames are
+    laid out every SYNTHESIS_HOP samples while the input is read every
+    `SYNTHESIS_HOP * speed` samples. Each input frame is shifted by up to
+    TOLERANCE samples to the position that best continues the waveform of
+    the previous frame, so the overlap-add does not smear pitch periods.
+
+    The stretcher is incremental: `process` can be fed PCM as it arrives
+    and returns the output that is final so far; `flush` returns the rest.
+    The output is `round(input_samples / speed)` samples long.
+
+    The input is kept as a zero-copy int16 view of the caller's PCM; only
+    the samples of the frame being placed are converted to floating point,
+    and the output is written once, into the returned bytes.
+    """
+
+    def __init__(self, speed: float):
+        """
+        Args:
+            speed: Tempo factor; 2.0 plays twice as fast, 0.5 at half speed.
+        """
+        self.speed = speed
+        self._analysis_hop = SYNTHESIS_HOP * speed
+        # Unconsumed input, starting at absolute sample `_buffer_start`
+        self._buffer = np.zeros(0, dtype="<i2")
+        self._buffer_start = 0
+        # Overlap-add accumulator for the output from `_emitted` onwards
+        self._tail = np.zeros(FRAME_LENGTH, dtype=np.float32)
+        self._frames = 0
+        self._previous = 0
+        self._received = 0
+        self._emitted = 0
+        self._odd_byte = b""
+
+    def process(self, pcm: bytes) -> bytes:
+        """Consumes a PCM chunk and returns the stretched output completed by it."""
+        data = self._odd_byte + pcm if self._odd_byte else pcm
+        end = len(data) - len(data) % SAMPLE_WIDTH
+        self._odd_byte = bytes(data[end:])
+        samples = np.frombuffer(data, dtype="<i2", count=end // SAMPLE_WIDTH)
+        self._received += len(samples)
+        if len(self._buffer):
+            self._buffer = np.concatenate((self._buffer, samples))
+        else:
+            self._buffer = samples
+        # Never get ahead of the final length, which is known only at the end
+        return self._render(self._run(self._received / self.speed - SYNTHESIS_HOP))
+
+    def flush(self) -> bytes:
+        """Returns the remaining output once all of the input has been processed."""
+        target = round(self._received / self.speed)
+        if self._emitted >= target:
+            return b""
+        # Pad with silence so the frames overlapping the end can be completed
+        frames = -(-target // SYNTHESIS_HOP)
+        needed = (
+            round((frames - 1) * self._analysis_hop)
+            + TOLERANCE
+            + SYNTHESIS_HOP
+            + FRAME_LENGTH
+        )
+        available = self._buffer_start + len(self._buffer)
+        if needed > available:
+            self._buffer = np.concatenate(
+                (self._buffer, np.zeros(needed - available, dtype="<i2"))
+            )
+        output = self._run(target - 1)
+        # The last frame may extend past the end of the output
+        excess = self._emitted - target
+        if excess > 0:
+            output[-1] = output[-1][:-excess]
+        return self._render(output)
+
+    def _run(self, max_start: float) -> list[np.ndarray]:
+        """Renders frames while the input allows, up to output position `max_start`."""
+        output = []
+        while self._emitted <= max_start:
+            nominal = round(self._frames * self._analysis_hop)
+            if self._frames == 0:
+                low = high = natural = 0
+            else:
+                low = max(0, nominal - TOLERANCE)
+                high = nominal + TOLERANCE
+                # Where the previous frame's waveform naturally continues
+                natural = self._previous + SYNTHESIS_HOP
+            if max(high, natural) + FRAME_LENGTH > self._buffer_start + len(
+                self._buffer
+            ):
+                break
+
+            base = self._buffer_start
+            if self._frames == 0:
+                position = 0
+            else:
+                template = self._buffer[
+                    natural - base : natural - base + FRAME_LENGTH
+                ].astype(np.float32)
+                region = self._buffer[low - base : high - base + FRAME_LENGTH].astype(
+                    np.float32
+                )
+                similarity = np.correlate(region, template, mode="valid")
+                position = low + int(np.argmax(similarity))
+
+            window = FIRST_WINDOW if self._frames == 0 else WINDOW
+            self._tail += (
+                window * self._buffer[position - base : position - base + FRAME_LENGTH]
+            )
+            output.append(
+                np.clip(np.rint(self._tail[:SYNTHESIS_HOP]), -32768, 32767).astype(
+                    "<i2"
+                )
+            )
+            self._tail[:SYNTHESIS_HOP] = self._tail[SYNTHESIS_HOP:]
+            self._tail[SYNTHESIS_HOP:] = 0.0
+            self._emitted += SYNTHESIS_HOP
+            self._previous = position
+            self._frames += 1
+
+            # Drop the input no later frame can read
+            next_low = max(0, round(self._frames * self._analysis_hop) - TOLERANCE)
+            keep_from = min(next_low, position + SYNTHESIS_HOP)
+            if keep_from > base:
+                self._buffer = self._buffer[keep_from - base :]
+                self._buffer_start = keep_from
+        return output
+
+    @staticmethod
+    def _render(frames: list[np.ndarray]) -> bytes:
+        return b"".join(frames)
+
+
+def time_stretch(pcm: bytes, speed: float) -> bytes:
+    """
+    Returns `pcm` played back `speed` times faster, at the same pitch.
+
+    Args:
+        pcm: 24kHz, 16-bit, mono PCM.
+        speed: Tempo factor, as in SpeechRequest.speed.
+
+    Returns:
+        The stretched PCM; `pcm` itself when `speed` is 1.0.
+    """
+    if speed == 1.0:
+        return pcm
+    stretcher = TimeStretcher(speed)
+    return stretcher.process(pcm) + stretcher.flush()
@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from app.core.deadline import job_cancelled
+from app.core.logging import get_logger
+from app.core.metrics import (
+    TRANSCODE_IN_FLIGHT,
+    TRANSCODE_JOBS,
+    TRANSCODE_QUEUE_DEPTH,
+)
+from app.utils.error_handlers import CapacityExceededException
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class TranscodeExecutor:
+    """
+    A dedicated, bounded thread pool for CPU-bound audio transcoding.
+
+    Keeps transcoding off both the event loop and Starlette's shared
+    threadpool, so upstream (network-bound) concurrency and transcoding
+    (CPU-bound) concurrency can be sized independently.
+
+    A job whose caller stops waiting is dropped if it has not started yet;
+    a running job is told to stop through `deadline.job_cancelled`, which
+    ffmpeg encodes check while they wait for their output.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        """
+        Args:
+            max_workers: Number of worker threads running transcodes.
+            max_queue: Number of jobs allowed to wait for a free worker
+                before new submissions are rejected.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="transcode"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._cancelled = 0
+        self._rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of jobs currently running or waiting for a worker."""
+        return self._pending
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a free worker."""
+        return max(0, self._pending - self.max_workers)
+
+    def _on_done(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                self._cancelled += 1
+                outcome = "cancelled"
+            else:
+                self._completed += 1
+                outcome = "completed"
+            TRANSCODE_QUEUE_DEPTH.set(self.queue_depth)
+        TRANSCODE_IN_FLIGHT.dec()
+        TRANSCODE_JOBS.labels(outcome).inc()
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Runs `func(*args)` on the transcoding pool and awaits its result.
+
+        Raises:
+            CapacityExceededException: If the wait queue is already full.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                rejected = True
+            else:
+                self._pending += 1
+                rejected = False
+                TRANSCODE_QUEUE_DEPTH.set(self.queue_depth)
+
+        if rejected:
+            TRANSCODE_JOBS.labels("rejected").inc()
+            logger.warning(
+                "Transcode queue full, rejecting job",
+                extra={"queue_depth": self.queue_depth, "max_queue": self.max_queue},
+            )
+            raise CapacityExceededException(
+                status_code=503,
+                detail={
+                    "type": "server_error",
+                    "message": "The server is busy processing audio. Please retry shortly.",
+                },
+            )
+
+        TRANSCODE_IN_FLIGHT.inc()
+        # Run in a copy of the caller's context so the current trace span
+        # (and other context variables) carry over to the worker thread
+        context = contextvars.copy_context()
+        cancelled = threading.Event()
+        context.run(job_cancelled.set, cancelled)
+        future = self._executor.submit(context.run, func, *args)
+        future.add_done_callback(self._on_done)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Cancelling the awaited future already dropped the job if it was
+            # still queued; a running job is signalled to stop
+            cancelled.set()
+            raise
+
+    def stats(self) -> dict[str, int]:
+        """Returns a snapshot of the executor's counters."""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self._completed,
+            "cancelled": self._cancelled,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self) -> None:
+        """Stops accepting jobs and waits for running transcodes to finish."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from app.core.logging import get_logger
+from app.core.metrics import (
+    UPSTREAM_ACTIVE,
+    UPSTREAM_ADMISSIONS,
+    UPSTREAM_QUEUE_DEPTH,
+    UPSTREAM_QUEUE_WAIT,
+)
+from app.core.security import PRIORITY_BATCH, PRIORITY_INTERACTIVE, request_priority
+from app.services.resilience import LatencyTracker
+from app.utils.error_handlers import CapacityExceededException
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+# 优先级越小越先调度
+PRIORITY_RANKS = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1}
+
+
+class UpstreamScheduler:
+    """
+    上游调用的准入控制和优先级调度。
+
+    同时进行的上游调用不超过 `max_concurrency` 个；其余调用按优先级
+    （交互式请求优先于批量请求）和到达顺序排队。队列已满时立即以 429
+    拒绝，排队超过 `queue_timeout` 秒的调用同样以 429 失败，并附带
+    根据当前负载估算的 Retry-After。
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        """
+        Args:
+            max_concurrency: 同时进行的上游调用上限，0 表示不限制。
+            max_queue: 等待队列的长度上限。
+            queue_timeout: 单个调用在队列中等待的最长时间（秒）。
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._queued = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+        self._hold_seconds = 1.0
+        self.wait_times = LatencyTracker()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _retry_after(self) -> int:
+        """按平均占用时长估算排到队首所需的秒数。"""
+        slots = max(1, self.max_concurrency)
+        return max(1, math.ceil(self._hold_seconds * (self._queued + 1) / slots))
+
+    def _publish(self) -> None:
+        """更新占用名额数和排队数的 Prometheus 指标。"""
+        UPSTREAM_ACTIVE.set(self._active)
+        UPSTREAM_QUEUE_DEPTH.set(self._queued)
+
+    def _admit(self, priority: str, waited: float) -> None:
+        self.admitted += 1
+        self.wait_times.record(waited)
+        UPSTREAM_QUEUE_WAIT.labels(priority).observe(waited)
+        UPSTREAM_ADMISSIONS.labels(priority, "admitted").inc()
+        self._publish()
+
+    def _reject(self, message: str) -> CapacityExceededException:
+        return CapacityExceededException(
+            status_code=429,
+            detail={
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+                "message": message,
+            },
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    async def acquire(self) -> float:
+        """
+        获取一个上游调用名额。
+
+        Returns:
+            在队列中等待的秒数。
+
+        Raises:
+            CapacityExceededException: 如果队列已满或排队超时（429）。
+        """
+        priority = request_priority.get()
+        if self.max_concurrency <= 0 or (
+            self._active < self.max_concurrency and not self._queued
+        ):
+            self._active += 1
+            self._admit(priority, 0.0)
+            return 0.0
+
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            UPSTREAM_ADMISSIONS.labels(priority, "rejected").inc()
+            logger.warning(
+                "Upstream queue full, rejecting request",
+                extra={"queued": self._queued, "priority": priority},
+            )
+            raise self._reject(
+                "Too many requests are waiting for the upstream API. Please retry later."
+            )
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters,
+            (PRIORITY_RANKS.get(priority, 0), next(self._sequence), waiter),
+        )
+        self._queued += 1
+        self._publish()
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not waiter.done():
+            self._abandon(waiter)
+            self.timed_out += 1
+            UPSTREAM_ADMISSIONS.labels(priority, "timed_out").inc()
+            logger.warning(
+                "Timed out waiting for an upstream slot",
+                extra={
+                    "queue_timeout_seconds": self.queue_timeout,
+                    "priority": priority,
+                },
+            )
+            raise self._reject(
+                "Timed out waiting for the upstream API. Please retry later."
+            )
+
+        waited = time.monotonic() - started
+        self._admit(priority, waited)
+        logger.debug(
+            "Acquired upstream slot after queueing",
+            extra={"queue_wait_seconds": round(waited, 3), "priority": priority},
+        )
+        return waited
+
+    def _abandon(self, waiter: asyncio.Future[None]) -> None:
+        """放弃排队：若名额已经转交给该调用，则立即归还。"""
+        if waiter.done():
+            self.release()
+            return
+        waiter.cancel()
+        self._queued -= 1
+        self._publish()
+
+    def release(self, hold_seconds: float | None = None) -> None:
+        """
+        归还名额：优先转交给队列中优先级最高的调用。
+
+        Args:
+            hold_seconds: 本次占用名额的时长，用于估算 Retry-After。
+        """
+        if hold_seconds is not None:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * hold_seconds
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled():
+                continue
+            self._queued -= 1
+            waiter.set_result(None)
+            self._publish()
+            return
+        self._active -= 1
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """
+        在上下文中占用一个上游调用名额，产出排队等待的秒数。
+        """
+        waited = await self.acquire()
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        p95 = self.wait_times.percentile(0.95)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queued": self._queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queue_wait_p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from app.core.logging import get_logger
+from app.core.security import PRIORITY_BATCH, request_priority
+from app.models.schemas import (
+    AVAILABLE_MODELS,
+    VALID_RESPONSE_FORMATS,
+    VALID_VOICES,
+    SpeechRequest,
+)
+from app.services.audio_cache import PCM_VARIANT, output_variant, speech_cache_key
+from app.services.audio_processor import IN_PROCESS_FORMATS
+from app.services.speech_service import SpeechService
+
+
+# 初始化日志器
+logger = get_logger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+IDLE = "idle"
+
+
+class WarmupPhrase(BaseModel):
+    """One entry of the warmup manifest, synthesized in each of `formats`."""
+
+    model: str = AVAILABLE_MODELS[0]["id"]
+    input: str = Field(min_length=1)
+    voice: VALID_VOICES
+    instructions: str | None = None
+    speed: float = Field(default=1.0, ge=0.25, le=4.0)
+    formats: list[VALID_RESPONSE_FORMATS] = Field(
+        default_factory=lambda: ["mp3"], min_length=1
+    )
+
+    def requests(self) -> list[SpeechRequest]:
+        fields = self.model_dump(exclude={"formats"})
+        return [
+            SpeechRequest(**fields, response_format=response_format)
+            for response_format in dict.fromkeys(self.formats)
+        ]
+
+
+_MANIFEST = TypeAdapter(list[WarmupPhrase])
+
+
+class WarmupManager:
+    """
+    Synthesizes the phrases of a manifest in the background and pins the
+    results in the audio cache, so they are served without an upstream call
+    or a transcode and are never evicted.
+
+    The first pass starts with the application; the service reports ready
+    once a pass finishes with at most `max_failures` failed phrases. A pass
+    with failed phrases is run again after `retry_seconds` (or
+    `refresh_seconds`, if shorter), so an upstream outage only delays
+    readiness until the upstream recovers. With `refresh_seconds`, the
+    manifest is re-read on that schedule: new phrases are synthesized and
+    phrases that were removed are unpinned. Upstream calls run at batch
+    priority.
+    """
+
+    def __init__(
+        self,
+        speech_service: SpeechService,
+        manifest_path: Path,
+        refresh_seconds: float,
+        concurrency: int,
+        max_failures: int = 0,
+        retry_seconds: float = 60.0,
+    ):
+        """
+        Args:
+            speech_service: Pipeline used to synthesize each phrase.
+            manifest_path: JSON file with a list of phrases.
+            refresh_seconds: Interval between passes; 0 runs only at startup.
+            concurrency: Number of phrases synthesized at once.
+            max_failures: Number of failed phrases a pass may have for the
+                service to report ready.
+            retry_seconds: Delay before a pass with failed phrases is run
+                again.
+        """
+        self.speech_service = speech_service
+        self.manifest_path = manifest_path
+        self.refresh_seconds = refresh_seconds
+        self.concurrency = concurrency
+        self.max_failures = max_failures
+        self.retry_seconds = retry_seconds
+        self.state = PENDING
+        self.ready = False
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.runs = 0
+        self.last_finished_at: float | None = None
+        self._pinned: set[tuple[str, str]] = set()
+        self._task: asyncio.Task | None = None
+
+    def load_manifest(self) -> list[WarmupPhrase]:
+        """
+        Raises:
+            OSError: If the manifest cannot be read.
+            ValueError: If it is not a valid list of phrases.
+        """
+        return _MANIFEST.validate_python(json.loads(self.manifest_path.read_text()))
+
+    def start(self) -> None:
+        """Validates the manifest and starts warming up in the background."""
+        phrases = self.load_manifest()
+        self._task = asyncio.create_task(self._run_forever(phrases))
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_forever(self, phrases: list[WarmupPhrase]) -> None:
+        # Warmup never competes with interactive requests for upstream slots
+        request_priority.set(PRIORITY_BATCH)
+        while True:
+            await self._run(phrases)
+            if self.failed <= self.max_failures:
+                self.ready = True
+            if self.failed:
+                delay = self.retry_seconds
+                if self.refresh_seconds > 0:
+                    delay = min(delay, self.refresh_seconds)
+            elif self.refresh_seconds > 0:
+                delay = self.refresh_seconds
+            else:
+                return
+            await asyncio.sleep(delay)
+            if self.refresh_seconds <= 0:
+                continue
+            try:
+                phrases = await asyncio.to_thread(self.load_manifest)
+            except (OSError, ValueError) as e:
+                logger.error(
+                    "Invalid warmup manifest, keeping the previous phrases",
+                    extra={"path": str(self.manifest_path), "error": str(e)},
+                )
+
+    async def _run(self, phrases: list[WarmupPhrase]) -> None:
+        requests = [request for phrase in phrases for request in phrase.requests()]
+        self.state = RUNNING
+        self.total = len(requests)
+        self.completed = 0
+        self.failed = 0
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pinned: set[tuple[str, str]] = set()
+
+        async def warm(request: SpeechRequest) -> None:
+            async with semaphore:
+                try:
+                    pinned.update(await self._warm(request))
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(
+                        "Warmup phrase failed",
+                        extra={
+                            "voice": request.voice,
+                            "response_format": request.response_format,
+                            "input_preview": request.input[:50],
+                            "error": str(e),
+                        },
+                    )
+                else:
+                    self.completed += 1
+
+        await asyncio.gather(*(warm(request) for request in requests))
+
+        cache = self.speech_service.audio_cache
+        for key, variant in self._pinned - pinned:
+            cache.unpin(key, variant)
+        self._pinned = pinned
+        self.state = IDLE
+        self.runs += 1
+        self.last_finished_at = time.time()
+        logger.info(
+            "Warmup finished",
+            extra={
+                "completed": self.completed,
+                "failed": self.failed,
+                "pinned_entries": len(pinned),
+                "duration_seconds": round(time.perf_counter() - started, 2),
+            },
+        )
+
+    async def _warm(self, request: SpeechRequest) -> list[tuple[str, str]]:
+        """Synthesizes one request and pins its PCM and encoded output."""
+        cache = self.speech_service.audio_cache
+        cache_key = speech_cache_key(request)
+        pcm = await self.speech_service.get_pcm(request, cache_key)
+        cache.pin(cache_key, pcm)
+        entries = [(cache_key, PCM_VARIANT)]
+        # pcm and wav are produced inline from the pinned PCM
+        if request.response_format not in IN_PROCESS_FORMATS:
+            result = await self.speech_service.synthesize(request)
+            variant = output_variant(request)
+            cache.pin(cache_key, result.audio, variant)
+            entries.append((cache_key, variant))
+        return entries
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_failures": self.max_failures,
+            "runs": self.runs,
+            "pinned_entries": len(self._pinned),
+            "last_finished_at": int(self.last_finished_at)
+            if self.last_finished_at
+            else None,
+        }
@@ -4,9 +4,15 @@ from typing import Any
 class ServiceException(Exception):
     """Base class for service-related exceptions."""
 
-    def __init__(self, status_code: int, detail: dict[str, Any]):
+    def __init__(
+        self,
+        status_code: int,
+        detail: dict[str, Any],
+        headers: dict[str, str] | None = None,
+    ):
         self.status_code = status_code
         self.detail = detail
+        self.headers = headers
         super().__init__(self.detail.get("message", "Service error occurred"))
 
 
@@ -16,3 +22,35 @@ class UpstreamAPIException(ServiceException):
 
 class AudioProcessingException(ServiceException):
     """Exception for errors during audio transcoding."""
+
+
+class CapacityExceededException(ServiceException):
+    """Exception for requests rejected because a bounded queue is full."""
+
+
+class RateLimitExceededException(ServiceException):
+    """Exception for requests over the caller's rate limit or quota."""
+
+
+class NotFoundException(ServiceException):
+    """Exception for requests referring to a resource that does not exist."""
+
+
+class ConflictException(ServiceException):
+    """Exception for requests that conflict with a resource's current state."""
+
+
+class PermissionDeniedException(ServiceException):
+    """Exception for requests the caller's API key is not allowed to make."""
+
+
+class InvalidRequestException(ServiceException):
+    """Exception for well-formed requests that exceed a server-side limit."""
+
+
+class DeadlineExceededException(ServiceException):
+    """Exception for requests that did not complete within their deadline."""
+
+
+class RequestCancelledException(ServiceException):
+    """Exception for work abandoned because its caller went away."""
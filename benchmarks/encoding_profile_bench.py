@@ -0,0 +1,178 @@
+"""
+Encode-time and size benchmark of the encoding profiles.
+
+Encodes synthetic speech-like PCM with each `quality` profile of each compressed format,
+and optionally at explicit bitrates, and reports the median encode time,
+the real-time factor, the output size and the resulting bitrate. The
+"codec-default" rows use ffmpeg's own defaults, which is how audio was
+encoded before profiles existed. Results can be written as JSON to pick a
+profile per client class.
+
+Usage:
+    python benchmarks/encoding_profile_bench.py --durations 5,30 --repeat 10 \
+        --output encoding_profiles.json
+    python benchmarks/encoding_profile_bench.py --formats opus --bitrates 20,28
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# The app's settings require these; their values do not matter here
+os.environ.setdefault("API_KEYS", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import numpy as np  # noqa: E402
+from pydub import AudioSegment  # noqa: E402
+
+from app.services.audio_processor import (  # noqa: E402
+    BITRATE_FORMATS,
+    ENCODING_PROFILES,
+    FFMPEG_PCM_INPUT_ARGS,
+    SAMPLE_RATE,
+    SAMPLE_WIDTH,
+    AudioProcessor,
+)
+
+
+def speech_like(seconds: float) -> bytes:
+    """
+    Returns voice-like 24 kHz, 16-bit, mono PCM: a harmonic series with a
+    wandering pitch, a syllable-rate envelope, breath noise and pauses. A
+    pure tone would flatter every codec.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t) + 15 * np.sin(2 * np.pi * 3.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 30))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    pauses = np.sin(2 * np.pi * 0.25 * t) > -0.7
+    noise = rng.standard_normal(len(t)) * 0.05
+    samples = (voice * syllables + noise) * pauses * 3000
+    return samples.astype("<i2").tobytes()
+
+
+# Codec and muxer only, without any encoder settings
+CODEC_DEFAULT_ARGS = {
+    "mp3": ["-c:a", "libmp3lame", "-f", "mp3"],
+    "opus": ["-c:a", "libopus", "-f", "ogg"],
+    "aac": ["-c:a", "aac", "-f", "adts"],
+    "flac": ["-c:a", "flac", "-f", "flac"],
+}
+
+
+def encode_codec_default(pcm: bytes, response_format: str) -> bytes:
+    process = subprocess.run(
+        [
+            AudioSegment.converter,
+            *FFMPEG_PCM_INPUT_ARGS,
+            *CODEC_DEFAULT_ARGS[response_format],
+            "pipe:1",
+        ],
+        input=pcm,
+        capture_output=True,
+        check=True,
+    )
+    return process.stdout
+
+
+def profiles(response_format: str, bitrates: list[int]) -> list[tuple[str, object]]:
+    """Returns (name, encode function) for each profile to measure."""
+    cases = [("codec-default", lambda pcm: encode_codec_default(pcm, response_format))]
+    for quality in ENCODING_PROFILES[response_format]:
+        cases.append(
+            (
+                quality,
+                lambda pcm, quality=quality: AudioProcessor.transcode_audio(
+                    pcm, response_format, quality=quality
+                ),
+            )
+        )
+    if response_format in BITRATE_FORMATS:
+        for bitrate in bitrates:
+            cases.append(
+                (
+                    f"{bitrate}k",
+                    lambda pcm, bitrate=bitrate: AudioProcessor.transcode_audio(
+                        pcm, response_format, bitrate=bitrate
+                    ),
+                )
+            )
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--formats", default="mp3,opus,aac,flac")
+    parser.add_argument(
+        "--durations", default="5,30", help="Audio durations in seconds"
+    )
+    parser.add_argument(
+        "--bitrates", default="", help="Explicit bitrates to measure, in kbps"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    durations = [float(d) for d in args.durations.split(",") if d.strip()]
+    bitrates = [int(b) for b in args.bitrates.split(",") if b.strip()]
+
+    results = []
+    print(
+        f"{'format':<7}{'profile':<15}{'audio s':>8}{'median ms':>11}"
+        f"{'x realtime':>12}{'bytes':>10}{'kbps':>8}"
+    )
+    for response_format in formats:
+        for profile, encode in profiles(response_format, bitrates):
+            for duration in durations:
+                pcm = speech_like(duration)
+                seconds = len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH)
+                size = len(encode(pcm))
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    encode(pcm)
+                    timings.append(time.perf_counter() - started)
+                median = statistics.median(timings)
+                result = {
+                    "format": response_format,
+                    "profile": profile,
+                    "audio_seconds": duration,
+                    "repeat": args.repeat,
+                    "median_ms": round(median * 1000, 2),
+                    "realtime_factor": round(seconds / median, 1),
+                    "output_bytes": size,
+                    "kbps": round(size * 8 / seconds / 1000, 1),
+                }
+                results.append(result)
+                print(
+                    f"{response_format:<7}{profile:<15}{duration:>8g}"
+                    f"{result['median_ms']:>11}{result['realtime_factor']:>12}"
+                    f"{size:>10}{result['kbps']:>8}"
+                )
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+A local stand-in for the Gemini `generateContent` API.
+
+Returns synthetic 24 kHz, 16-bit, mono PCM (a sine tone) with configurable
+latency, error rate and payload size, so the proxy can be load-tested
+without an API key or upstream quota. Point the proxy at it with:
+
+    GEMINI_BASE_URL=http://127.0.0.1:8001 uvicorn app.main:app
+
+Usage:
+    python benchmarks/fake_gemini.py --port 8001 --latency 0.8 --jitter 0.2 \
+        --error-rate 0.01 --audio-seconds 5
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import struct
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+SAMPLE_RATE = 24000
+
+
+def synthetic_pcm(seconds: float, frequency: float = 220.0) -> bytes:
+    """Returns `seconds` of a sine tone as 24 kHz, 16-bit, mono PCM."""
+    frames = int(SAMPLE_RATE * seconds)
+    period = SAMPLE_RATE / frequency
+    cycle = [
+        int(8000 * math.sin(2 * math.pi * i / period)) for i in range(round(period))
+    ]
+    samples = (cycle * (frames // len(cycle) + 1))[:frames]
+    return struct.pack(f"<{frames}h", *samples)
+
+
+def audio_response(pcm: bytes) -> dict:
+    return {
+        "candidates": [
+            {
+                "content": {
+                    "role": "model",
+                    "parts": [
+                        {
+                            "inlineData": {
+                                "mimeType": "audio/L16;codec=pcm;rate=24000",
+                                "data": base64.b64encode(pcm).decode(),
+                            }
+                        }
+                    ],
+                },
+                "finishReason": "STOP",
+            }
+        ]
+    }
+
+
+def error_response(code: int, status: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=code,
+        content={"error": {"code": code, "message": message, "status": status}},
+    )
+
+
+def create_app(
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    throttle_rate: float,
+    audio_seconds: float,
+    stream_chunks: int,
+) -> FastAPI:
+    app = FastAPI(title="Fake Gemini API")
+    pcm = synthetic_pcm(audio_seconds)
+    stats = {"requests": 0, "errors": 0, "throttled": 0}
+
+    async def delay() -> None:
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+
+    def injected_error() -> JSONResponse | None:
+        roll = random.random()
+        if roll < error_rate:
+            stats["errors"] += 1
+            return error_response(503, "UNAVAILABLE", "The model is overloaded.")
+        if roll < error_rate + throttle_rate:
+            stats["throttled"] += 1
+            return error_response(429, "RESOURCE_EXHAUSTED", "Quota exceeded.")
+        return None
+
+    @app.post("/{api_version}/models/{model_action}")
+    async def generate(api_version: str, model_action: str, request: Request):
+        stats["requests"] += 1
+        await request.body()
+        await delay()
+        if error := injected_error():
+            return error
+
+        if model_action.endswith(":streamGenerateContent"):
+            chunk_size = -(-len(pcm) // stream_chunks) // 2 * 2
+
+            async def events():
+                for offset in range(0, len(pcm), chunk_size):
+                    chunk = audio_response(pcm[offset : offset + chunk_size])
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(latency / stream_chunks)
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return audio_response(pcm)
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="Mean response latency (s)"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.1, help="Latency standard deviation (s)"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of 503 responses"
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="Fraction of 429 responses"
+    )
+    parser.add_argument(
+        "--audio-seconds",
+        type=float,
+        default=3.0,
+        help="Duration of the returned audio, which sets the payload size",
+    )
+    parser.add_argument(
+        "--stream-chunks",
+        type=int,
+        default=5,
+        help="Number of chunks in streamed responses",
+    )
+    args = parser.parse_args()
+
+    app = create_app(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        audio_seconds=args.audio_seconds,
+        stream_chunks=args.stream_chunks,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Load test for /v1/audio/speech against the local Gemini stand-in.
+
+By default this starts `fake_gemini.py` and the proxy (uvicorn) as
+subprocesses, with the audio cache disabled, then drives
+/v1/audio/speech at a fixed concurrency for each response format. It
+reports requests per second, latency percentiles and, on Linux, the proxy's
+CPU usage and peak RSS. Results can be written as JSON to compare runs.
+
+Settings of the spawned proxy can be varied through the environment, e.g.
+`AUDIO_ENCODER_BACKEND=ffmpeg_pool python benchmarks/load_test.py`.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 16 --requests 200 \
+        --formats mp3,opus,wav --output results.json
+    python benchmarks/load_test.py --target http://localhost:8000 --api-key KEY
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+
+ROOT = Path(__file__).resolve().parent.parent
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p * len(ordered)) - 1))]
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """User + system CPU time of a process, from /proc (Linux only)."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_bytes(pid: int) -> int | None:
+    """Resident set size of a process, from /proc (Linux only)."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def wait_until_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+@contextmanager
+def spawned_stack(args: argparse.Namespace):
+    """Starts the fake Gemini server and the proxy; yields (url, proxy pid)."""
+    fake_port, proxy_port = free_port(), free_port()
+    fake = subprocess.Popen(
+        [
+            sys.executable,
+            str(ROOT / "benchmarks" / "fake_gemini.py"),
+            "--port",
+            str(fake_port),
+            "--latency",
+            str(args.fake_latency),
+            "--jitter",
+            str(args.fake_jitter),
+            "--error-rate",
+            str(args.fake_error_rate),
+            "--audio-seconds",
+            str(args.fake_audio_seconds),
+        ]
+    )
+    env = {
+        "AUDIO_CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+        **os.environ,
+        "API_KEYS": args.api_key,
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_API_KEYS": "",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{fake_port}",
+    }
+    proxy = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(proxy_port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        wait_until_ready(f"http://127.0.0.1:{fake_port}/stats")
+        wait_until_ready(f"http://127.0.0.1:{proxy_port}/health")
+        yield f"http://127.0.0.1:{proxy_port}", proxy.pid
+    finally:
+        for process in (proxy, fake):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+async def sample_rss(pid: int, peak: list[int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        if (rss := rss_bytes(pid)) is not None:
+            peak[0] = max(peak[0], rss)
+        await asyncio.sleep(0.1)
+
+
+async def run_format(
+    client: httpx.AsyncClient,
+    response_format: str,
+    args: argparse.Namespace,
+    pid: int | None,
+) -> dict:
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    output_bytes = 0
+    counter = iter(range(args.requests))
+
+    async def worker() -> None:
+        nonlocal output_bytes
+        for i in counter:
+            body = {
+                "model": "gemini-2.5-flash-preview-tts",
+                "input": f"{args.text} ({response_format} #{i})",
+                "voice": "Kore",
+                "response_format": response_format,
+            }
+            if args.stream:
+                body["stream_format"] = "audio"
+            started = time.perf_counter()
+            try:
+                response = await client.post("/v1/audio/speech", json=body)
+                status = str(response.status_code)
+                if response.status_code == 200:
+                    output_bytes += len(response.content)
+                    latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+
+    cpu_before = cpu_seconds(pid) if pid else None
+    peak = [rss_bytes(pid) or 0] if pid else [0]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(pid, peak, stop)) if pid else None
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if sampler:
+        await sampler
+    cpu_after = cpu_seconds(pid) if pid else None
+
+    def ms(value: float | None) -> float | None:
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "response_format": response_format,
+        "requests": args.requests,
+        "succeeded": len(latencies),
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(max(latencies, default=None)),
+        },
+        "output_mb": round(output_bytes / 1e6, 2),
+        "proxy_cpu_percent": round(100 * (cpu_after - cpu_before) / elapsed, 1)
+        if cpu_before is not None and cpu_after is not None
+        else None,
+        "proxy_rss_peak_mb": round(peak[0] / 1e6, 1) if peak[0] else None,
+    }
+
+
+async def run(args: argparse.Namespace, url: str, pid: int | None) -> list[dict]:
+    async with httpx.AsyncClient(
+        base_url=url,
+        headers={"Authorization": f"Bearer {args.api_key}"},
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+        # Warm up connections, the encoder and the upstream client
+        for response_format in args.formats:
+            await client.post(
+                "/v1/audio/speech",
+                json={
+                    "model": "gemini-2.5-flash-preview-tts",
+                    "input": "warm up",
+                    "voice": "Kore",
+                    "response_format": response_format,
+                },
+            )
+        return [
+            await run_format(client, response_format, args, pid)
+            for response_format in args.formats
+        ]
+
+
+def print_table(results: list[dict]) -> None:
+    header = f"{'format':<8}{'ok':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'cpu%':>8}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        lat = r["latency_ms"]
+        print(
+            f"{r['response_format']:<8}{r['succeeded']:>6}{r['rps']:>9}"
+            f"{lat['p50'] or '-':>9}{lat['p95'] or '-':>9}{lat['p99'] or '-':>9}"
+            f"{r['proxy_cpu_percent'] or '-':>8}{r['proxy_rss_peak_mb'] or '-':>9}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--target", help="URL of a running proxy (default: start one locally)"
+    )
+    parser.add_argument(
+        "--pid", type=int, help="PID of the --target proxy, to report CPU/RSS"
+    )
+    parser.add_argument("--api-key", default="benchmark")
+    parser.add_argument("--formats", default="mp3,opus,aac,flac,wav,pcm")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per format")
+    parser.add_argument("--stream", action="store_true", help="Use stream_format")
+    parser.add_argument(
+        "--text",
+        default="The quick brown fox jumps over the lazy dog.",
+        help="Input text; a counter is appended so requests are unique",
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--fake-latency", type=float, default=0.5)
+    parser.add_argument("--fake-jitter", type=float, default=0.1)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--fake-audio-seconds", type=float, default=3.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    args.formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+
+    if args.target:
+        results = asyncio.run(run(args, args.target, args.pid))
+    else:
+        with spawned_stack(args) as (url, pid):
+            results = asyncio.run(run(args, url, pid))
+
+    print_table(results)
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                key: value for key, value in vars(args).items() if key != "api_key"
+            },
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
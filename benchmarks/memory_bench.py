@@ -0,0 +1,177 @@
+"""
+Memory benchmark for the audio pipeline.
+
+Measures how much memory processing one clip takes, for several clip
+durations: the peak of Python allocations (tracemalloc) and the growth of
+the process's peak RSS. Each measurement runs in a fresh interpreter so
+that the peak RSS of one does not hide the next. Results can be written
+as JSON to compare runs, e.g. before and after a change.
+
+Modes:
+    transcode    AudioProcessor.transcode_audio, once per response format
+    concatenate  AudioProcessor.concatenate_pcm of four segments, with
+                 crossfades and silence trimming (long inputs)
+    stretch      time_stretch to speed 1.5
+
+Usage:
+    python benchmarks/memory_bench.py --durations 60,300 --output memory.json
+    python benchmarks/memory_bench.py --mode concatenate --formats pcm
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# The app's settings require these; their values do not matter here
+os.environ.setdefault("API_KEYS", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+SEGMENTS = 4
+
+
+def tone(seconds: float) -> bytes:
+    """Returns a 220 Hz tone as 24 kHz, 16-bit, mono PCM, with silent edges."""
+    import numpy as np
+
+    # Tiled from one period, so that building it does not raise the peak RSS
+    period = np.arange(round(24000 / 220))
+    cycle = (8000 * np.sin(2 * np.pi * period / len(period))).astype("<i2")
+    pcm = np.resize(cycle, int(24000 * seconds))
+    pcm[:2400] = 0
+    pcm[-2400:] = 0
+    return pcm.tobytes()
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def child(mode: str, response_format: str, duration: float) -> dict:
+    from app.services.audio_processor import AudioProcessor
+    from app.services.time_stretch import time_stretch
+
+    def run(pcm):
+        if mode == "transcode":
+            return AudioProcessor.transcode_audio(pcm, response_format)
+        if mode == "stretch":
+            return time_stretch(pcm, 1.5)
+        return AudioProcessor.concatenate_pcm(pcm, 100, True)
+
+    # One small untimed call so lazy imports and caches are warm
+    small = tone(0.5)
+    run([small] * SEGMENTS if mode == "concatenate" else small)
+
+    if mode == "concatenate":
+        pcm = [tone(duration / SEGMENTS) for _ in range(SEGMENTS)]
+    else:
+        pcm = tone(duration)
+    gc.collect()
+
+    baseline = peak_rss_bytes()
+    started = time.perf_counter()
+    output = run(pcm)
+    elapsed = time.perf_counter() - started
+    rss_growth = peak_rss_bytes() - baseline
+    output_bytes = len(output)
+    del output
+    gc.collect()
+
+    tracemalloc.start()
+    run(pcm)
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    input_bytes = sum(map(len, pcm)) if mode == "concatenate" else len(pcm)
+    return {
+        "mode": mode,
+        "response_format": response_format,
+        "audio_seconds": duration,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "seconds": round(elapsed, 3),
+        "heap_peak_bytes": heap_peak,
+        "rss_growth_bytes": rss_growth,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--mode", choices=["transcode", "concatenate", "stretch"], default="transcode"
+    )
+    parser.add_argument("--formats", default="mp3,opus,wav,pcm")
+    parser.add_argument(
+        "--durations", default="60,300", help="Audio durations in seconds"
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, response_format, duration = args.child
+        print(json.dumps(child(mode, response_format, float(duration))))
+        return
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    durations = [float(d) for d in args.durations.split(",") if d.strip()]
+    if args.mode != "transcode":
+        formats = formats[:1]
+
+    results = []
+    print(
+        f"{'format':<8}{'audio s':>9}{'input MB':>10}{'heap peak MB':>14}"
+        f"{'RSS growth MB':>15}{'x input':>9}"
+    )
+    for response_format in formats:
+        for duration in durations:
+            completed = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--child",
+                    args.mode,
+                    response_format,
+                    str(duration),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            result = json.loads(completed.stdout.splitlines()[-1])
+            results.append(result)
+            mb = 1024 * 1024
+            print(
+                f"{response_format:<8}{duration:>9g}"
+                f"{result['input_bytes'] / mb:>10.1f}"
+                f"{result['heap_peak_bytes'] / mb:>14.1f}"
+                f"{result['rss_growth_bytes'] / mb:>15.1f}"
+                f"{result['heap_peak_bytes'] / result['input_bytes']:>9.2f}"
+            )
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark of the PCM post-processing stage against its pydub equivalents.
+
+For each operation and input duration, reports the median time of the
+NumPy implementation used by the proxy and of the closest pydub
+equivalent:
+
+    resample  Resampler (polyphase FIR)      AudioSegment.set_frame_rate
+    rms       normalize_loudness("rms")      AudioSegment.apply_gain
+    lufs      normalize_loudness("lufs")     (no pydub equivalent)
+    trim      trim_silence                   detect_leading_silence, both ends
+
+Resampling also reports the level of the alias left when a 10kHz tone is
+resampled to 16kHz, whose Nyquist frequency it exceeds: an ideal
+resampler removes it entirely. Results can be written as JSON.
+
+Usage:
+    python benchmarks/post_processing_bench.py --durations 5,30 --repeat 10 \
+        --output post_processing.json
+    python benchmarks/post_processing_bench.py --sample-rate 8000
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# The app's settings require these; their values do not matter here
+os.environ.setdefault("API_KEYS", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from pydub import AudioSegment  # noqa: E402
+from pydub.silence import detect_leading_silence  # noqa: E402
+
+from app.services.audio_processor import SAMPLE_RATE  # noqa: E402
+from app.services.post_processing import (  # noqa: E402
+    normalize_loudness,
+    resample,
+    trim_silence,
+)
+
+
+def speech_like(seconds: float) -> np.ndarray:
+    """Returns noise with a syllable-rate envelope and silent edges."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    envelope = 0.1 + 0.9 * (np.sin(2 * np.pi * 4 * t) > 0)
+    samples = (rng.standard_normal(len(t)) * envelope * 3000).astype("<i2")
+    samples[: SAMPLE_RATE // 2] = 0
+    samples[-SAMPLE_RATE // 2 :] = 0
+    return samples
+
+
+def segment(samples: np.ndarray) -> AudioSegment:
+    return AudioSegment(
+        data=samples.tobytes(), sample_width=2, frame_rate=SAMPLE_RATE, channels=1
+    )
+
+
+def pydub_trim(audio: AudioSegment) -> AudioSegment:
+    start = detect_leading_silence(audio)
+    end = len(audio) - detect_leading_silence(audio.reverse())
+    return audio[start:end]
+
+
+def operations(sample_rate: int) -> dict:
+    """Maps each operation to its (NumPy, pydub) implementations."""
+    return {
+        "resample": (
+            lambda samples: resample(samples.tobytes(), sample_rate),
+            lambda audio: audio.set_frame_rate(sample_rate).raw_data,
+        ),
+        "rms": (
+            lambda samples: normalize_loudness(samples, "rms", -20.0),
+            lambda audio: audio.apply_gain(-20.0 - audio.dBFS).raw_data,
+        ),
+        "lufs": (
+            lambda samples: normalize_loudness(samples, "lufs", -16.0),
+            None,
+        ),
+        "trim": (
+            lambda samples: trim_silence(samples).tobytes(),
+            lambda audio: pydub_trim(audio).raw_data,
+        ),
+    }
+
+
+def median_ms(func, argument, repeat: int) -> float:
+    func(argument)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(argument)
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def alias_level(pcm: bytes) -> float:
+    """Returns the RMS level of 16-bit PCM in dBFS, ignoring the edges."""
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float64)[1000:-1000]
+    rms = math.sqrt(np.mean(samples * samples)) or 1e-9
+    return round(20 * math.log10(rms / 32768), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--operations", default="resample,rms,lufs,trim")
+    parser.add_argument(
+        "--durations", default="5,30", help="Audio durations in seconds"
+    )
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    names = [o.strip() for o in args.operations.split(",") if o.strip()]
+    durations = [float(d) for d in args.durations.split(",") if d.strip()]
+    implementations = operations(args.sample_rate)
+
+    results = []
+    print(
+        f"{'operation':<11}{'audio s':>9}{'numpy ms':>11}{'pydub ms':>11}{'speedup':>9}"
+    )
+    for name in names:
+        numpy_impl, pydub_impl = implementations[name]
+        for duration in durations:
+            samples = speech_like(duration)
+            numpy_ms = median_ms(numpy_impl, samples, args.repeat)
+            pydub_ms = (
+                median_ms(pydub_impl, segment(samples), args.repeat)
+                if pydub_impl
+                else None
+            )
+            speedup = round(pydub_ms / numpy_ms, 1) if pydub_ms and numpy_ms else None
+            results.append(
+                {
+                    "operation": name,
+                    "audio_seconds": duration,
+                    "repeat": args.repeat,
+                    "numpy_ms": numpy_ms,
+                    "pydub_ms": pydub_ms,
+                    "speedup": speedup,
+                }
+            )
+            print(
+                f"{name:<11}{duration:>9g}{numpy_ms:>11}{pydub_ms or '-':>11}"
+                f"{speedup or '-':>9}"
+            )
+
+    if "resample" in names:
+        t = np.arange(SAMPLE_RATE * 2) / SAMPLE_RATE
+        tone = (8000 * np.sin(2 * np.pi * 10000 * t)).astype("<i2")
+        aliases = {
+            "numpy_dbfs": alias_level(resample(tone.tobytes(), 16000)),
+            "pydub_dbfs": alias_level(segment(tone).set_frame_rate(16000).raw_data),
+        }
+        print(
+            f"10kHz tone resampled to 16kHz: {aliases['numpy_dbfs']} dBFS (numpy), "
+            f"{aliases['pydub_dbfs']} dBFS (pydub)"
+        )
+        results.append({"operation": "resample_alias", **aliases})
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Microbenchmark for the time-stretch applied to `speed`.
+
+Stretches synthetic PCM of several durations to each speed and reports the
+median and p95 time per call, plus the real-time factor (seconds of input
+audio processed per second of wall time). Results can be written as JSON
+to compare runs.
+
+Usage:
+    python benchmarks/time_stretch_bench.py --durations 1,5,30 --repeat 10 \
+        --output time_stretch.json
+    python benchmarks/time_stretch_bench.py --speeds 0.5,2 --stream
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+# The app's settings require these; their values do not matter here
+os.environ.setdefault("API_KEYS", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from fake_gemini import synthetic_pcm  # noqa: E402
+
+from app.services.audio_processor import SAMPLE_RATE, SAMPLE_WIDTH  # noqa: E402
+from app.services.time_stretch import TimeStretcher, time_stretch  # noqa: E402
+
+
+# Size of the chunks fed to the stretcher with --stream (about 100ms)
+STREAM_CHUNK_BYTES = SAMPLE_RATE // 10 * SAMPLE_WIDTH
+
+
+def stretch_streamed(pcm: bytes, speed: float) -> bytes:
+    stretcher = TimeStretcher(speed)
+    chunks = [
+        stretcher.process(pcm[offset : offset + STREAM_CHUNK_BYTES])
+        for offset in range(0, len(pcm), STREAM_CHUNK_BYTES)
+    ]
+    chunks.append(stretcher.flush())
+    return b"".join(chunks)
+
+
+def bench(pcm: bytes, speed: float, repeat: int, stream: bool) -> list[float]:
+    stretch = stretch_streamed if stream else time_stretch
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stretch(pcm, speed)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--speeds", default="0.5,0.75,1.25,1.5,2,4")
+    parser.add_argument(
+        "--durations", default="1,5,30", help="Audio durations in seconds"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Feed the PCM in 100ms chunks, as for streamed responses",
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    speeds = [float(s) for s in args.speeds.split(",") if s.strip()]
+    durations = [float(d) for d in args.durations.split(",") if d.strip()]
+
+    results = []
+    print(
+        f"{'speed':<8}{'audio s':>9}{'median ms':>12}{'p95 ms':>10}{'x realtime':>12}"
+    )
+    for speed in speeds:
+        for duration in durations:
+            pcm = synthetic_pcm(duration)
+            timings = sorted(bench(pcm, speed, args.repeat, args.stream))
+            median = statistics.median(timings)
+            p95 = timings[min(len(timings) - 1, round(0.95 * len(timings)) - 1)]
+            result = {
+                "speed": speed,
+                "audio_seconds": duration,
+                "repeat": args.repeat,
+                "median_ms": round(median * 1000, 2),
+                "p95_ms": round(p95 * 1000, 2),
+                "realtime_factor": round(duration / median, 1) if median else None,
+            }
+            results.append(result)
+            print(
+                f"{speed:<8g}{duration:>9g}{result['median_ms']:>12}"
+                f"{result['p95_ms']:>10}{result['realtime_factor']:>12}"
+            )
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Microbenchmark for AudioProcessor.transcode_audio.
+
+Encodes synthetic PCM of several durations to each response format and
+reports the median and p95 time per call, plus the real-time factor
+(seconds of audio encoded per second of wall time). Results can be written
+as JSON to compare runs, e.g. before and after a change, or between
+AUDIO_ENCODER_BACKEND settings.
+
+Usage:
+    python benchmarks/transcode_bench.py --durations 1,5,30 --repeat 10 \
+        --output transcode.json
+    python benchmarks/transcode_bench.py --backend ffmpeg_pool
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+# The app's settings require these; their values do not matter here
+os.environ.setdefault("API_KEYS", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from fake_gemini import synthetic_pcm  # noqa: E402
+
+from app.services.audio_processor import AudioProcessor  # noqa: E402
+from app.services.encoder_pool import FfmpegEncoderPool  # noqa: E402
+
+
+def bench(pcm: bytes, response_format: str, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        AudioProcessor.transcode_audio(pcm, response_format)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--formats", default="mp3,opus,aac,flac,wav,pcm")
+    parser.add_argument(
+        "--durations", default="1,5,30", help="Audio durations in seconds"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backend", choices=["pydub", "ffmpeg_pool"], default="pydub")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    durations = [float(d) for d in args.durations.split(",") if d.strip()]
+
+    if args.backend == "ffmpeg_pool":
+        AudioProcessor.encoder = FfmpegEncoderPool(
+            warm_per_format=2, max_concurrency=1, acquire_timeout=60.0
+        )
+        AudioProcessor.encoder.start()
+
+    results = []
+    print(
+        f"{'format':<8}{'audio s':>9}{'median ms':>12}{'p95 ms':>10}{'x realtime':>12}"
+    )
+    try:
+        for response_format in formats:
+            for duration in durations:
+                pcm = synthetic_pcm(duration)
+                # One untimed call so lazy imports and caches are warm
+                AudioProcessor.transcode_audio(pcm, response_format)
+                timings = sorted(bench(pcm, response_format, args.repeat))
+                median = statistics.median(timings)
+                p95 = timings[min(len(timings) - 1, round(0.95 * len(timings)) - 1)]
+                result = {
+                    "response_format": response_format,
+                    "audio_seconds": duration,
+                    "repeat": args.repeat,
+                    "median_ms": round(median * 1000, 2),
+                    "p95_ms": round(p95 * 1000, 2),
+                    "realtime_factor": round(duration / median, 1) if median else None,
+                }
+                results.append(result)
+                print(
+                    f"{response_format:<8}{duration:>9g}{result['median_ms']:>12}"
+                    f"{result['p95_ms']:>10}{result['realtime_factor']:>12}"
+                )
+    finally:
+        if AudioProcessor.encoder is not None:
+            AudioProcessor.encoder.close()
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
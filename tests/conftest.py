@@ -0,0 +1,27 @@
+import os
+
+import pytest
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+
+# Settings are read when the app is imported, and refuse to load without keys
+os.environ.setdefault("API_KEYS", "test-key")
+os.environ.setdefault("GEMINI_API_KEY", "test-gemini-key")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def span_exporter() -> InMemorySpanExporter:
+    """
+    Exports the spans of every test in memory.
+
+    Tracing adds a middleware, which is only possible before the app first
+    starts, so it is enabled before any test runs.
+    """
+    from app.core.tracing import setup_tracing
+    from app.main import app
+
+    exporter = InMemorySpanExporter()
+    setup_tracing(app, exporter=exporter)
+    return exporter
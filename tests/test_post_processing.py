@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.services.audio_processor import SAMPLE_RATE
+from app.services.post_processing import (
+    Resampler,
+    integrated_loudness,
+    normalize_loudness,
+    resample,
+    rms_level,
+    trim_silence,
+)
+from app.services.time_stretch import TimeStretcher, time_stretch
+
+
+def tone(seconds: float, frequency: float = 1000.0, dbfs: float = -20.0) -> np.ndarray:
+    """A sine at `dbfs` peak level, as 24kHz int16 samples."""
+    t = np.arange(round(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    amplitude = 32768 * 10 ** (dbfs / 20)
+    return np.rint(amplitude * np.sin(2 * math.pi * frequency * t)).astype("<i2")
+
+
+def dominant_frequency(samples: np.ndarray, sample_rate: int) -> float:
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return np.argmax(spectrum) * sample_rate / len(samples)
+
+
+def streamed(stage: TimeStretcher | Resampler, pcm: bytes, chunk: int) -> bytes:
+    """Feeds `pcm` in chunks of `chunk` bytes, odd sizes included."""
+    output = [
+        stage.process(pcm[start : start + chunk]) for start in range(0, len(pcm), chunk)
+    ]
+    return b"".join(output) + stage.flush()
+
+
+def test_sine_loudness():
+    # BS.1770: a 1kHz sine at 0 dBFS peak measures -3.01 LUFS
+    assert integrated_loudness(tone(3.0)) == pytest.approx(-23.01, abs=0.1)
+    assert integrated_loudness(tone(3.0, dbfs=-6.0)) == pytest.approx(-9.01, abs=0.1)
+
+
+def test_silence_loudness():
+    assert integrated_loudness(np.zeros(SAMPLE_RATE, dtype="<i2")) == -math.inf
+    assert integrated_loudness(np.zeros(0, dtype="<i2")) == -math.inf
+
+
+@pytest.mark.parametrize(
+    ("measure", "target"), [("lufs", -16.0), ("lufs", -30.0), ("rms", -20.0)]
+)
+def test_normalize_loudness(measure, target):
+    samples = normalize_loudness(tone(2.0, dbfs=-25.0), measure, target)
+    level = integrated_loudness(samples) if measure == "lufs" else rms_level(samples)
+    assert level == pytest.approx(target, abs=0.1)
+
+
+def test_normalize_loudness_keeps_peak_below_ceiling():
+    samples = normalize_loudness(tone(2.0, dbfs=-25.0), "lufs", 0.0)
+    assert 20 * math.log10(np.abs(samples.astype(np.int32)).max() / 32768) <= -0.99
+
+
+def test_trim_silence():
+    silence = np.zeros(SAMPLE_RATE // 4, dtype="<i2")
+    speech = tone(0.5)
+    trimmed = trim_silence(np.concatenate((silence, speech, silence)))
+    assert len(trimmed) == len(speech)
+    assert len(trim_silence(silence)) == 0
+
+
+@pytest.mark.parametrize("sample_rate", [8000, 16000, 22050, 44100, 48000])
+def test_resample(sample_rate):
+    samples = tone(1.0)
+    pcm = samples.tobytes()
+    output = np.frombuffer(resample(pcm, sample_rate), dtype="<i2")
+
+    assert len(output) == math.ceil(len(samples) * sample_rate / SAMPLE_RATE)
+    assert dominant_frequency(output, sample_rate) == pytest.approx(1000, abs=2)
+    # Compensating the filter delay keeps the level away from the edges
+    edge = sample_rate // 10
+    assert rms_level(output[edge:-edge]) == pytest.approx(rms_level(samples), abs=0.1)
+    assert streamed(Resampler(sample_rate), pcm, 1001) == output.tobytes()
+
+
+@pytest.mark.parametrize("speed", [0.5, 0.8, 1.25, 2.0, 3.0])
+def test_time_stretch(speed):
+    samples = tone(2.0, frequency=220.0)
+    pcm = samples.tobytes()
+    output = np.frombuffer(time_stretch(pcm, speed), dtype="<i2")
+
+    assert len(output) == round(len(samples) / speed)
+    # The tempo changes, not the pitch
+    assert dominant_frequency(output, SAMPLE_RATE) == pytest.approx(220, abs=3)
+    assert streamed(TimeStretcher(speed), pcm, 4097) == output.tobytes()
+
+
+def test_time_stretch_unit_speed_is_unchanged():
+    pcm = tone(0.5).tobytes()
+    assert time_stretch(pcm, 1.0) == pcm
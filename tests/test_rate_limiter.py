@@ -0,0 +1,136 @@
+import asyncio
+import math
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import security
+from app.core.security import ClientIdentity
+from app.main import app
+from app.models.schemas import ErrorResponse
+from app.services.rate_limiter import MemoryQuotaStore, RateLimiter, SharedQuotaStore
+from app.services.shared_state import SharedState
+from app.utils.error_handlers import RateLimitExceededException
+
+
+def acquire(limiter: RateLimiter, client: ClientIdentity, characters: int) -> dict:
+    return asyncio.run(limiter.acquire(client, characters))
+
+
+def rejection(
+    limiter: RateLimiter, client: ClientIdentity, characters: int
+) -> RateLimitExceededException:
+    with pytest.raises(RateLimitExceededException) as excinfo:
+        acquire(limiter, client, characters)
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.detail["code"] == "rate_limit_exceeded"
+    return excinfo.value
+
+
+def test_requests_per_minute():
+    limiter = RateLimiter(MemoryQuotaStore())
+    client = ClientIdentity(name="rpm", rate_limit_rpm=2)
+
+    assert acquire(limiter, client, 10)["x-ratelimit-remaining-requests"] == "1"
+    headers = acquire(limiter, client, 10)
+    assert headers["x-ratelimit-limit-requests"] == "2"
+    assert headers["x-ratelimit-remaining-requests"] == "0"
+
+    error = rejection(limiter, client, 10)
+    # One request comes back every 30 seconds
+    assert error.headers["Retry-After"] == "30"
+    assert error.headers["x-ratelimit-remaining-requests"] == "0"
+    assert "requests per minute" in error.detail["message"]
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_characters_per_minute():
+    limiter = RateLimiter(MemoryQuotaStore())
+    client = ClientIdentity(name="cpm", characters_per_minute=100)
+
+    headers = acquire(limiter, client, 60)
+    assert headers["x-ratelimit-limit-characters"] == "100"
+    assert headers["x-ratelimit-remaining-characters"] == "40"
+
+    error = rejection(limiter, client, 50)
+    # 10 missing characters, refilled at 100 per minute
+    assert error.headers["Retry-After"] == "6"
+    assert "characters per minute" in error.detail["message"]
+    # A rejected call is not charged
+    assert acquire(limiter, client, 40)["x-ratelimit-remaining-characters"] == "0"
+
+
+def test_characters_per_day():
+    limiter = RateLimiter(MemoryQuotaStore())
+    client = ClientIdentity(
+        name="cpd", characters_per_minute=10_000, characters_per_day=1000
+    )
+
+    acquire(limiter, client, 1000)
+    error = rejection(limiter, client, 100)
+    assert "characters per day" in error.detail["message"]
+    assert int(error.headers["Retry-After"]) == math.ceil(100 / (1000 / 86400))
+
+
+def test_call_larger_than_limit_is_not_retryable():
+    limiter = RateLimiter(MemoryQuotaStore())
+    client = ClientIdentity(name="small", characters_per_minute=10)
+
+    error = rejection(limiter, client, 11)
+    assert "Retry-After" not in error.headers
+    assert "Reduce the size of the request" in error.detail["message"]
+
+
+def test_unlimited_client_gets_no_headers():
+    limiter = RateLimiter(MemoryQuotaStore())
+    assert acquire(limiter, ClientIdentity(name="free"), 10_000) == {}
+
+
+@pytest.fixture(params=["memory", "shared_state"])
+def replicas(request, tmp_path) -> list[RateLimiter]:
+    """Two limiters, as in two replicas, backed by one quota store."""
+    if request.param == "memory":
+        store = MemoryQuotaStore()
+        yield [RateLimiter(store), RateLimiter(store)]
+        return
+    # Separate connections to one database, as in separate worker processes
+    states = [SharedState(tmp_path), SharedState(tmp_path)]
+    yield [RateLimiter(SharedQuotaStore(state)) for state in states]
+    for state in states:
+        state.close()
+
+
+def test_replicas_enforce_one_budget(replicas):
+    first, second = replicas
+    client = ClientIdentity(name="shared", rate_limit_rpm=3)
+
+    acquire(first, client, 1)
+    acquire(second, client, 1)
+    assert acquire(first, client, 1)["x-ratelimit-remaining-requests"] == "0"
+    rejection(second, client, 1)
+
+
+def test_rate_limited_response(monkeypatch):
+    client = ClientIdentity(name="limited", characters_per_minute=10)
+    monkeypatch.setattr(security.api_key_registry, "lookup", lambda key: client)
+
+    with TestClient(app) as http:
+        acquire(app.state.rate_limiter, client, 10)
+        response = http.post(
+            "/v1/audio/speech",
+            json={
+                "model": "gemini-2.5-flash-preview-tts",
+                "input": "hello",
+                "voice": "Zephyr",
+            },
+            headers={"Authorization": "Bearer test-key"},
+        )
+
+    assert response.status_code == 429
+    error = ErrorResponse.model_validate(response.json()).error
+    assert error.type == "requests"
+    assert error.code == "rate_limit_exceeded"
+    assert response.headers["Retry-After"] == "30"
+    assert response.headers["x-ratelimit-limit-characters"] == "10"
+    assert response.headers["x-ratelimit-remaining-characters"] == "0"
+    assert response.headers["x-ratelimit-reset-characters"]
@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+TRACEPARENT = f"00-{TRACE_ID}-b7ad6b7169203331-01"
+
+
+async def fake_generate_content(*, model, contents, config):
+    # Half a second of silence, as 24 kHz 16-bit PCM
+    await asyncio.sleep(0)
+    part = SimpleNamespace(
+        inline_data=SimpleNamespace(
+            data=b"\x00\x00" * 12000, mime_type="audio/L16;codec=pcm;rate=24000"
+        )
+    )
+    return SimpleNamespace(
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))]
+    )
+
+
+@pytest.fixture
+def client(span_exporter, monkeypatch):
+    with TestClient(app) as client:
+        for key in app.state.gemini_client.key_pool.keys:
+            monkeypatch.setattr(
+                key.client.aio.models, "generate_content", fake_generate_content
+            )
+        span_exporter.clear()
+        yield client
+
+
+def test_speech_request_spans_share_incoming_trace(client, span_exporter):
+    response = client.post(
+        "/v1/audio/speech",
+        json={
+            "model": "gemini-2.5-flash-preview-tts",
+            "input": "Tracing test",
+            "voice": "Zephyr",
+            "response_format": "wav",
+        },
+        headers={"Authorization": "Bearer test-key", "traceparent": TRACEPARENT},
+    )
+    assert response.status_code == 200
+
+    spans = {span.name: span for span in span_exporter.get_finished_spans()}
+    for name in (
+        "POST /v1/audio/speech",
+        "verify_api_key",
+        "gemini.construct_prompt",
+        "gemini.generate_content",
+        "audio.transcode",
+    ):
+        assert name in spans, name
+        assert format(spans[name].context.trace_id, "032x") == TRACE_ID
+
+    server = spans["POST /v1/audio/speech"]
+    assert format(server.parent.span_id, "016x") == TRACEPARENT.split("-")[2]
+    for name in ("verify_api_key", "gemini.generate_content", "audio.transcode"):
+        assert spans[name].parent.span_id == server.context.span_id
+
+    generate = spans["gemini.generate_content"].attributes
+    assert generate["model"] == "gemini-2.5-flash-preview-tts"
+    assert generate["voice"] == "Zephyr"
+    assert generate["prompt_length"] == len("Tracing test")
+    assert spans["audio.transcode"].attributes["format"] == "wav"